@@ -7,9 +7,12 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 
+from src.core.config import DATABASE_URL
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -23,8 +26,15 @@ if config.config_file_name is not None:
 from src.database.database import Base
 from src.auth.models import User, user_private_chats, user_public_chats
 from src.chats.models import PublicChat, PrivateChat, Message, Conversation
+from src.chats import search
+from src.jobs.models import Job
 target_metadata = [Base.metadata]
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Таблицы и колонки поиска создаются миграцией, а не моделями
+    return not (reflected and (type_, name) in search.SCHEMA_OBJECTS)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -49,6 +59,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -56,7 +67,11 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
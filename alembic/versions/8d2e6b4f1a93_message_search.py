@@ -0,0 +1,68 @@
+"""Message full-text search
+
+Revision ID: 8d2e6b4f1a93
+Revises: 3f1c2a9d8e47
+Create Date: 2026-10-18 15:42:07.912345
+
+"""
+from alembic import op
+
+from src.chats import search
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e6b4f1a93'
+down_revision = '3f1c2a9d8e47'
+branch_labels = None
+depends_on = None
+
+# Индекс по rowid в том виде, в каком его создавала эта ревизия; seq
+# вместо rowid переводит a1c7e5d93b20
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE {search.FTS_TABLE} USING fts5("
+    "content, conversation_id, content='messages', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {search.FTS_TABLE}_ai AFTER INSERT ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}(rowid, content, conversation_id) "
+    "VALUES (new.rowid, new.content, new.conversation_id); "
+    "END",
+    f"CREATE TRIGGER {search.FTS_TABLE}_ad AFTER DELETE ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}, rowid, content, "
+    "conversation_id) "
+    "VALUES ('delete', old.rowid, old.content, old.conversation_id); "
+    "END",
+    f"CREATE TRIGGER {search.FTS_TABLE}_au AFTER UPDATE ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}, rowid, content, "
+    "conversation_id) "
+    "VALUES ('delete', old.rowid, old.content, old.conversation_id); "
+    f"INSERT INTO {search.FTS_TABLE}(rowid, content, conversation_id) "
+    "VALUES (new.rowid, new.content, new.conversation_id); "
+    "END",
+)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        # Уже записанные сообщения; на большой базе быстрее
+        # отдельной командой: python -m src.chats.search backfill
+        op.execute(
+            f"INSERT INTO {search.FTS_TABLE}(rowid, content, conversation_id) "
+            "SELECT rowid, content, conversation_id FROM messages"
+        )
+    elif dialect == "postgresql":
+        for statement in search.POSTGRESQL_DDL:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for suffix in ("au", "ad", "ai"):
+            op.execute(f"DROP TRIGGER IF EXISTS {search.FTS_TABLE}_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {search.FTS_TABLE}")
+    elif dialect == "postgresql":
+        op.drop_index(f"ix_messages_{search.TS_COLUMN}", table_name="messages")
+        op.drop_column("messages", search.TS_COLUMN)
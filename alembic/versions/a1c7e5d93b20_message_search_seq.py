@@ -0,0 +1,83 @@
+"""Message search keyed by seq instead of rowid, messages by time
+
+Revision ID: a1c7e5d93b20
+Revises: f62dd4d2d075
+Create Date: 2026-10-18 19:10:42.318604
+
+"""
+from alembic import op
+
+from src.chats import search
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e5d93b20'
+down_revision = 'f62dd4d2d075'
+branch_labels = None
+depends_on = None
+
+SEQ_INDEX = f"ix_messages_{search.SEQ_COLUMN}"
+# Индекс по rowid, как его создает 8d2e6b4f1a93
+ROWID_DDL = (
+    f"CREATE VIRTUAL TABLE {search.FTS_TABLE} USING fts5("
+    "content, conversation_id, content='messages', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {search.FTS_TABLE}_ai AFTER INSERT ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}(rowid, content, conversation_id) "
+    "VALUES (new.rowid, new.content, new.conversation_id); "
+    "END",
+    f"CREATE TRIGGER {search.FTS_TABLE}_ad AFTER DELETE ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}, rowid, content, "
+    "conversation_id) "
+    "VALUES ('delete', old.rowid, old.content, old.conversation_id); "
+    "END",
+    f"CREATE TRIGGER {search.FTS_TABLE}_au AFTER UPDATE ON messages BEGIN "
+    f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}, rowid, content, "
+    "conversation_id) "
+    "VALUES ('delete', old.rowid, old.content, old.conversation_id); "
+    f"INSERT INTO {search.FTS_TABLE}(rowid, content, conversation_id) "
+    "VALUES (new.rowid, new.content, new.conversation_id); "
+    "END",
+)
+
+
+def _drop_fts() -> None:
+    for suffix in ("au", "ad", "ai"):
+        op.execute(f"DROP TRIGGER IF EXISTS {search.FTS_TABLE}_{suffix}")
+    op.execute(f"DROP TABLE IF EXISTS {search.FTS_TABLE}")
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_messages_timestamp_id', 'messages', ['timestamp', 'id'],
+        unique=False,
+    )
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    _drop_fts()
+    op.execute(search.SQLITE_SEQ_DDL[0])
+    # Существующие rowid уникальны, новые seq продолжат их
+    op.execute(f"UPDATE messages SET {search.SEQ_COLUMN} = rowid")
+    for statement in search.SQLITE_SEQ_DDL[1:] + search.SQLITE_FTS_DDL:
+        op.execute(statement)
+    # Индекс читается из messages по seq; на большой базе быстрее
+    # отдельной командой: python -m src.chats.search backfill
+    op.execute(
+        f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) "
+        "VALUES ('rebuild')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_timestamp_id', table_name='messages')
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    _drop_fts()
+    op.execute(f"DROP INDEX IF EXISTS {SEQ_INDEX}")
+    op.execute(f"ALTER TABLE messages DROP COLUMN {search.SEQ_COLUMN}")
+    for statement in ROWID_DDL:
+        op.execute(statement)
+    op.execute(
+        f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) "
+        "VALUES ('rebuild')"
+    )
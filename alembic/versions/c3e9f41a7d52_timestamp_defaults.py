@@ -0,0 +1,49 @@
+"""Timestamp defaults as CURRENT_TIMESTAMP
+
+Revision ID: c3e9f41a7d52
+Revises: a1c7e5d93b20
+Create Date: 2026-10-18 19:20:05.417932
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from src.chats import search
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e9f41a7d52'
+down_revision = 'a1c7e5d93b20'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('users', 'created_at'),
+    ('users', 'updated_at'),
+    ('messages', 'timestamp'),
+)
+
+
+def _set_defaults(default: str) -> None:
+    # SQLite меняет default только пересозданием таблицы; вместе с
+    # messages удаляются триггеры поиска, индекс FTS по seq остается
+    for table_name in ('users', 'messages'):
+        with op.batch_alter_table(table_name) as batch_op:
+            for name, column_name in COLUMNS:
+                if name == table_name:
+                    batch_op.alter_column(
+                        column_name, existing_type=sa.DateTime(),
+                        existing_nullable=False,
+                        server_default=sa.text(default),
+                    )
+    if op.get_bind().dialect.name == "sqlite":
+        for statement in search.SQLITE_FTS_DDL[1:]:
+            op.execute(statement)
+
+
+def upgrade() -> None:
+    _set_defaults('(CURRENT_TIMESTAMP)')
+
+
+def downgrade() -> None:
+    _set_defaults("(datetime('now'))")
@@ -0,0 +1,201 @@
+"""Масштабирование рассылки socket.io по воркерам.
+
+Запуск: python -m benchmarks.fanout --workers 1 2 4 --clients 50 --messages 200
+
+Для каждого числа воркеров поднимает брокер src.socket_server.broker,
+процессы-серверы socket.io с UnixSocketPubSubManager и по процессу клиентов
+на каждый сервер (--clients клиентов на воркер, все в одной комнате).
+Один отправитель шлет --messages сообщений через первый воркер, замеряется
+число доставок в секунду по всем клиентам. При линейном масштабировании
+доставки в секунду растут пропорционально числу воркеров, пока хватает ядер.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import socketio
+import uvicorn
+
+from src.socket_server.pubsub import create_client_manager
+
+ROOM = "bench"
+BASE_PORT = 18100
+
+
+def serve(port: int, queue: str) -> None:
+    sio = socketio.AsyncServer(
+        async_mode='asgi', client_manager=create_client_manager(queue)
+    )
+
+    @sio.event
+    async def connect(sid, environ, auth):
+        if not (auth or {}).get("publisher"):
+            await sio.enter_room(sid, ROOM)
+
+    @sio.event
+    async def broadcast(sid, data):
+        await sio.emit('receive_message', data, room=ROOM)
+
+    @sio.event
+    async def ping(sid):
+        return True
+
+    uvicorn.run(socketio.ASGIApp(sio), port=port, log_level="warning")
+
+
+async def run_clients(port: int, count: int, messages: int, timeout: float):
+    stats = {"received": 0, "first": None, "last": None}
+    done = asyncio.Event()
+    expected = count * messages
+
+    def on_message(data):
+        now = time.time()
+        stats["first"] = stats["first"] or now
+        stats["last"] = now
+        stats["received"] += 1
+        if stats["received"] >= expected:
+            done.set()
+
+    clients = []
+    for _ in range(count):
+        client = socketio.AsyncClient()
+        client.on("receive_message", on_message)
+        await client.connect(f"http://127.0.0.1:{port}/", auth={})
+        clients.append(client)
+
+    print("READY", flush=True)
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    print(json.dumps(stats), flush=True)
+    for client in clients:
+        await client.disconnect()
+
+
+async def _wait_port(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def _spawn(*args) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fanout", *map(str, args)],
+        stdout=subprocess.PIPE, text=True,
+    )
+
+
+async def measure(workers: int, clients: int, messages: int) -> dict:
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "broker.sock")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "src.socket_server.broker", path]
+        ))
+        try:
+            while not os.path.exists(path):
+                await asyncio.sleep(0.05)
+
+            ports = [BASE_PORT + i for i in range(workers)]
+            for port in ports:
+                processes.append(_spawn("serve", port, f"unix://{path}"))
+            for port in ports:
+                await _wait_port(port)
+
+            client_processes = [
+                _spawn("clients", port, clients, messages) for port in ports
+            ]
+            processes.extend(client_processes)
+            for process in client_processes:
+                await asyncio.to_thread(process.stdout.readline)
+
+            publisher = socketio.AsyncClient()
+            await publisher.connect(
+                f"http://127.0.0.1:{ports[0]}/", auth={"publisher": True}
+            )
+            started = time.time()
+            for i in range(messages):
+                await publisher.emit("broadcast", {"message": i})
+            # Ответ на ping приходит после приема всех отправленных событий
+            await publisher.call("ping")
+            await publisher.disconnect()
+
+            results = [
+                json.loads(await asyncio.to_thread(process.stdout.readline))
+                for process in client_processes
+            ]
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    received = sum(result["received"] for result in results)
+    finished = max(result["last"] or started for result in results)
+    elapsed = max(finished - started, 1e-9)
+    return {
+        "workers": workers,
+        "clients": clients * workers,
+        "messages": messages,
+        "deliveries": received,
+        "expected": messages * clients * workers,
+        "seconds": round(elapsed, 3),
+        "deliveries_per_sec": round(received / elapsed),
+    }
+
+
+async def orchestrate(args) -> list[dict]:
+    results = []
+    for workers in args.workers:
+        result = await measure(workers, args.clients, args.messages)
+        results.append(result)
+        print(
+            f"workers={result['workers']:<3} clients={result['clients']:<5} "
+            f"deliveries={result['deliveries']}/{result['expected']} "
+            f"time={result['seconds']}s "
+            f"rate={result['deliveries_per_sec']}/s"
+        )
+    base = results[0]["deliveries_per_sec"] / results[0]["workers"]
+    for result in results:
+        if not base:
+            break
+        speedup = result["deliveries_per_sec"] / (base * result["workers"])
+        print(f"workers={result['workers']}: {speedup:.0%} of linear")
+    return results
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        return serve(int(sys.argv[2]), sys.argv[3])
+    if len(sys.argv) > 1 and sys.argv[1] == "clients":
+        port, count, messages = map(int, sys.argv[2:5])
+        return asyncio.run(run_clients(port, count, messages, timeout=60))
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(orchestrate(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
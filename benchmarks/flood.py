@@ -0,0 +1,210 @@
+"""Отзывчивость сервера, пока один клиент засыпает его событиями.
+
+Запуск: python -m benchmarks.flood --rate 2000 --duration 10
+
+Поднимает main:app в этом процессе, как benchmarks.load. Отдельный процесс
+шлет send_message и message_history с частотой --rate, не дожидаясь ответов,
+в комнату, где сидит еще и клиент, который не читает сокет. Тем временем
+пробный пользователь в своей комнате раз в --probe-interval отправляет
+сообщение с ack и запрашивает GET /conversations. Замеряется задержка
+пробных запросов p50/p99, сколько событий флуда принято и отклонено
+и сколько пакетов пропущено медленному клиенту.
+
+Прогон делается дважды, с SOCKET_RATE_LIMITS_ENABLED=1 и =0, каждый
+в своем процессе, так как настройки читаются при импорте.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+MODES = {"limited": "1", "unlimited": "0"}
+
+
+def flood(base_url: str, token: str, room: str, rate: float,
+          duration: float, results) -> None:
+    """Процесс флуда: события без ожидания, ответы только считаются"""
+    import socketio
+
+    counts = {"sent": 0, "saved": 0, "rate_limited": 0, "history": 0}
+
+    def on_ack(data=None):
+        if not isinstance(data, dict):
+            return
+        if data.get("error") == "rate_limited":
+            counts["rate_limited"] += 1
+        elif data.get("saved"):
+            counts["saved"] += 1
+        elif "count" in data:
+            counts["history"] += 1
+
+    async def run():
+        sio = socketio.AsyncClient(reconnection=False)
+        await sio.connect(
+            base_url, auth={"token": token},
+            socketio_path="/ws/socket.io/", transports=["websocket"],
+        )
+        await sio.call("enter_room", room)
+        interval = 1 / rate
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            if counts["sent"] % 10:
+                await sio.emit("send_message", {
+                    "room": room, "message": os.urandom(256).hex(),
+                }, callback=on_ack)
+            else:
+                await sio.emit("message_history", room, callback=on_ack)
+            counts["sent"] += 1
+            # Догоняем расписание, если отстали
+            delay = started + counts["sent"] * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await asyncio.sleep(1)
+        await sio.disconnect()
+
+    asyncio.run(run())
+    results.put(counts)
+
+
+async def stalled_reader(base_url: str, token: str, room: str):
+    """Клиент входит в комнату и перестает читать сокет"""
+    import websockets
+
+    url = base_url.replace("http", "ws", 1)
+    ws = await websockets.connect(
+        f"{url}/ws/socket.io/?EIO=4&transport=websocket", max_queue=1,
+        compression=None,
+    )
+    await ws.recv()
+    await ws.send("40" + json.dumps({"token": token}))
+    await ws.recv()
+    await ws.send(f'420["enter_room","{room}"]')
+    while not (await ws.recv()).startswith("430"):
+        pass
+    return ws
+
+
+async def run_mode(args) -> dict:
+    # Настройки читаются при импорте приложения
+    from benchmarks import load
+
+    import httpx
+
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        check=True, capture_output=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    stats = load.Stats()
+    flooder, probe, stalled = (
+        load.VirtualUser(i, base_url, stats) for i in range(3)
+    )
+    probe_times: list[float] = []
+    rest_times: list[float] = []
+    failed = 0
+
+    async with load.Server(args.port), httpx.AsyncClient(
+        base_url=base_url, timeout=60
+    ) as http:
+        for user in (flooder, probe, stalled):
+            await user.sign_up(http)
+        chat_id = await flooder.create_chat(http, f"flood-{os.getpid()}")
+        await stalled.join_chat(http, chat_id, flooder.room)
+        await probe.create_chat(http, f"probe-{os.getpid()}")
+        await probe.connect()
+        ws = await stalled_reader(base_url, stalled.token, flooder.room)
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=flood, args=(
+            base_url, flooder.token, flooder.room, args.rate, args.duration,
+            results,
+        ))
+        rss_baseline = load.rss_mb()
+        process.start()
+
+        until = time.perf_counter() + args.duration
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            try:
+                await probe.sio.call("send_message", {
+                    "room": probe.room, "message": "probe",
+                }, timeout=args.probe_timeout)
+                probe_times.append(time.perf_counter() - started)
+            except Exception:
+                failed += 1
+            started = time.perf_counter()
+            response = await http.get(
+                "/conversations", headers=probe._headers()
+            )
+            response.raise_for_status()
+            rest_times.append(time.perf_counter() - started)
+            await asyncio.sleep(args.probe_interval)
+
+        counts = await asyncio.to_thread(results.get)
+        await asyncio.to_thread(process.join)
+        rss_end = load.rss_mb()
+        metrics = (await http.get("/metrics")).text
+        await probe.sio.disconnect()
+        await ws.close()
+
+    def metric(name: str) -> float:
+        return sum(
+            float(line.rsplit(" ", 1)[1]) for line in metrics.splitlines()
+            if line.startswith(name)
+        )
+
+    return {
+        "flood": counts | {"per_sec": round(counts["sent"] / args.duration)},
+        "probe_ack_ms": load.summary_ms(probe_times),
+        "probe_timeouts": failed,
+        "rest_ms": load.summary_ms(rest_times),
+        "outbound_dropped": metric("socketio_outbound_dropped_total"),
+        "slow_consumer_disconnects": metric(
+            "socketio_slow_consumer_disconnects_total"
+        ),
+        "rss_mb": {"baseline": rss_baseline, "end": rss_end},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rate", type=float, default=2000,
+                        help="Событий флуда в секунду")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--probe-timeout", type=float, default=10)
+    parser.add_argument("--port", type=int, default=18300)
+    parser.add_argument("--mode", choices=MODES,
+                        help="Один прогон в этом процессе, вывод в JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        os.environ["SOCKET_RATE_LIMITS_ENABLED"] = MODES[args.mode]
+        try:
+            result = asyncio.run(run_mode(args))
+        finally:
+            from benchmarks import load
+            shutil.rmtree(load._tmp_dir, ignore_errors=True)
+        print(json.dumps(result))
+        return
+
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.flood", "--mode", mode,
+             *sys.argv[1:]],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode}:")
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
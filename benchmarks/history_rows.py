@@ -0,0 +1,117 @@
+"""Чтение истории: ORM-объекты против строк Core-запроса.
+
+Запуск: python -m benchmarks.history_rows --messages 10000
+
+Заполняет SQLite-базу так же, как benchmarks.search, с одним диалогом и
+читает его историю одной страницей: так, как читалась раньше
+(select(Message), объекты в identity map сессии), и через
+crud.get_conversation_messages (кортежи MessageRow). Для каждого способа
+печатает процессорное время на строку (медиана по --rounds, каждый раз в
+новой сессии) и память по tracemalloc: пик во время чтения и сколько
+занимает прочитанная страница, пока сессия открыта. Строки "+ serialize"
+- то же вместе с Message.bulk_to_dict, как в ответе /messages.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.search import populate
+from src.chats.models import Message
+from src.socket_server import crud
+
+
+async def read_orm(db, conversation_id, limit: int) -> list:
+    """История до перехода на Core: ORM-объекты Message"""
+    result = await db.execute(
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(limit + 1)
+    )
+    messages = result.scalars().all()[:limit]
+    messages.reverse()
+    return messages
+
+
+async def read_core(db, conversation_id, limit: int) -> list:
+    page = await crud.get_conversation_messages(
+        db, conversation_id, limit=limit
+    )
+    return page.messages
+
+
+async def cpu_per_row(session_factory, read, conversation_id, args) -> float:
+    samples = []
+    for _ in range(args.rounds):
+        async with session_factory() as db:
+            started = time.process_time()
+            messages = await read(db, conversation_id, args.messages)
+            if args.serialize:
+                await Message.bulk_to_dict(db, messages)
+            samples.append((time.process_time() - started) / len(messages))
+    return statistics.median(samples) * 1e6
+
+
+async def memory_per_row(session_factory, read, conversation_id, args):
+    async with session_factory() as db:
+        # Первое чтение прогревает кеш запросов и соединение
+        await read(db, conversation_id, args.messages)
+    async with session_factory() as db:
+        tracemalloc.start()
+        messages = await read(db, conversation_id, args.messages)
+        if args.serialize:
+            await Message.bulk_to_dict(db, messages)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rows = len(messages)
+    return peak / rows, retained / rows
+
+
+async def run(args) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{args.db}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        conversation_id = (await db.execute(
+            select(Message.conversation_id).limit(1)
+        )).scalar()
+
+    print(f"{'':<24}{'CPU us/row':>12}{'peak B/row':>12}{'kept B/row':>12}")
+    for serialize in (False, True):
+        args.serialize = serialize
+        for name, read in (("orm", read_orm), ("core", read_core)):
+            title = name + (" + serialize" if serialize else "")
+            peak, retained = await memory_per_row(
+                session_factory, read, conversation_id, args
+            )
+            cpu = await cpu_per_row(
+                session_factory, read, conversation_id, args
+            )
+            print(f"{title:<24}{cpu:>12.2f}{peak:>12.0f}{retained:>12.0f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--db", default="benchmarks/results/history_rows.db")
+    args = parser.parse_args()
+    # Вся история в одном диалоге и читается одной страницей
+    args.conversations = 1
+
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    if not os.path.exists(args.db):
+        populate(args.db, args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Скорость проверки JWT.
+
+Запуск: python -m benchmarks.jwt_codec --tokens 1000 --rounds 20
+
+Сравнивает число проверенных токенов в секунду для python-jose,
+кодека HS256Codec и decode_token с кешем проверенных токенов, а также
+decode_token вместе с проверкой по списку из --revoked отозванных id,
+как в get_current_user.
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from src.auth.denylist import token_denylist
+from src.core import config
+from src.core import jwt as core_jwt
+from src.core.jwt_codec import HS256Codec, JoseCodec
+
+
+def make_tokens(count: int) -> list[str]:
+    now = datetime.now(timezone.utc)
+    codec = JoseCodec(config.ALGORITHM)
+    return [
+        codec.encode({
+            "sub": str(uuid.uuid4()),
+            "jti": str(uuid.uuid4()),
+            "fam": str(uuid.uuid4()),
+            "typ": "access",
+            "iat": now,
+            "exp": now + timedelta(hours=1),
+        }, config.SECRET_KEY)
+        for _ in range(count)
+    ]
+
+
+def measure(decode, tokens: list[str], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            decode(token)
+    return len(tokens) * rounds / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--revoked", type=int, default=100_000)
+    args = parser.parse_args()
+
+    tokens = make_tokens(args.tokens)
+    jose_codec, fast_codec = JoseCodec(config.ALGORITHM), HS256Codec()
+    assert all(
+        jose_codec.decode(token, config.SECRET_KEY)
+        == fast_codec.decode(token, config.SECRET_KEY)
+        for token in tokens
+    )
+
+    core_jwt.verified_tokens.clear()
+    # Первый проход заполняет кеш, замеряются только попадания
+    for token in tokens:
+        core_jwt.decode_token(token)
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    for _ in range(args.revoked):
+        token_denylist._remember(str(uuid.uuid4()), expires)
+
+    variants = {
+        "jose": lambda token: jose_codec.decode(token, config.SECRET_KEY),
+        "hs256": lambda token: fast_codec.decode(token, config.SECRET_KEY),
+        "cached": core_jwt.decode_token,
+        "denylist": lambda token: core_jwt.access_allowed(
+            core_jwt.decode_token(token)
+        ),
+    }
+    base = None
+    for name, decode in variants.items():
+        rate = measure(decode, tokens, args.rounds)
+        base = base or rate
+        print(f"{name:<8} {rate:>12,.0f} tokens/s  x{rate / base:.1f}")
+
+
+if __name__ == "__main__":
+    main()
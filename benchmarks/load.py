@@ -0,0 +1,408 @@
+"""Нагрузочный тест REST и сокетов.
+
+Запуск: python -m benchmarks.load --users 100 --room-size 10 --rate 200
+
+Поднимает приложение main:app в этом же процессе на локальном порту
+(uvicorn в отдельном потоке, база во временном каталоге). Каждый
+виртуальный пользователь регистрируется, подтверждает email, входит,
+создает публичный чат или присоединяется к нему, подключается к сокету,
+входит в комнату и отправляет сообщения. Суммарная частота сообщений
+задается --rate.
+
+В отчете: задержка доставки p50/p95/p99 от emit до receive_message,
+сообщений в секунду, скорость подключения и RSS процесса. RSS включает
+и клиентов, поэтому сравнивать стоит прогоны с одинаковыми параметрами.
+Результаты сохраняются в JSON, --compare печатает разницу с прошлым
+прогоном.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Настройки читаются при импорте src.core.config
+_tmp_dir = tempfile.mkdtemp(prefix="load-")
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite+aiosqlite:///{_tmp_dir}/load.db"
+)
+# Стоимость bcrypt проверяется отдельно, здесь она только замедляет подготовку
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("PASSWORD_HASH_MAX_PENDING", "100000")
+
+import httpx  # noqa: E402
+import socketio  # noqa: E402
+import uvicorn  # noqa: E402
+
+from main import app  # noqa: E402
+from src.auth import schemas  # noqa: E402
+from src.core.jwt import mail_token  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+PREFIX = "load"
+
+
+def percentile(values: list[float], percent: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, round(percent / 100 * len(values) + 0.5) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def summary_ms(values: list[float]) -> dict:
+    return {
+        f"p{p}": round(percentile(values, p) * 1000, 2) if values else None
+        for p in (50, 95, 99)
+    } | {"max": round(max(values) * 1000, 2) if values else None}
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Server:
+    """main:app в uvicorn со своим циклом событий в отдельном потоке"""
+
+    def __init__(self, port: int):
+        config = uvicorn.Config(
+            app, host="127.0.0.1", port=port, log_level="warning",
+            lifespan="on",
+        )
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    async def __aenter__(self):
+        self.thread.start()
+        while not self.server.started:
+            await asyncio.sleep(0.05)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.should_exit = True
+        await asyncio.to_thread(self.thread.join)
+
+
+class VirtualUser:
+    def __init__(self, index: int, base_url: str, stats: "Stats",
+                 batch: bool = False):
+        self.index = index
+        self.batch = batch
+        self.base_url = base_url
+        self.stats = stats
+        self.email = f"{PREFIX}-{uuid.uuid4().hex[:12]}@example.com"
+        self.password = uuid.uuid4().hex
+        self.token: str | None = None
+        self.room: str | None = None
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("receive_message", self.on_message)
+        self.sio.on("receive_messages", self.on_messages)
+
+    async def sign_up(self, http: httpx.AsyncClient) -> None:
+        response = await http.post("/register/", json={
+            "email": self.email,
+            "password": self.password,
+            "confirm_password": self.password,
+        })
+        response.raise_for_status()
+        # Письмо не отправляется, токен подтверждения выпускаем сами
+        token = mail_token(schemas.User(**response.json()))
+        (await http.get("/verify/", params={"token": token})).raise_for_status()
+
+        response = await http.post("/login/", data={
+            "username": self.email, "password": self.password,
+        })
+        response.raise_for_status()
+        self.token = response.json()["access_token"]
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    async def create_chat(self, http: httpx.AsyncClient, name: str) -> str:
+        response = await http.post(
+            "/chat/", json={"chat_name": name}, headers=self._headers()
+        )
+        response.raise_for_status()
+        data = response.json()
+        self.room = data["conversation_id"]
+        return data["chat_id"]
+
+    async def join_chat(
+        self, http: httpx.AsyncClient, chat_id: str, room: str
+    ) -> None:
+        response = await http.post(
+            f"/chat/{chat_id}/enjoy", headers=self._headers()
+        )
+        response.raise_for_status()
+        self.room = room
+
+    async def connect(self) -> None:
+        started = time.perf_counter()
+        await self.sio.connect(
+            self.base_url, auth={"token": self.token, "batch": self.batch},
+            socketio_path="/ws/socket.io/", transports=["websocket"],
+        )
+        await self.sio.call("enter_room", self.room)
+        self.stats.connect_times.append(time.perf_counter() - started)
+
+    async def send(self, rate: float, until: float) -> None:
+        interval = 1 / rate
+        # Случайный сдвиг, чтобы пользователи не отправляли одновременно
+        await asyncio.sleep(random.uniform(0, interval))
+        seq = 0
+        while time.perf_counter() < until:
+            await self.sio.emit(
+                "send_message",
+                {
+                    "room": self.room,
+                    "message": f"{PREFIX}:{self.index}:{seq}:"
+                               f"{time.perf_counter()}",
+                },
+                callback=self.on_ack,
+            )
+            self.stats.sent += 1
+            seq += 1
+            await asyncio.sleep(interval)
+
+    def on_ack(self, data=None):
+        if data and data.get("saved"):
+            self.stats.acked += 1
+
+    def on_messages(self, data):
+        self.stats.count_event(data)
+        for message in data:
+            self._record(message)
+
+    def on_message(self, data):
+        self.stats.count_event(data)
+        self._record(data)
+
+    def _record(self, data):
+        received = time.perf_counter()
+        parts = data.get("message", "").split(":")
+        if len(parts) != 4 or parts[0] != PREFIX:
+            return
+        self.stats.latencies.append(received - float(parts[3]))
+        self.stats.delivered += 1
+
+
+class Stats:
+    def __init__(self):
+        self.connect_times: list[float] = []
+        self.latencies: list[float] = []
+        self.sent = 0
+        self.acked = 0
+        self.delivered = 0
+        self.events = 0
+        self.bytes = 0
+
+    def count_event(self, data) -> None:
+        # Полезная нагрузка пакета socket.io, без заголовков транспорта
+        self.events += 1
+        self.bytes += len(json.dumps(data, separators=(",", ":")))
+
+
+async def gather_limited(limit: int, coroutines) -> None:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            await coroutine
+
+    await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def run(args) -> dict:
+    logging.disable(logging.INFO)
+    # Схема как при обычном запуске, см. start.sh
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        check=True, capture_output=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    stats = Stats()
+    users = [
+        VirtualUser(i, base_url, stats, batch=args.batch)
+        for i in range(args.users)
+    ]
+    groups = [
+        users[i:i + args.room_size]
+        for i in range(0, len(users), args.room_size)
+    ]
+
+    async with Server(args.port), httpx.AsyncClient(
+        base_url=base_url, timeout=60
+    ) as http:
+        rss_baseline = rss_mb()
+
+        started = time.perf_counter()
+        await gather_limited(
+            args.concurrency, (user.sign_up(http) for user in users)
+        )
+        sign_up_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        run_id = uuid.uuid4().hex[:8]
+        for number, (owner, *members) in enumerate(groups):
+            chat_id = await owner.create_chat(http, f"{PREFIX}-{run_id}-{number}")
+            await gather_limited(args.concurrency, (
+                member.join_chat(http, chat_id, owner.room)
+                for member in members
+            ))
+        chats_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await gather_limited(
+            args.concurrency, (user.connect() for user in users)
+        )
+        connect_seconds = time.perf_counter() - started
+
+        expected_per_message = {
+            user.index: len(group) for group in groups for user in group
+        }
+        started = time.perf_counter()
+        until = started + args.duration
+        per_user_rate = args.rate / len(users)
+        senders = [user.send(per_user_rate, until) for user in users]
+        await asyncio.gather(*senders)
+        send_seconds = time.perf_counter() - started
+
+        expected = stats.sent * sum(expected_per_message.values()) / len(users)
+        deadline = time.perf_counter() + args.drain
+        while stats.delivered < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        deliver_seconds = time.perf_counter() - started
+        rss_end = rss_mb()
+
+        await asyncio.gather(*(user.sio.disconnect() for user in users))
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {
+            "users": args.users,
+            "room_size": args.room_size,
+            "rate": args.rate,
+            "duration": args.duration,
+            "delivery": os.getenv("MESSAGE_DELIVERY", "durable"),
+            "batch": args.batch,
+            "database": os.environ["DATABASE_URL"].split("://")[0],
+        },
+        "setup": {
+            "sign_up_per_sec": round(len(users) / sign_up_seconds, 1),
+            "chats_seconds": round(chats_seconds, 3),
+        },
+        "connect": {
+            "per_sec": round(len(users) / connect_seconds, 1),
+            "latency_ms": summary_ms(stats.connect_times),
+        },
+        "messages": {
+            "sent": stats.sent,
+            "acked": stats.acked,
+            "delivered": stats.delivered,
+            "expected": round(expected),
+            "sent_per_sec": round(stats.sent / send_seconds, 1),
+            "delivered_per_sec": round(stats.delivered / deliver_seconds, 1),
+            "events_received": stats.events,
+            "bytes_received": stats.bytes,
+        },
+        "latency_ms": summary_ms(stats.latencies),
+        "rss_mb": {
+            "baseline": rss_baseline,
+            "end": rss_end,
+            "peak": peak_rss_mb(),
+        },
+    }
+
+
+def _flatten(data: dict, prefix: str = "") -> dict:
+    items = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            items.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[f"{prefix}{key}"] = value
+    return items
+
+
+def compare(result: dict, previous: dict) -> None:
+    print(f"\nagainst {previous.get('commit')} ({previous.get('date')}):")
+    old = _flatten(previous)
+    for key, value in _flatten(result).items():
+        if key.startswith("params.") or not old.get(key):
+            continue
+        change = (value - old[key]) / old[key]
+        print(f"{key:<32} {old[key]:>12} -> {value:<12} {change:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=200,
+                        help="Сообщений в секунду от всех пользователей")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--drain", type=float, default=10,
+                        help="Сколько ждать доставки после отправки")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch", action="store_true",
+                        help="Получать сообщения пачками receive_messages")
+    parser.add_argument("--port", type=int, default=18200)
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона")
+    args = parser.parse_args()
+
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(_tmp_dir, ignore_errors=True)
+    print(json.dumps(result, indent=2))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"load-{result['commit'] or 'local'}-"
+                         f"{int(time.time())}.json"
+        )
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Стоимость метрик на запрос.
+
+Запуск: python -m benchmarks.metrics_overhead --requests 2000 --rounds 5
+
+Сравнивает одно и то же приложение FastAPI с MetricsMiddleware и без него
+(запросы через ASGI без сети), вызов корутины с декоратором timed и без,
+а также стоимость одного Histogram.observe.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from src.core import metrics
+
+
+def make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping/{value}")
+    async def ping(value: int):
+        return {"value": value}
+
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+async def per_request(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for i in range(100):
+            await client.get(f"/ping/{i}")
+        started = time.perf_counter()
+        for i in range(requests):
+            await client.get(f"/ping/{i}")
+        return (time.perf_counter() - started) / requests
+
+
+async def per_call(func, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await func()
+    return (time.perf_counter() - started) / calls
+
+
+async def noop():
+    return None
+
+
+async def run(args) -> None:
+    apps = {False: make_app(False), True: make_app(True)}
+    results = {False: [], True: []}
+    # Варианты чередуются, берется лучший из прогонов, чтобы убрать шум
+    for _ in range(args.rounds):
+        for instrumented, app in apps.items():
+            results[instrumented].append(
+                await per_request(app, args.requests)
+            )
+    bare, instrumented = min(results[False]), min(results[True])
+    print(f"request without metrics  {bare * 1e6:8.1f} us")
+    print(f"request with metrics     {instrumented * 1e6:8.1f} us"
+          f"  ({(instrumented - bare) * 1e6:+.1f} us, "
+          f"{(instrumented - bare) / bare:+.1%})")
+
+    histogram = metrics.Histogram("bench_seconds", "bench", ("function",))
+    timed_noop = metrics.timed(histogram)(noop)
+    calls = args.requests * 20
+    plain = await per_call(noop, calls)
+    wrapped = await per_call(timed_noop, calls)
+    print(f"timed decorator          {(wrapped - plain) * 1e9:8.0f} ns/call")
+
+    child = histogram.labels("observe")
+    started = time.perf_counter()
+    for _ in range(calls):
+        child.observe(0.003)
+    observe = (time.perf_counter() - started) / calls
+    print(f"Histogram.observe        {observe * 1e9:8.0f} ns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Перенос старых сообщений в архив: скорость, размер таблиц и история.
+
+Запуск: python -m benchmarks.retention --messages 1000000 --keep 1000
+
+Заполняет SQLite-базу так же, как benchmarks.search, и замеряет чтение
+истории одного диалога: последнюю страницу и страницу из середины истории
+(после переноса она читается из архива). Затем переносит в архив все
+сообщения, кроме --keep последних в каждом диалоге, и печатает скорость
+переноса, число строк и место таблиц messages и messages_archive до и
+после, и те же замеры чтения.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.search import populate
+from src.chats.models import Message
+from src.chats.retention import apply_retention, table_stats
+from src.socket_server import crud
+
+
+async def pick_cursor(db):
+    """Диалог и сообщение из середины его истории"""
+    conversation_id = (await db.execute(
+        select(Message.conversation_id).limit(1)
+    )).scalar()
+    page = await crud.get_conversation_messages(db, conversation_id)
+    return conversation_id, page.messages[len(page.messages) // 2].id
+
+
+async def measure_reads(db, conversation_id, middle, rounds: int) -> dict:
+    timings = {}
+    for name, before in (("latest page", None), ("middle page", middle)):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await crud.get_conversation_messages(
+                db, conversation_id, before=before, limit=50
+            )
+            samples.append(time.perf_counter() - started)
+        timings[name] = statistics.median(samples) * 1e3
+    return timings
+
+
+def print_stats(title: str, stats: dict, reads: dict) -> None:
+    print(title)
+    for table, values in stats.items():
+        size = values["bytes"] / 2 ** 20 if values.get("bytes") else 0
+        rows = f"{values['rows']} rows" if "rows" in values else ""
+        print(f"  {table:<18}{rows:>17}{size:>10.1f} MB")
+    for name, value in reads.items():
+        print(f"  {name:<18}{value:>12.2f} ms p50")
+
+
+async def run(args) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{args.db}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_factory() as db:
+        conversation_id, middle = await pick_cursor(db)
+        print_stats(
+            "before", await table_stats(db),
+            await measure_reads(db, conversation_id, middle, args.rounds),
+        )
+
+    stats = await apply_retention(
+        session_factory, batch_size=args.batch_size,
+        max_age_days=0, max_count=args.keep,
+    )
+    print(f"archived {stats.archived} messages from {stats.conversations} "
+          f"conversations in {stats.seconds:.1f}s "
+          f"({stats.archived / stats.seconds:,.0f} msg/s)")
+
+    async with session_factory() as db:
+        print_stats(
+            "after", await table_stats(db),
+            await measure_reads(db, conversation_id, middle, args.rounds),
+        )
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--keep", type=int, default=1000,
+                        help="Сколько последних сообщений диалога оставить")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--db", default="benchmarks/results/retention.db")
+    args = parser.parse_args()
+
+    # Перенос меняет базу, каждый запуск начинается с новой
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    populate(args.db, args)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Задержка полнотекстового поиска по сообщениям.
+
+Запуск: python -m benchmarks.search --messages 1000000 --db /tmp/search.db
+
+Создает SQLite-базу со схемой приложения и индексом messages_fts,
+заполняет ее сообщениями из слов с распределением Ципфа (частые слова
+встречаются в большинстве сообщений, редкие - в единицах) и вызывает
+search_messages, как это делает GET /messages/search: по всем доступным
+пользователю диалогам и внутри одного диалога. Печатает p50/p95/max.
+
+Готовая база переиспользуется, повторный запуск с тем же --db только
+измеряет. Для оценки на 10M сообщений: --messages 10000000, база около
+4 ГБ, заполнение занимает десятки минут.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.chats import crud, search  # noqa: F401 - DDL индекса поиска
+from src.database.database import Base
+
+SYLLABLES = (
+    "ка ло ми ре ту са но ви де ры па ко ле ни ма зо ст ра хо вэ "
+    "ba ke li mo nu ra se ti vo za"
+).split()
+
+
+def make_vocabulary(size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    return list(words)
+
+
+def populate(path: str, args) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    vocabulary = make_vocabulary(args.vocabulary)
+    # Ципф: вес слова обратно пропорционален его номеру
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, len(vocabulary) + 1):
+        total += 1 / rank
+        cum_weights.append(total)
+
+    users = [uuid.uuid4().hex for _ in range(args.users)]
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany(
+        "INSERT INTO users (id, email, password, is_active) VALUES (?, ?, '', 1)",
+        [(user, f"{user}@example.com") for user in users],
+    )
+
+    public_chat = uuid.uuid4().hex
+    conn.execute(
+        "INSERT INTO public_chats (id, name, owner_id) VALUES (?, 'bench', ?)",
+        (public_chat, users[0]),
+    )
+    conversations = []
+    for i in range(args.conversations):
+        conversation = uuid.uuid4().hex
+        if i % 5 == 0:
+            conn.execute(
+                "INSERT INTO conversations (id, is_group, public_chat_id) "
+                "VALUES (?, 1, ?)", (conversation, public_chat),
+            )
+            conversations.append((conversation, users))
+            continue
+        chat = uuid.uuid4().hex
+        members = random.sample(users, 2)
+        conn.execute("INSERT INTO private_chats (id) VALUES (?)", (chat,))
+        conn.executemany(
+            "INSERT INTO user_private_chats (user_id, private_chat_id) "
+            "VALUES (?, ?)", [(member, chat) for member in members],
+        )
+        conn.execute(
+            "INSERT INTO conversations (id, is_group, private_chat_id) "
+            "VALUES (?, 0, ?)", (conversation, chat),
+        )
+        conversations.append((conversation, members))
+    conn.commit()
+
+    started = time.perf_counter()
+    timestamp = datetime(2024, 1, 1)
+    chunk = 50_000
+    for done in range(0, args.messages, chunk):
+        rows = []
+        for _ in range(min(chunk, args.messages - done)):
+            conversation, members = random.choice(conversations)
+            timestamp += timedelta(milliseconds=random.randint(1, 2000))
+            rows.append((
+                uuid.uuid4().hex,
+                " ".join(random.choices(
+                    vocabulary, cum_weights=cum_weights,
+                    k=random.randint(3, 25),
+                )),
+                str(timestamp),
+                random.choice(members),
+                conversation,
+            ))
+        # Индекс заполняют триггеры, как при обычной записи сообщений
+        conn.executemany(
+            "INSERT INTO messages (id, content, timestamp, user_id, "
+            "conversation_id) VALUES (?, ?, ?, ?, ?)", rows,
+        )
+        conn.commit()
+        elapsed = time.perf_counter() - started
+        print(f"\rinserted {done + len(rows):>10} "
+              f"({(done + len(rows)) / elapsed:,.0f} msg/s)", end="")
+    print()
+    conn.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) "
+                 "VALUES ('optimize')")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def pick_queries(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    # Частоты слов из самого индекса
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts_vocab "
+        f"USING fts5vocab(main, {search.FTS_TABLE}, col)"
+    )
+    words = conn.execute(
+        "SELECT term, doc FROM fts_vocab WHERE col = 'content' "
+        "ORDER BY doc DESC"
+    ).fetchall()
+    user = conn.execute(
+        "SELECT user_id FROM user_private_chats LIMIT 1"
+    ).fetchone()[0]
+    conversation = conn.execute(
+        "SELECT conversations.id FROM conversations "
+        "JOIN user_private_chats "
+        "ON user_private_chats.private_chat_id = conversations.private_chat_id "
+        "WHERE user_private_chats.user_id = ?", (user,),
+    ).fetchone()[0]
+    conn.close()
+
+    common, middle, rare = words[0], words[len(words) // 20], words[-1]
+    return {
+        "user": uuid.UUID(user),
+        "conversation": uuid.UUID(conversation),
+        "queries": {
+            f"rare ({rare[1]} docs)": rare[0],
+            f"medium ({middle[1]} docs)": middle[0],
+            f"common ({common[1]} docs)": common[0],
+            "prefix": middle[0][:3] + "*",
+            "two words": f"{common[0]} {middle[0]}",
+        },
+    }
+
+
+async def measure(path: str, args) -> None:
+    setup = pick_queries(path)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    scopes = {"all": None, "conversation": setup["conversation"]}
+
+    print(f"{'query':<28}{'scope':<14}{'hits':>6}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    async with session_factory() as db:
+        for name, query in setup["queries"].items():
+            for scope, conversation_id in scopes.items():
+                timings = []
+                for _ in range(args.rounds):
+                    started = time.perf_counter()
+                    hits, _ = await crud.search_messages(
+                        db, setup["user"], query, conversation_id,
+                        limit=args.limit,
+                    )
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                print(f"{name:<28}{scope:<14}{len(hits):>6}"
+                      f"{statistics.median(timings) * 1e3:>10.2f}"
+                      f"{p95 * 1e3:>10.2f}{timings[-1] * 1e3:>10.2f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--db", default="benchmarks/results/search.db")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+        populate(args.db, args)
+    asyncio.run(measure(args.db, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Выгрузка и загрузка истории в NDJSON: скорость и память.
+
+Запуск: python -m benchmarks.transfer --messages 10000000
+
+Заполняет SQLite-базу так же, как benchmarks.search, выгружает все
+диалоги в файл и загружает его в новую базу, куда заранее скопированы
+пользователи, чаты и диалоги. Печатает скорость выгрузки и загрузки и
+RSS процесса: до начала и наибольший за время работы (замеряется
+отдельным потоком), - при потоковой обработке он не растет с размером
+истории. Затем загружает тот же файл повторно: ни одно сообщение не
+должно вставиться.
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.search import populate
+from src.chats.models import Conversation
+from src.chats.transfer import export_history, import_history
+from src.database.database import Base
+
+# Копируются в новую базу до загрузки, сообщения не копируются
+COPIED_TABLES = (
+    "users", "public_chats", "private_chats", "user_public_chats",
+    "user_private_chats", "conversations",
+)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class RssSampler:
+    """Наибольший RSS за время блока with"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.start = self.peak = 0.0
+        self._done = threading.Event()
+
+    def __enter__(self):
+        self.start = self.peak = rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+
+def report(title: str, rows: int, seconds: float, rss: RssSampler) -> None:
+    print(f"{title:<8}{rows:>12} messages {seconds:>8.1f}s "
+          f"{rows / seconds:>12,.0f} msg/s   "
+          f"RSS {rss.start:.0f} -> peak {rss.peak:.0f} MB")
+
+
+def prepare_target(source: str, target: str) -> None:
+    engine = create_engine(f"sqlite:///{target}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ATTACH DATABASE :path AS source"), {"path": source})
+        for table in COPIED_TABLES:
+            conn.execute(text(
+                f"INSERT INTO {table} SELECT * FROM source.{table}"
+            ))
+        # Поля последнего сообщения заполнит загрузка
+        conn.execute(text(
+            "UPDATE conversations SET last_message_id = NULL, "
+            "last_message_at = NULL, message_count = 0"
+        ))
+    engine.dispose()
+
+
+async def export_all(session_factory, path: str) -> int:
+    async with session_factory() as db:
+        conversations = (
+            await db.execute(select(Conversation.id))
+        ).scalars().all()
+    lines = 0
+    with open(path, "wb") as output:
+        for conversation_id in conversations:
+            async for chunk in export_history(
+                session_factory, conversation_id=conversation_id
+            ):
+                lines += chunk.count(b"\n")
+                output.write(chunk)
+    return lines - len(conversations)
+
+
+async def run(args) -> None:
+    source = create_async_engine(f"sqlite+aiosqlite:///{args.db}")
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        exported = await export_all(
+            async_sessionmaker(source, expire_on_commit=False), args.output
+        )
+        seconds = time.perf_counter() - started
+    await source.dispose()
+    report("export", exported, seconds, rss)
+    print(f"        {os.path.getsize(args.output) / 2 ** 20:.0f} MB NDJSON")
+
+    target = create_async_engine(f"sqlite+aiosqlite:///{args.target}")
+    session_factory = async_sessionmaker(target, expire_on_commit=False)
+    for title in ("import", "again"):
+        with RssSampler() as rss, open(args.output, "rb") as lines:
+            stats = await import_history(
+                session_factory, lines, batch_size=args.batch_size,
+                transaction_rows=args.transaction_rows,
+            )
+        report(title, stats.inserted, stats.seconds, rss)
+        print(f"        read {stats.read}, skipped {stats.skipped}")
+    await target.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--transaction-rows", type=int, default=100_000)
+    parser.add_argument("--db", default="benchmarks/results/transfer.db",
+                        help="Исходная база, создается, если ее нет")
+    parser.add_argument("--target", default="benchmarks/results/import.db")
+    parser.add_argument("--output", default="benchmarks/results/export.ndjson")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.target) or ".", exist_ok=True)
+    if not os.path.exists(args.db):
+        populate(args.db, args)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.target + suffix):
+            os.remove(args.target + suffix)
+    prepare_target(args.db, args.target)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Размер и стоимость кодировок сообщений для сокетов.
+
+Запуск: python -m benchmarks.wire_encoding --messages 200 --rounds 200
+
+Для пачки сообщений, как в истории или receive_messages, сравнивает
+JSON (как его кодирует socket.io), orjson и компактную двоичную
+кодировку без сжатия и с zlib: байт и микросекунд CPU на сообщение
+при кодировании и разборе.
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import orjson
+
+from src.socket_server.encoding import (
+    MessageRecord,
+    decode_messages,
+    encode_messages,
+)
+
+WORDS = (
+    "привет как дела сегодня встреча в офисе созвон завтра ok "
+    "hello let's ship it посмотри пулл реквест"
+).split()
+
+
+def make_records(count: int) -> list[MessageRecord]:
+    conversation_id = uuid.uuid4()
+    authors = [
+        (uuid.uuid4(), f"user{i}@example.com") for i in range(10)
+    ]
+    started = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        user_id, email = random.choice(authors)
+        records.append(MessageRecord(
+            uuid.uuid4(), conversation_id, user_id, email,
+            " ".join(random.choices(WORDS, k=random.randint(2, 20))),
+            started + timedelta(seconds=i, microseconds=random.randint(0, 999999)),
+        ))
+    return records
+
+
+def as_dicts(records: list[MessageRecord]) -> list[dict]:
+    # Как Message.serialize
+    return [
+        {
+            "id": str(record.id),
+            "content": record.content,
+            "timestamp": str(record.timestamp),
+            "user_id": str(record.user_id),
+            "user_email": record.user_email,
+            "conversation_id": str(record.conversation_id),
+        }
+        for record in records
+    ]
+
+
+def measure(func, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        func()
+    return (time.process_time() - started) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    records = make_records(args.messages)
+    variants = {
+        "json": (
+            lambda: json.dumps(as_dicts(records), separators=(",", ":")),
+            json.loads,
+        ),
+        "orjson": (lambda: orjson.dumps(as_dicts(records)), orjson.loads),
+        "compact": (lambda: encode_messages(records), decode_messages),
+        "compact+zlib": (
+            lambda: encode_messages(records, deflate_min_bytes=1),
+            decode_messages,
+        ),
+    }
+
+    n = args.messages
+    print(f"{'encoding':<14}{'bytes/msg':>10}{'encode us/msg':>15}"
+          f"{'decode us/msg':>15}")
+    for name, (encode, decode) in variants.items():
+        payload = encode()
+        size = len(payload)
+        encode_time = measure(encode, args.rounds)
+        decode_time = measure(lambda: decode(payload), args.rounds)
+        print(f"{name:<14}{size / n:>10.1f}{encode_time / n * 1e6:>15.2f}"
+              f"{decode_time / n * 1e6:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,53 @@
+from contextlib import asynccontextmanager
+
 import socketio
 from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
+from src.auth.denylist import token_denylist
 from src.auth.views import router as auth_router
+from src.chats.retention import retention_job
 from src.chats.views import router as chats_router
-from src.socket_server.sockets import sio
+from src.core import config, metrics
+from src.core.hash import password_hasher
+from src.jobs.worker import job_worker
+from src.socket_server.sockets import presence_batcher, room_batcher, sio
+from src.socket_server.writer import message_writer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Отозванные токены нужны до первого запроса
+    await token_denylist.sync()
+    token_denylist.start()
+    message_writer.start()
+    if config.MESSAGE_RETENTION_ENABLED:
+        retention_job.start()
+    if config.JOB_WORKER_ENABLED:
+        job_worker.start()
+    yield
+    await job_worker.stop()
+    await retention_job.stop()
+    await token_denylist.stop()
+    # Дописываем сообщения из очереди перед остановкой
+    await message_writer.stop()
+    await room_batcher.flush()
+    await presence_batcher.flush()
+    password_hasher.shutdown()
 
-app = FastAPI(default_response_class=ORJSONResponse)
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.include_router(chats_router)
 app.include_router(auth_router)
 
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_view():
+        return Response(
+            metrics.registry.render(), media_type=metrics.CONTENT_TYPE
+        )
+
 app.mount("/ws", socketio.ASGIApp(sio, other_asgi_app=app))
@@ -0,0 +1,8 @@
+from src.core import config
+from src.core.cache import AsyncTTLCache
+
+# Снимки пользователей по UUID, общие для всего процесса
+user_cache = AsyncTTLCache(
+    maxsize=config.USER_CACHE_MAXSIZE, ttl=config.USER_CACHE_TTL_SECONDS,
+    name="user",
+)
@@ -0,0 +1,143 @@
+"""Отозванные токены.
+
+У каждого токена свой jti и общий для семейства fam - id, выданный при
+входе, /refresh/ выдает новую пару с тем же fam. Отзываются:
+
+- jti refresh-токена, как только по нему выдана новая пара. Повторное
+  предъявление значит, что токен скопирован, тогда отзывается все
+  семейство, включая выданные после него access-токены;
+- fam при выходе (/logout/).
+
+Отозванные id хранятся в таблице revoked_tokens до истечения токенов и
+в памяти процесса: проверка при каждом запросе - поиск в словаре, без
+запросов к БД. Процесс загружает список при запуске и раз в
+TOKEN_DENYLIST_SYNC_SECONDS дочитывает записи других воркеров. Кто
+первым обновил refresh-токен, решает вставка в таблицу, поэтому один
+токен не обновится дважды и на разных воркерах.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import delete, select
+
+from src.auth.models import RevokedToken
+from src.core import config, metrics
+from src.core.logging import logger
+from src.database.database import SessionFactory
+from src.database.upsert import dialect_insert
+
+# Запись другого воркера с временем чуть раньше прошлой синхронизации
+# могла тогда еще не быть закоммичена
+SYNC_OVERLAP = timedelta(seconds=60)
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+revoked_tokens = metrics.counter(
+    "auth_tokens_revoked", "Token ids added to the denylist", ("reason",),
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenDenylist:
+    def __init__(self, session_factory, sync_interval: float):
+        self.session_factory = session_factory
+        self.sync_interval = sync_interval
+        # jti -> unix-время истечения
+        self._revoked: dict[str, float] = {}
+        self._synced_at: datetime | None = None
+        self._purged_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str | None, family: str | None) -> bool:
+        return jti in self._revoked or family in self._revoked
+
+    async def revoke(
+        self, db, jti: str, expires_at: datetime, reason: str
+    ) -> bool:
+        """Отзывает jti до expires_at (UTC) и коммитит. False, если он
+        уже был отозван"""
+        statement = dialect_insert(db, RevokedToken).values(
+            jti=UUID(jti), expires_at=expires_at, revoked_at=_utcnow(),
+        )
+        result = await db.execute(statement.on_conflict_do_nothing(
+            index_elements=[RevokedToken.jti]
+        ))
+        await db.commit()
+        self._remember(jti, expires_at)
+        if result.rowcount:
+            revoked_tokens.labels(reason).inc()
+        return bool(result.rowcount)
+
+    def _remember(self, jti: str, expires_at: datetime) -> None:
+        self._revoked[jti] = (
+            expires_at.replace(tzinfo=timezone.utc).timestamp()
+        )
+
+    async def sync(self) -> int:
+        """Дочитывает записи, появившиеся с прошлого вызова, при первом
+        вызове - все действующие. Возвращает число прочитанных"""
+        started = _utcnow()
+        query = select(RevokedToken.jti, RevokedToken.expires_at).where(
+            RevokedToken.expires_at > started
+        )
+        if self._synced_at is not None:
+            query = query.where(
+                RevokedToken.revoked_at >= self._synced_at - SYNC_OVERLAP
+            )
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        for jti, expires_at in rows:
+            self._remember(str(jti), expires_at)
+        self._synced_at = started
+        return len(rows)
+
+    async def purge(self) -> None:
+        """Удаляет истекшие записи из таблицы и памяти"""
+        async with self.session_factory() as db:
+            await db.execute(
+                delete(RevokedToken)
+                .where(RevokedToken.expires_at <= _utcnow())
+            )
+            await db.commit()
+        now = time.time()
+        self._revoked = {
+            jti: expires for jti, expires in self._revoked.items()
+            if expires > now
+        }
+        self._purged_at = time.monotonic()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                if time.monotonic() - self._purged_at > PURGE_INTERVAL_SECONDS:
+                    await self.purge()
+            except Exception:
+                logger.exception("Token denylist sync failed")
+
+
+token_denylist = TokenDenylist(
+    SessionFactory, config.TOKEN_DENYLIST_SYNC_SECONDS
+)
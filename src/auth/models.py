@@ -1,25 +1,34 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import select, ForeignKey, Column, Table
+from sqlalchemy import select, ForeignKey, Column, Index, Table
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 
+from src.auth.cache import user_cache
 from src.database.database import Base
-from src.core.hash import verify_password
+from src.core.hash import async_verify_password
 
 
 user_private_chats = Table(
     'user_private_chats',
     Base.metadata,
     Column('user_id', ForeignKey('users.id'), primary_key=True),
-    Column('private_chat_id', ForeignKey('private_chats.id'), primary_key=True)
+    Column(
+        'private_chat_id', ForeignKey('private_chats.id'),
+        primary_key=True, index=True,
+    )
 )
 
 user_public_chats = Table(
     "user_public_chats", Base.metadata,
     Column("user_id", ForeignKey("users.id"), primary_key=True),
-    Column("public_chat_id", ForeignKey("public_chats.id"), primary_key=True)
+    Column("public_chat_id", ForeignKey("public_chats.id"), primary_key=True),
+    # Участники чата по порядку user_id: список страницами без сортировки
+    Index(
+        "ix_user_public_chats_public_chat_id_user_id",
+        "public_chat_id", "user_id",
+    ),
 )
 
 
@@ -31,10 +40,10 @@ class User(Base):
     email: Mapped[str] = mapped_column(unique=True, index=True)
     password: Mapped[str]
     is_active: Mapped[bool] = mapped_column(default=False)
-    created_at: Mapped[datetime] = mapped_column(server_default=func.datetime('now'))
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(
-        server_default=func.datetime('now'), server_onupdate=func.datetime('now'),
-        onupdate=func.datetime('now')
+        server_default=func.now(), server_onupdate=func.now(),
+        onupdate=func.now()
     )
 
     messages: Mapped[list["Message"]] = relationship()
@@ -45,6 +54,10 @@ class User(Base):
         secondary=user_public_chats, back_populates="users"
     )
 
+    def after_save(self) -> None:
+        # Сбрасываем снимок, чтобы get_current_user увидел изменения
+        user_cache.invalidate(self.id)
+
     @classmethod
     async def find_by_email(cls, db: AsyncSession, email: str):
         query = select(cls).where(cls.email == email)
@@ -54,6 +67,26 @@ class User(Base):
     @classmethod
     async def authenticate(cls, db: AsyncSession, email: str, password: str):
         user = await cls.find_by_email(db=db, email=email)
-        if not user or not verify_password(password, user.password):
+        if not user:
             return False
+        valid, new_hash = await async_verify_password(password, user.password)
+        if not valid:
+            return False
+        if new_hash:
+            # Хеш с устаревшим числом раундов заменяем при входе
+            user.password = new_hash
+            await user.save(db=db)
         return user
+
+
+class RevokedToken(Base):
+    """Отозванный jti токена или семейства токенов, см. src/auth/denylist.py"""
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    # После expires_at токен недействителен сам, запись можно удалить
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+    revoked_at: Mapped[datetime] = mapped_column(index=True)
+
+    def __repr__(self):
+        return f"RevokedToken(jti={self.jti}, expires_at={self.expires_at})"
@@ -1,8 +1,31 @@
+from typing import List
+
 from src.auth.schemas import MailTaskSchema
+from src.core import config
 from src.core.logging import logger
+from src.jobs.worker import register
+
+MAIL_QUEUE = "mail"
 
 
 def user_mail_event(payload: MailTaskSchema):
     # Send mail to user here
     # Now printing only token
     logger.info(f"[ Mail Schecma ]: {payload}")
+
+
+@register(MAIL_QUEUE, batch_size=config.MAIL_BATCH_SIZE)
+async def send_mails(payloads: List[dict]) -> List[str | None]:
+    """Пачка писем из очереди: одно подключение к почтовому серверу
+    на пачку. Ошибка письма повторяет только его, отправленные
+    повторно не уходят"""
+    errors = []
+    for payload in payloads:
+        try:
+            user_mail_event(MailTaskSchema.parse_obj(payload))
+        except Exception as exc:
+            logger.exception("Mail job failed")
+            errors.append(repr(exc))
+        else:
+            errors.append(None)
+    return errors
@@ -1,14 +1,32 @@
 import uuid
 
 from sqlalchemy.future import select
-from functools import lru_cache
+from sqlalchemy.orm import make_transient_to_detached
 
+from src.auth.cache import user_cache
 from src.auth.models import User
 
 
-async def cached_get_user_by_uuid(db, _uuid: uuid.UUID):
-    @lru_cache(maxsize=1000)
-    async def _get_user_by_uuid(uuid):
-        result = await db.execute(select(User).where(User.id == uuid))
-        return result.scalars().first()
-    return await _get_user_by_uuid(_uuid)
+async def _load_user_snapshot(db, _uuid: uuid.UUID) -> dict | None:
+    result = await db.execute(select(User).where(User.id == _uuid))
+    user = result.scalars().first()
+    if user is None:
+        return None
+    return {
+        column.key: getattr(user, column.key)
+        for column in User.__table__.columns
+    }
+
+
+async def cached_get_user_by_uuid(db, _uuid: uuid.UUID) -> User | None:
+    snapshot = await user_cache.get_or_load(
+        _uuid, lambda: _load_user_snapshot(db, _uuid)
+    )
+    if snapshot is None:
+        return None
+
+    # В кеше хранятся только значения колонок: ORM-объект нельзя делить
+    # между сессиями, поэтому привязываем копию к текущей без запроса в БД
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
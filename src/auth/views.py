@@ -2,7 +2,7 @@ import uuid
 
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
+    Cookie,
     Depends,
     HTTPException,
     Response,
@@ -12,21 +12,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.auth import schemas
 from src.chats import models
 from src.auth.forms import OAuth2PasswordRequestCustomForm
-from src.core.hash import get_password_hash
+from src.core.hash import async_get_password_hash
 from src.core.jwt import (
     create_token_pair,
     decode_access_token,
     mail_token,
     add_refresh_token_cookie,
+    revoke_token_family,
+    rotate_refresh_token,
     SUB,
 )
 from src.database.dependencies import get_db
 from src.core.exceptions import (
+    AuthFailedException,
     BadRequestException,
     NotFoundException,
     ForbiddenException,
 )
-from src.auth.tasks import user_mail_event
+from src.auth.tasks import MAIL_QUEUE
+from src.jobs.worker import enqueue
 
 
 router = APIRouter()
@@ -40,7 +44,6 @@ router = APIRouter()
 )
 async def register(
     data: schemas.UserRegister,
-    bg_task: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
 ):
     user = await models.User.find_by_email(db=db, email=data.email)
@@ -49,12 +52,11 @@ async def register(
 
     # hashing password
     user_data = data.dict(exclude={"confirm_password"})
-    user_data["password"] = get_password_hash(user_data["password"])
+    user_data["password"] = await async_get_password_hash(user_data["password"])
 
-    # save user to db
-    user = models.User(**user_data)
+    # id заранее: токен письма нужен до сохранения пользователя
+    user = models.User(id=uuid.uuid4(), **user_data)
     user.is_active = False
-    await user.save(db=db)
 
     # send verify email
     user_schema = schemas.User.from_orm(user)
@@ -63,7 +65,12 @@ async def register(
     mail_task_data = schemas.MailTaskSchema(
         user=user_schema, body=schemas.MailBodySchema(type="verify", token=verify_token)
     )
-    bg_task.add_task(user_mail_event, mail_task_data)
+    # Письмо отправит воркер очереди, ответ его не ждет. Задача и
+    # пользователь коммитятся в save одной транзакцией
+    await enqueue(db, MAIL_QUEUE, mail_task_data.dict(), commit=False)
+
+    # save user to db
+    await user.save(db=db)
 
     return user_schema
 
@@ -98,6 +105,50 @@ async def login(
     return {"access_token": token_pair.access.token, "token_type": "bearer"}
 
 
+@router.post(
+    "/refresh/",
+    tags=['auth'],
+    response_model=schemas.TokenScheme,
+    summary="Обновление токенов",
+)
+async def refresh(
+    response: Response,
+    refresh: str | None = Cookie(default=None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Новая пара токенов по refresh-токену из cookie, без пароля.
+    Refresh-токен действует один раз: повторное использование отзывает
+    все токены, полученные от этого входа"""
+    if not refresh:
+        raise AuthFailedException()
+
+    token_pair = await rotate_refresh_token(db, refresh)
+
+    add_refresh_token_cookie(response=response, token=token_pair.refresh.token)
+
+    return {"access_token": token_pair.access.token, "token_type": "bearer"}
+
+
+@router.post(
+    "/logout/",
+    tags=['auth'],
+    response_model=schemas.SuccessResponseScheme,
+    summary="Выход",
+)
+async def logout(
+    response: Response,
+    refresh: str | None = Cookie(default=None),
+    db: AsyncSession = Depends(get_db),
+):
+    """Отзывает refresh- и access-токены, полученные от этого входа"""
+    if not refresh:
+        raise AuthFailedException()
+
+    await revoke_token_family(db, refresh)
+    response.delete_cookie(key="refresh", httponly=True)
+    return {"msg": "Successfully logged out"}
+
+
 @router.get(
     "/verify/",
     tags=['auth'],
@@ -1,14 +1,40 @@
+from datetime import datetime
 from uuid import UUID
-from typing import List, Tuple
+from typing import AsyncIterator, Iterable, List, NamedTuple, Sequence, Tuple
 
-from sqlalchemy import select, exists
-from sqlalchemy.orm import joinedload
+from sqlalchemy import (
+    Row,
+    and_,
+    case,
+    delete,
+    func,
+    select,
+    exists,
+    or_,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.orm import aliased
 
-from src.auth.models import User
+from src.auth.models import User, user_private_chats, user_public_chats
+from src.chats.events import membership_changed
 from src.chats.exceptions import GetPrivateChatException
-from src.chats.models import Conversation, PrivateChat, PublicChat
+from src.chats.models import (
+    ArchivedMessage,
+    Conversation,
+    ConversationRead,
+    Message,
+    PrivateChat,
+    PublicChat,
+    RetentionPolicy,
+)
+from src.chats.search import SearchHit, find_messages, parse_query
+from src.core.metrics import db_crud_duration, timed
+from src.database.upsert import dialect_insert
 
 
+@timed(db_crud_duration)
 async def create_private_chat_crud(
     db, users: List[User]
 ) -> Tuple[PrivateChat, Conversation]:
@@ -20,18 +46,29 @@ async def create_private_chat_crud(
     new_chat.users.extend(users)
     db.add(new_chat)
     await db.commit()
+    await membership_changed([user.id for user in users], new_chat.id)
     return new_chat, new_conversation
 
 
+@timed(db_crud_duration)
 async def users_private_chat_exists(db, users: List[User]) -> bool:
     if len(users) != 2:
         raise GetPrivateChatException("Users length must be equals 2")
 
     user1, user2 = users
+    # Ищем общий чат по индексам таблицы связей, не перебирая все чаты
+    user1_chats = user_private_chats.alias()
+    user2_chats = user_private_chats.alias()
     subquery = (
-        select(PrivateChat.id)
-        .filter(PrivateChat.users.any(id=user1.id))
-        .filter(PrivateChat.users.any(id=user2.id))
+        select(user1_chats.c.private_chat_id)
+        .join(
+            user2_chats,
+            user2_chats.c.private_chat_id == user1_chats.c.private_chat_id,
+        )
+        .where(
+            user1_chats.c.user_id == user1.id,
+            user2_chats.c.user_id == user2.id,
+        )
         .limit(1)
     )
 
@@ -42,6 +79,7 @@ async def users_private_chat_exists(db, users: List[User]) -> bool:
     return exists_
 
 
+@timed(db_crud_duration)
 async def public_chat_exists(db, name: str) -> PublicChat:
     result = await db.execute(
         select(exists().where(PublicChat.name == name))
@@ -49,6 +87,7 @@ async def public_chat_exists(db, name: str) -> PublicChat:
     return result.scalars().first()
 
 
+@timed(db_crud_duration)
 async def create_public_chat_crud(
     db, name: str, owner_id: UUID
 ) -> Tuple[PublicChat, Conversation]:
@@ -67,18 +106,510 @@ async def create_public_chat_crud(
     return new_public_chat, new_conversation
 
 
-async def get_public_chat_by_uuid(db, chat_id: UUID) -> PublicChat:
-    public_chat = await db.execute(
-        select(PublicChat)
-        .options(joinedload(PublicChat.users))
-        .where(PublicChat.id == chat_id)
+class PublicChatInfo(NamedTuple):
+    id: UUID
+    name: str
+    owner_id: UUID
+
+
+@timed(db_crud_duration)
+async def get_public_chat_info(db, chat_id: UUID) -> PublicChatInfo | None:
+    """Публичный чат без участников и identity map"""
+    table = PublicChat.__table__
+    result = await db.execute(
+        select(table.c.id, table.c.name, table.c.owner_id)
+        .where(table.c.id == chat_id)
     )
-    return public_chat.scalars().first()
+    row = result.first()
+    return None if row is None else PublicChatInfo._make(row)
 
 
+@timed(db_crud_duration)
+async def is_public_chat_member(db, chat_id: UUID, user_id: UUID) -> bool:
+    """Поиск по первичному ключу user_public_chats, участники чата
+    не загружаются"""
+    result = await db.execute(
+        select(exists().where(
+            user_public_chats.c.user_id == user_id,
+            user_public_chats.c.public_chat_id == chat_id,
+        ))
+    )
+    return result.scalar()
+
+
+@timed(db_crud_duration)
 async def enjoy_user_to_public_chat(
-    db, public_chat: PublicChat, current_user: User
+    db, chat_id: UUID, user_id: UUID
+) -> bool:
+    """Добавляет пользователя в чат. False, если он уже участник"""
+    result = await db.execute(
+        dialect_insert(db, user_public_chats)
+        .values(user_id=user_id, public_chat_id=chat_id)
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    if not result.rowcount:
+        return False
+    await membership_changed([user_id], chat_id)
+    return True
+
+
+class ChatMember(NamedTuple):
+    user_id: UUID
+    email: str
+
+
+@timed(db_crud_duration)
+async def list_public_chat_members(
+    db, chat_id: UUID, after: UUID | None = None, limit: int = 100,
+) -> Tuple[List[ChatMember], bool]:
+    """Участники чата по возрастанию user_id, страница - после after"""
+    query = (
+        select(user_public_chats.c.user_id, User.email)
+        .join(User, User.id == user_public_chats.c.user_id)
+        .where(user_public_chats.c.public_chat_id == chat_id)
+        .order_by(user_public_chats.c.user_id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(user_public_chats.c.user_id > after)
+    rows = (await db.execute(query)).all()
+    return [ChatMember._make(row) for row in rows[:limit]], len(rows) > limit
+
+
+@timed(db_crud_duration)
+async def search_messages(
+    db, user_id: UUID, query: str, conversation_id: UUID | None = None,
+    limit: int = 20, offset: int = 0,
+) -> Tuple[List[SearchHit], bool]:
+    """Ищет сообщения в доступных пользователю диалогах.
+
+    Доступ к conversation_id проверяет вызывающий код.
+    Возвращает страницу совпадений и признак следующей страницы.
+    """
+    terms = parse_query(query)
+    if not terms:
+        return [], False
+
+    # Диалог каждого совпадения проверяется по первичному ключу:
+    # комнаты публичных чатов открыты всем, приватные - участникам
+    visible = exists().where(
+        Conversation.id == Message.conversation_id,
+        or_(
+            Conversation.public_chat_id.is_not(None),
+            Conversation.private_chat_id.in_(
+                select(user_private_chats.c.private_chat_id)
+                .where(user_private_chats.c.user_id == user_id)
+            ),
+        ),
+    )
+    hits = await find_messages(
+        db, terms, conversation_id, visible, limit + 1, offset
+    )
+    return hits[:limit], len(hits) > limit
+
+
+class ConversationSummary(NamedTuple):
+    conversation_id: UUID
+    public_chat_id: UUID | None
+    private_chat_id: UUID | None
+    title: str | None
+    last_message_at: datetime | None
+    unread_count: int
+    last_message_id: UUID | None
+    last_message_content: str | None
+    last_message_user_id: UUID | None
+
+
+@timed(db_crud_duration)
+async def list_conversations(
+    db, user_id: UUID, limit: int = 50, offset: int = 0
+) -> Tuple[List[ConversationSummary], bool]:
+    """Диалоги пользователя, недавно активные первыми.
+
+    Последнее сообщение и число непрочитанных берутся из полей диалога
+    и курсора чтения, сообщения диалогов не перебираются.
+    """
+    memberships = union_all(
+        select(Conversation.id.label("conversation_id"))
+        .join(
+            user_private_chats,
+            user_private_chats.c.private_chat_id
+            == Conversation.private_chat_id,
+        )
+        .where(user_private_chats.c.user_id == user_id),
+        select(Conversation.id)
+        .join(
+            user_public_chats,
+            user_public_chats.c.public_chat_id == Conversation.public_chat_id,
+        )
+        .where(user_public_chats.c.user_id == user_id),
+    ).subquery()
+
+    # Название приватного чата - email собеседника
+    peer = aliased(user_private_chats)
+    peer_email = (
+        select(User.email)
+        .join(peer, peer.c.user_id == User.id)
+        .where(
+            peer.c.private_chat_id == Conversation.private_chat_id,
+            peer.c.user_id != user_id,
+        )
+        .limit(1)
+        .scalar_subquery()
+    )
+    statement = (
+        select(
+            Conversation.id,
+            Conversation.public_chat_id,
+            Conversation.private_chat_id,
+            func.coalesce(PublicChat.name, peer_email),
+            Conversation.last_message_at,
+            Conversation.message_count
+            - func.coalesce(ConversationRead.read_count, 0),
+            Message.id,
+            Message.content,
+            Message.user_id,
+        )
+        .select_from(memberships)
+        .join(Conversation, Conversation.id == memberships.c.conversation_id)
+        .outerjoin(PublicChat, PublicChat.id == Conversation.public_chat_id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .outerjoin(
+            ConversationRead,
+            and_(
+                ConversationRead.user_id == user_id,
+                ConversationRead.conversation_id == Conversation.id,
+            ),
+        )
+        .order_by(
+            Conversation.last_message_at.desc().nulls_last(), Conversation.id
+        )
+        .limit(limit + 1)
+        .offset(offset)
+    )
+    rows = (await db.execute(statement)).all()
+    summaries = [ConversationSummary(*row) for row in rows[:limit]]
+    return summaries, len(rows) > limit
+
+
+class ConversationRetention(NamedTuple):
+    conversation_id: UUID
+    max_age_days: int | None
+    max_count: int | None
+
+
+@timed(db_crud_duration)
+async def list_retention_policies(
+    db, after: UUID = UUID(int=0), limit: int = 1000,
+    all_conversations: bool = False,
+) -> List[ConversationRetention]:
+    """Страница диалогов с id больше after и их политики хранения.
+
+    Без all_conversations - только диалоги с собственной политикой,
+    иначе все диалоги (действует глобальная политика).
+    """
+    if all_conversations:
+        statement = select(
+            Conversation.id,
+            RetentionPolicy.max_age_days,
+            RetentionPolicy.max_count,
+        ).outerjoin(
+            RetentionPolicy,
+            RetentionPolicy.conversation_id == Conversation.id,
+        )
+        key = Conversation.id
+    else:
+        statement = select(
+            RetentionPolicy.conversation_id,
+            RetentionPolicy.max_age_days,
+            RetentionPolicy.max_count,
+        )
+        key = RetentionPolicy.conversation_id
+    rows = await db.execute(
+        statement.where(key > after).order_by(key).limit(limit)
+    )
+    return [ConversationRetention(*row) for row in rows]
+
+
+@timed(db_crud_duration)
+async def set_retention_policy(
+    db, conversation_id: UUID,
+    max_age_days: int | None, max_count: int | None,
 ) -> None:
-    public_chat.users.append(current_user)
-    db.add(public_chat)
+    """Задает политику диалога; без обоих полей политика удаляется"""
+    if max_age_days is None and max_count is None:
+        await db.execute(delete(RetentionPolicy).where(
+            RetentionPolicy.conversation_id == conversation_id
+        ))
+    else:
+        statement = dialect_insert(db, RetentionPolicy).values(
+            conversation_id=conversation_id,
+            max_age_days=max_age_days,
+            max_count=max_count,
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[RetentionPolicy.conversation_id],
+            set_={
+                "max_age_days": statement.excluded.max_age_days,
+                "max_count": statement.excluded.max_count,
+            },
+        ))
     await db.commit()
+
+
+@timed(db_crud_duration)
+async def retention_cutoff(
+    db, conversation_id: UUID,
+    older_than: datetime | None, keep_count: int | None,
+):
+    """Ключ (timestamp, id), сообщения до которого уходят в архив, или
+    None, если архивировать нечего.
+
+    Старше older_than или не среди keep_count последних. Последнее
+    сообщение диалога остается всегда: его показывает список диалогов.
+    """
+    async def nth_newest(offset: int):
+        result = await db.execute(
+            select(Message.timestamp, Message.id)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .offset(offset)
+            .limit(1)
+        )
+        row = result.first()
+        return tuple(row) if row is not None else None
+
+    cutoffs = []
+    if keep_count:
+        kept = await nth_newest(keep_count - 1)
+        if kept is not None:
+            cutoffs.append(kept)
+    if older_than is not None:
+        last = await nth_newest(0)
+        if last is not None:
+            cutoffs.append(min(last, (older_than, UUID(int=0))))
+    return max(cutoffs, default=None)
+
+
+@timed(db_crud_duration)
+async def archive_messages(
+    db, conversation_id: UUID, cutoff: tuple, limit: int
+) -> int:
+    """Переносит до limit самых старых сообщений диалога с ключом меньше
+    cutoff в архив одной транзакцией, возвращает их число"""
+    message_key = tuple_(Message.timestamp, Message.id)
+    result = await db.execute(
+        select(Message.id)
+        .where(
+            Message.conversation_id == conversation_id,
+            message_key < tuple_(*cutoff),
+        )
+        .order_by(Message.timestamp, Message.id)
+        .limit(limit)
+    )
+    ids = result.scalars().all()
+    if not ids:
+        return 0
+
+    columns = ("id", "content", "timestamp", "user_id", "conversation_id")
+    # Повторный перенос (другой воркер, прерванный запуск) ничего не ломает
+    await db.execute(
+        dialect_insert(db, ArchivedMessage)
+        .from_select(
+            columns,
+            select(*(getattr(Message, name) for name in columns))
+            .where(Message.id.in_(ids)),
+        )
+        .on_conflict_do_nothing(index_elements=[ArchivedMessage.id])
+    )
+    await db.execute(delete(Message).where(Message.id.in_(ids)))
+    await db.commit()
+    return len(ids)
+
+
+class ConversationExport(NamedTuple):
+    id: UUID
+    is_group: bool
+    public_chat_id: UUID | None
+    private_chat_id: UUID | None
+
+
+# Колонки сообщения в выгрузке, в этом порядке их отдает
+# stream_export_messages
+EXPORT_MESSAGE_COLUMNS = ("id", "conversation_id", "user_id", "timestamp", "content")
+
+
+@timed(db_crud_duration)
+async def export_conversations(
+    db, conversation_id: UUID | None = None, chat_id: UUID | None = None,
+    user_id: UUID | None = None,
+) -> List[ConversationExport]:
+    """Диалоги для выгрузки: один диалог, все комнаты публичного или
+    приватного чата или все диалоги пользователя"""
+    columns = (
+        Conversation.id,
+        Conversation.is_group,
+        Conversation.public_chat_id,
+        Conversation.private_chat_id,
+    )
+    if conversation_id is not None:
+        statement = select(*columns).where(Conversation.id == conversation_id)
+    elif chat_id is not None:
+        statement = union_all(
+            select(*columns).where(Conversation.public_chat_id == chat_id),
+            select(*columns).where(Conversation.private_chat_id == chat_id),
+        )
+    else:
+        statement = union_all(
+            select(*columns)
+            .join(
+                user_private_chats,
+                user_private_chats.c.private_chat_id
+                == Conversation.private_chat_id,
+            )
+            .where(user_private_chats.c.user_id == user_id),
+            select(*columns)
+            .join(
+                user_public_chats,
+                user_public_chats.c.public_chat_id
+                == Conversation.public_chat_id,
+            )
+            .where(user_public_chats.c.user_id == user_id),
+        )
+    rows = await db.execute(statement)
+    return [ConversationExport(*row) for row in rows]
+
+
+@timed(db_crud_duration)
+async def stream_export_messages(
+    db, conversation_id: UUID, chunk_size: int = 5000,
+) -> AsyncIterator[Sequence[Row]]:
+    """Сообщения диалога, сначала архив, затем messages, в хронологическом
+    порядке пачками строк с серверного курсора"""
+    for model in (ArchivedMessage, Message):
+        result = await db.stream(
+            select(*(getattr(model, name) for name in EXPORT_MESSAGE_COLUMNS))
+            .where(model.conversation_id == conversation_id)
+            .order_by(model.timestamp, model.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions(chunk_size):
+            yield partition
+
+
+@timed(db_crud_duration)
+async def import_conversation(db, conversation: ConversationExport) -> bool:
+    """Создает диалог из выгрузки, если его еще нет. False, если диалога
+    нет и создать его нельзя: нет чата или у приватного чата уже есть
+    другой диалог"""
+    result = await db.execute(
+        select(exists().where(Conversation.id == conversation.id))
+    )
+    if result.scalar():
+        return True
+
+    if conversation.public_chat_id is not None:
+        chat_exists = exists().where(
+            PublicChat.id == conversation.public_chat_id
+        )
+    elif conversation.private_chat_id is not None:
+        chat_exists = exists().where(
+            PrivateChat.id == conversation.private_chat_id
+        ) & ~exists().where(
+            Conversation.private_chat_id == conversation.private_chat_id
+        )
+    else:
+        return False
+    if not (await db.execute(select(chat_exists))).scalar():
+        return False
+
+    await db.execute(
+        dialect_insert(db, Conversation).values(**conversation._asdict())
+    )
+    return True
+
+
+@timed(db_crud_duration)
+async def existing_user_ids(db, user_ids: Iterable[UUID]) -> set[UUID]:
+    result = await db.execute(select(User.id).where(User.id.in_(user_ids)))
+    return set(result.scalars())
+
+
+@timed(db_crud_duration)
+async def import_messages(db, rows: List[dict]) -> int:
+    """Вставляет сообщения одним многострочным INSERT без коммита.
+
+    Сообщения, которые уже есть в messages или в архиве, пропускаются,
+    поэтому повторная загрузка той же выгрузки ничего не меняет.
+    Возвращает число вставленных.
+    """
+    result = await db.execute(
+        select(ArchivedMessage.id)
+        .where(ArchivedMessage.id.in_([row["id"] for row in rows]))
+    )
+    archived = set(result.scalars())
+    if archived:
+        rows = [row for row in rows if row["id"] not in archived]
+    if not rows:
+        return 0
+
+    # Таблица, а не модель: без обработки строк ORM. Запрос кешируется,
+    # параметры SQLAlchemy собирает в многострочные VALUES
+    # (insertmanyvalues), RETURNING отдает только вставленные строки
+    messages = Message.__table__
+    result = await db.execute(
+        dialect_insert(db, messages)
+        .on_conflict_do_nothing(index_elements=[messages.c.id])
+        .returning(messages.c.id),
+        rows,
+        execution_options={"insertmanyvalues_page_size": len(rows)},
+    )
+    return len(result.all())
+
+
+@timed(db_crud_duration)
+async def refresh_conversation_stats(db, conversation_id: UUID) -> None:
+    """Поля диалога для списка диалогов после загрузки сообщений.
+
+    message_count не меньше числа сообщений диалога с архивом, последнее
+    сообщение берется из messages и переносится только вперед.
+    """
+    total = 0
+    for model in (Message, ArchivedMessage):
+        result = await db.execute(
+            select(func.count())
+            .select_from(model)
+            .where(model.conversation_id == conversation_id)
+        )
+        total += result.scalar()
+
+    values = {
+        "message_count": case(
+            (Conversation.message_count < total, total),
+            else_=Conversation.message_count,
+        ),
+    }
+    result = await db.execute(
+        select(Message.timestamp, Message.id)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(1)
+    )
+    last = result.first()
+    if last is not None:
+        newer = (
+            Conversation.last_message_at.is_(None)
+            | (Conversation.last_message_at < last.timestamp)
+        )
+        values["last_message_id"] = case(
+            (newer, last.id), else_=Conversation.last_message_id
+        )
+        values["last_message_at"] = case(
+            (newer, last.timestamp), else_=Conversation.last_message_at
+        )
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(**values)
+    )
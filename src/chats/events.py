@@ -0,0 +1,20 @@
+from typing import Awaitable, Callable, List
+from uuid import UUID
+
+MembershipListener = Callable[[List[UUID], UUID], Awaitable[None]]
+
+_membership_listeners: List[MembershipListener] = []
+
+
+def on_membership_changed(listener: MembershipListener) -> MembershipListener:
+    """Регистрирует обработчик изменения состава чата.
+
+    Обработчик получает id затронутых пользователей и id чата.
+    """
+    _membership_listeners.append(listener)
+    return listener
+
+
+async def membership_changed(user_ids: List[UUID], chat_id: UUID) -> None:
+    for listener in _membership_listeners:
+        await listener(user_ids, chat_id)
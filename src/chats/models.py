@@ -1,11 +1,12 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import ForeignKey, Text
+from typing import NamedTuple, Sequence
+from sqlalchemy import ForeignKey, Index, Table, Text, select
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
+from src.auth.cache import user_cache
 from src.auth.models import User, user_private_chats, user_public_chats
-from src.core.jwt import cached_get_user_by_uuid
 from src.database.database import Base
 
 
@@ -50,35 +51,117 @@ class PrivateChat(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # История комнаты: WHERE conversation_id ORDER BY timestamp, id
+        Index(
+            "ix_messages_conversation_id_timestamp_id",
+            "conversation_id", "timestamp", "id",
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         primary_key=True, index=True, default=uuid.uuid4
     )
     content: Mapped[str] = mapped_column(Text)
-    timestamp: Mapped[datetime] = mapped_column(server_default=func.datetime('now'))
+    timestamp: Mapped[datetime] = mapped_column(server_default=func.now())
 
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"))
     conversation_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("conversations.id"))
 
     conversation: Mapped["Conversation"] = relationship(back_populates="messages")
 
-    async def to_dict(self, db):
+    def serialize(self, user_email: str | None) -> dict:
         return {
             "id": str(self.id),
             "content": self.content,
             "timestamp": str(self.timestamp),
             "user_id": str(self.user_id),
-            "user_email": getattr(
-                await cached_get_user_by_uuid(db, self.user_id),
-                'email', None
-            ),
+            "user_email": user_email,
             "conversation_id": str(self.conversation_id),
         }
 
+    @classmethod
+    async def bulk_to_dict(
+        cls, db, messages: Sequence["Message | MessageRow"]
+    ) -> list[dict]:
+        """Сериализует сообщения, получая авторов одним запросом"""
+        emails = await cls.author_emails(db, messages)
+        return [
+            message.serialize(emails.get(message.user_id))
+            for message in messages
+        ]
+
+    @classmethod
+    async def author_emails(
+        cls, db, messages: Sequence["Message | MessageRow"]
+    ) -> dict[uuid.UUID, str]:
+        emails = {}
+        missing = set()
+        for user_id in {message.user_id for message in messages}:
+            snapshot = user_cache.get(user_id)
+            if snapshot is None:
+                missing.add(user_id)
+            else:
+                emails[user_id] = snapshot["email"]
+
+        if missing:
+            result = await db.execute(
+                select(User.id, User.email).where(User.id.in_(missing))
+            )
+            emails.update(result.tuples().all())
+        return emails
+
+    async def to_dict(self, db):
+        return (await self.bulk_to_dict(db, [self]))[0]
+
     def __repr__(self):
         return f"Message(id={self.id}, timestamp={self.timestamp})"
 
 
+class ArchivedMessage(Base):
+    """Сообщения, перенесенные из messages по политике хранения,
+    см. src/chats/retention.py"""
+    __tablename__ = "messages_archive"
+    __table_args__ = (
+        Index(
+            "ix_messages_archive_conversation_id_timestamp_id",
+            "conversation_id", "timestamp", "id",
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    content: Mapped[str] = mapped_column(Text)
+    timestamp: Mapped[datetime]
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"))
+    conversation_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("conversations.id")
+    )
+    archived_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+    # История отдает архивные сообщения вместе с обычными
+    serialize = Message.serialize
+
+    def __repr__(self):
+        return f"ArchivedMessage(id={self.id}, timestamp={self.timestamp})"
+
+
+class MessageRow(NamedTuple):
+    """Сообщение из messages или messages_archive для чтения: строка
+    Core-запроса без ORM-объекта и identity map"""
+    id: uuid.UUID
+    content: str
+    timestamp: datetime
+    user_id: uuid.UUID
+    conversation_id: uuid.UUID
+
+    serialize = Message.serialize
+
+    @classmethod
+    def columns(cls, table: Table) -> list:
+        """Столбцы для select() по таблице messages или messages_archive"""
+        return [table.c[field] for field in cls._fields]
+
+
 class Conversation(Base):
     __tablename__ = "conversations"
 
@@ -89,22 +172,69 @@ class Conversation(Base):
     messages: Mapped[list["Message"]] = relationship(back_populates="conversation")
 
     public_chat_id: Mapped[uuid.UUID] = mapped_column(
-        ForeignKey("public_chats.id"), nullable=True
+        ForeignKey("public_chats.id"), nullable=True, index=True
     )
     public_chat: Mapped["PublicChat"] = relationship(
         back_populates="conversations",
     )
 
     private_chat_id: Mapped[uuid.UUID] = mapped_column(
-        ForeignKey("private_chats.id"), nullable=True
+        ForeignKey("private_chats.id"), nullable=True, index=True
     )
     private_chats: Mapped["PrivateChat"] = relationship(
         back_populates="conversation", uselist=False,
 
     )
 
+    # Для списка диалогов, обновляются при записи сообщений.
+    # message_count - номер последнего сообщения, не уменьшается
+    last_message_id: Mapped[uuid.UUID | None] = mapped_column(nullable=True)
+    last_message_at: Mapped[datetime | None] = mapped_column(nullable=True)
+    message_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
     def __str__(self):
         return f"Диалог {self.id}"
 
     def __repr__(self):
         return f"Conversation(id={self.id}, is_group={self.is_group})"
+
+
+class ConversationRead(Base):
+    """Курсор чтения: сколько сообщений диалога пользователь прочитал"""
+    __tablename__ = "conversation_reads"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("users.id"), primary_key=True
+    )
+    conversation_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("conversations.id"), primary_key=True, index=True
+    )
+    last_read_message_id: Mapped[uuid.UUID | None] = mapped_column(
+        nullable=True
+    )
+    read_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    def __repr__(self):
+        return (
+            f"ConversationRead(user_id={self.user_id}, "
+            f"conversation_id={self.conversation_id}, "
+            f"read_count={self.read_count})"
+        )
+
+
+class RetentionPolicy(Base):
+    """Сколько хранить сообщения диалога в messages. Пустое поле -
+    глобальная настройка, 0 - без ограничения"""
+    __tablename__ = "retention_policies"
+
+    conversation_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("conversations.id"), primary_key=True
+    )
+    max_age_days: Mapped[int | None] = mapped_column(nullable=True)
+    max_count: Mapped[int | None] = mapped_column(nullable=True)
+
+    def __repr__(self):
+        return (
+            f"RetentionPolicy(conversation_id={self.conversation_id}, "
+            f"max_age_days={self.max_age_days}, max_count={self.max_count})"
+        )
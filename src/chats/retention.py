@@ -0,0 +1,198 @@
+"""Хранение истории: перенос старых сообщений в архив.
+
+Глобальная политика задается MESSAGE_RETENTION_MAX_AGE_DAYS и
+MESSAGE_RETENTION_MAX_COUNT, политика диалога (таблица retention_policies)
+переопределяет их по полям; 0 - без ограничения. Сообщения старше срока
+или сверх числа последних переносятся из messages в messages_archive
+пачками по MESSAGE_RETENTION_BATCH_SIZE, каждая пачка - отдельная
+транзакция. История (get_conversation_messages) дочитывает архив, когда
+страницы доходят до начала messages. Поиск ищет только в messages.
+
+Фоновая задача запускается вместе с приложением раз в
+MESSAGE_RETENTION_INTERVAL_SECONDS, вручную:
+
+    python -m src.chats.retention run
+    python -m src.chats.retention stats
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import text
+
+from src.chats import crud
+from src.core import config, metrics
+from src.core.logging import logger
+from src.database.database import SessionFactory
+
+POLICY_PAGE_SIZE = 1000
+
+archived_messages = metrics.counter(
+    "messages_archived", "Messages moved to the archive by retention",
+)
+
+
+class RetentionStats(NamedTuple):
+    conversations: int
+    archived: int
+    seconds: float
+
+
+def _effective(value: int | None, default: int) -> int:
+    return default if value is None else value
+
+
+async def apply_retention(
+    session_factory, batch_size: int = config.MESSAGE_RETENTION_BATCH_SIZE,
+    max_age_days: int = config.MESSAGE_RETENTION_MAX_AGE_DAYS,
+    max_count: int = config.MESSAGE_RETENTION_MAX_COUNT,
+    now: datetime | None = None,
+) -> RetentionStats:
+    """Один проход по всем диалогам с политикой хранения"""
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    conversations = archived = 0
+    after = UUID(int=0)
+    while True:
+        async with session_factory() as db:
+            page = await crud.list_retention_policies(
+                db, after, POLICY_PAGE_SIZE,
+                all_conversations=bool(max_age_days or max_count),
+            )
+        if not page:
+            break
+        after = page[-1].conversation_id
+
+        for policy in page:
+            age = _effective(policy.max_age_days, max_age_days)
+            count = _effective(policy.max_count, max_count)
+            if not age and not count:
+                continue
+            moved = await _archive_conversation(
+                session_factory, policy.conversation_id,
+                now - timedelta(days=age) if age else None, count or None,
+                batch_size,
+            )
+            if moved:
+                conversations += 1
+                archived += moved
+    return RetentionStats(
+        conversations, archived, time.perf_counter() - started
+    )
+
+
+async def _archive_conversation(
+    session_factory, conversation_id, older_than, keep_count, batch_size
+) -> int:
+    async with session_factory() as db:
+        cutoff = await crud.retention_cutoff(
+            db, conversation_id, older_than, keep_count
+        )
+        if cutoff is None:
+            return 0
+        total = 0
+        while True:
+            moved = await crud.archive_messages(
+                db, conversation_id, cutoff, batch_size
+            )
+            total += moved
+            archived_messages.inc(moved)
+            if moved < batch_size:
+                return total
+            # Запись в SQLite блокирует базу, даем пройти остальным
+            await asyncio.sleep(0)
+
+
+class RetentionJob:
+    """Запускает apply_retention каждые interval секунд"""
+
+    def __init__(self, session_factory, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                stats = await apply_retention(self.session_factory)
+                if stats.archived:
+                    logger.info(
+                        "Archived %s messages in %s conversations in %.1fs",
+                        stats.archived, stats.conversations, stats.seconds,
+                    )
+            except Exception:
+                logger.exception("Retention pass failed")
+            await asyncio.sleep(self.interval)
+
+
+TABLES = ("messages", "messages_archive")
+
+
+async def table_stats(db) -> dict[str, dict]:
+    """Число строк и место на диске таблиц истории вместе с индексами"""
+    stats = {}
+    dialect = db.bind.dialect.name
+    for table in TABLES:
+        rows = (await db.execute(text(f"SELECT count(*) FROM {table}"))).scalar()
+        if dialect == "postgresql":
+            size = (await db.execute(text(
+                "SELECT pg_total_relation_size(:table)"
+            ), {"table": table})).scalar()
+        else:
+            # dbstat есть в сборках SQLite с SQLITE_ENABLE_DBSTAT_VTAB
+            size = (await db.execute(text(
+                "SELECT sum(pgsize) FROM dbstat WHERE name IN ("
+                "SELECT name FROM sqlite_schema WHERE tbl_name = :table)"
+            ), {"table": table})).scalar()
+        stats[table] = {"rows": rows, "bytes": size}
+    if dialect == "sqlite":
+        page_size, page_count, free = [
+            (await db.execute(text(f"PRAGMA {pragma}"))).scalar()
+            for pragma in ("page_size", "page_count", "freelist_count")
+        ]
+        # Освободившиеся страницы база переиспользует, файл
+        # уменьшает только VACUUM
+        stats["file"] = {
+            "bytes": page_size * page_count, "free_bytes": page_size * free,
+        }
+    return stats
+
+
+retention_job = RetentionJob(
+    SessionFactory, config.MESSAGE_RETENTION_INTERVAL_SECONDS
+)
+
+
+async def _main(command: str) -> None:
+    if command == "run":
+        stats = await apply_retention(SessionFactory)
+        rate = stats.archived / stats.seconds if stats.seconds else 0
+        print(f"Archived {stats.archived} messages in {stats.conversations} "
+              f"conversations, {stats.seconds:.1f}s ({rate:,.0f} msg/s)")
+    elif command == "stats":
+        async with SessionFactory() as db:
+            for name, values in (await table_stats(db)).items():
+                print(name, " ".join(f"{k}={v}" for k, v in values.items()))
+    else:
+        raise SystemExit("usage: python -m src.chats.retention run|stats")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else ""))
@@ -1,5 +1,7 @@
+from datetime import datetime
+from typing import List
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class CreatePrivateChatUser(BaseModel):
@@ -13,3 +15,81 @@ class ChatRoomCreate(BaseModel):
 class ChatConversationResponse(BaseModel):
     chat_id: UUID
     conversation_id: UUID
+
+
+class ChatMemberSchema(BaseModel):
+    user_id: UUID
+    email: str
+
+
+class ChatMembersResponse(BaseModel):
+    members: List[ChatMemberSchema]
+    has_more: bool
+
+
+class MessageSchema(BaseModel):
+    id: UUID
+    content: str
+    timestamp: datetime
+    user_id: UUID
+    user_email: str | None
+    conversation_id: UUID
+
+
+class MessageHistoryResponse(BaseModel):
+    messages: List[MessageSchema]
+    has_more: bool
+
+
+class OnlineMembersResponse(BaseModel):
+    conversation_id: UUID
+    online: List[UUID]
+
+
+class MessageSearchHit(BaseModel):
+    id: UUID
+    conversation_id: UUID
+    user_id: UUID
+    user_email: str | None
+    timestamp: datetime
+    snippet: str
+
+
+class MessageSearchResponse(BaseModel):
+    results: List[MessageSearchHit]
+    has_more: bool
+
+
+class LastMessageSchema(BaseModel):
+    id: UUID
+    content: str
+    timestamp: datetime
+    user_id: UUID
+
+
+class ConversationSummarySchema(BaseModel):
+    conversation_id: UUID
+    chat_id: UUID
+    is_group: bool
+    title: str | None
+    last_message: LastMessageSchema | None
+    unread_count: int
+
+
+class ConversationListResponse(BaseModel):
+    conversations: List[ConversationSummarySchema]
+    has_more: bool
+
+
+class RetentionPolicySchema(BaseModel):
+    """Пустое поле - глобальная настройка, 0 - без ограничения"""
+    max_age_days: int | None = Field(default=None, ge=0)
+    max_count: int | None = Field(default=None, ge=0)
+
+
+class ImportStatsResponse(BaseModel):
+    read: int
+    conversations: int
+    inserted: int
+    skipped: int
+    seconds: float
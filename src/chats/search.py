@@ -0,0 +1,309 @@
+"""Полнотекстовый поиск по сообщениям.
+
+SQLite: FTS5-таблица messages_fts с внешним содержимым (content=messages),
+ключ - колонка messages.seq. rowid сообщений для этого не годится: у
+таблицы с UUID-ключом VACUUM может их перенумеровать. seq назначает
+триггер при вставке (max(seq) + 1). PostgreSQL: сохраняемая колонка
+content_tsv (tsvector) с GIN-индексом. В обоих случаях индекс обновляется
+самой БД при каждой вставке, изменении и удалении сообщения, в том числе
+пачками из create_messages.
+
+Ищутся только сообщения в messages: перенесенные в messages_archive
+(src/chats/retention.py) удаляются из индекса и не находятся.
+
+Миграция индексирует уже записанные сообщения; если сообщения попали
+в базу в обход триггеров, индекс пересобирается командой:
+
+    python -m src.chats.search backfill
+"""
+import asyncio
+import html
+import re
+import sys
+import unicodedata
+from datetime import datetime
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import (
+    DDL,
+    column,
+    event,
+    func,
+    literal_column,
+    select,
+    table,
+    text,
+)
+
+from src.chats.models import Message
+
+FTS_TABLE = "messages_fts"
+SEQ_COLUMN = "seq"
+TS_COLUMN = "content_tsv"
+TS_CONFIG = "simple"
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_TOKENS = 24
+
+# conversation_id тоже индексируется (одно слово - hex id диалога):
+# поиск внутри диалога пересекает два списка совпадений в самом FTS5,
+# а не перебирает все сообщения с частым словом
+SQLITE_SEQ_DDL = (
+    f"ALTER TABLE messages ADD COLUMN {SEQ_COLUMN} INTEGER",
+    f"CREATE UNIQUE INDEX ix_messages_{SEQ_COLUMN} ON messages ({SEQ_COLUMN})",
+)
+# Обновление seq в триггере вставки не трогает проиндексированные
+# колонки, поэтому триггер изменения его не видит
+SQLITE_FTS_DDL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "content, conversation_id, content='messages', "
+    f"content_rowid='{SEQ_COLUMN}', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON messages BEGIN "
+    f"UPDATE messages SET {SEQ_COLUMN} = ("
+    f"SELECT coalesce(max({SEQ_COLUMN}), 0) + 1 FROM messages"
+    ") WHERE rowid = new.rowid; "
+    f"INSERT INTO {FTS_TABLE}(rowid, content, conversation_id) "
+    f"SELECT {SEQ_COLUMN}, content, conversation_id FROM messages "
+    "WHERE rowid = new.rowid; "
+    "END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON messages "
+    f"WHEN old.{SEQ_COLUMN} IS NOT NULL BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, conversation_id) "
+    f"VALUES ('delete', old.{SEQ_COLUMN}, old.content, old.conversation_id); "
+    "END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF content, conversation_id "
+    f"ON messages WHEN old.{SEQ_COLUMN} IS NOT NULL BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content, conversation_id) "
+    f"VALUES ('delete', old.{SEQ_COLUMN}, old.content, old.conversation_id); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content, conversation_id) "
+    f"VALUES (new.{SEQ_COLUMN}, new.content, new.conversation_id); "
+    "END",
+)
+SQLITE_DDL = SQLITE_SEQ_DDL + SQLITE_FTS_DDL
+
+POSTGRESQL_DDL = (
+    f"ALTER TABLE messages ADD COLUMN {TS_COLUMN} tsvector "
+    f"GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', content)) STORED",
+    f"CREATE INDEX ix_messages_{TS_COLUMN} ON messages USING gin ({TS_COLUMN})",
+)
+
+# Объекты поиска не описаны в моделях, alembic не должен их удалять
+SCHEMA_OBJECTS = {
+    ("table", FTS_TABLE),
+    ("table", f"{FTS_TABLE}_data"),
+    ("table", f"{FTS_TABLE}_idx"),
+    ("table", f"{FTS_TABLE}_docsize"),
+    ("table", f"{FTS_TABLE}_config"),
+    ("column", TS_COLUMN),
+    ("column", SEQ_COLUMN),
+    ("index", f"ix_messages_{SEQ_COLUMN}"),
+    ("index", f"ix_messages_{TS_COLUMN}"),
+}
+
+# create_all (проверка планов, бенчмарки) создает поиск вместе с messages
+for _statement in SQLITE_DDL:
+    event.listen(
+        Message.__table__, "after_create",
+        DDL(_statement).execute_if(dialect="sqlite"),
+    )
+for _statement in POSTGRESQL_DDL:
+    event.listen(
+        Message.__table__, "after_create",
+        DDL(_statement).execute_if(dialect="postgresql"),
+    )
+
+
+class SearchHit(NamedTuple):
+    id: UUID
+    conversation_id: UUID
+    user_id: UUID
+    timestamp: datetime
+    snippet: str
+    rank: float
+
+
+class Term(NamedTuple):
+    text: str
+    prefix: bool
+
+
+QUERY_RE = re.compile(r"\w+\*?")
+WORD_RE = re.compile(r"\w+")
+COMBINING_RE = re.compile("[\u0300-\u036f]")
+
+
+def _fold(text: str) -> str:
+    # Как токенизатор unicode61 с remove_diacritics: регистр и диакритика
+    # не учитываются
+    return COMBINING_RE.sub("", unicodedata.normalize("NFKD", text.lower()))
+
+
+def parse_query(query: str) -> list[Term]:
+    """Слова запроса; слово с * на конце ищется по префиксу"""
+    return [
+        Term(_fold(word.rstrip("*")), word.endswith("*"))
+        for word in QUERY_RE.findall(query)
+    ]
+
+
+def _fts5_query(terms: list[Term], conversation_id: UUID | None) -> str:
+    # Каждое слово в кавычках, чтобы синтаксис FTS5 из запроса не работал
+    query = " AND ".join(
+        f'content : "{term.text}"' + ("*" if term.prefix else "")
+        for term in terms
+    )
+    if conversation_id is not None:
+        query += f' AND conversation_id : "{conversation_id.hex}"'
+    return query
+
+
+def _tsquery(terms: list[Term]) -> str:
+    return " & ".join(
+        term.text + (":*" if term.prefix else "") for term in terms
+    )
+
+
+_fts = table(FTS_TABLE, column("rowid"))
+_fts_name = literal_column(FTS_TABLE)
+_message_seq = literal_column(f"messages.{SEQ_COLUMN}")
+_content_tsv = literal_column(f"messages.{TS_COLUMN}")
+_hit_columns = (
+    Message.id, Message.conversation_id, Message.user_id, Message.timestamp,
+    Message.content,
+)
+
+
+async def find_messages(
+    db, terms: list[Term], conversation_id: UUID | None, visible,
+    limit: int, offset: int,
+) -> list[SearchHit]:
+    """Сообщения со всеми словами terms в диалоге conversation_id или, если
+    он не задан, подходящие под условие visible, по релевантности.
+
+    Ранжирует сам индекс: bm25() FTS5 в SQLite, ts_rank в PostgreSQL,
+    частоты слов берутся по всей базе. При равной оценке новые сообщения
+    выше. Страница отбирается тем же запросом (LIMIT/OFFSET).
+    """
+    if conversation_id is not None:
+        visible = Message.conversation_id == conversation_id
+
+    if db.bind.dialect.name == "postgresql":
+        tsquery = func.to_tsquery(TS_CONFIG, _tsquery(terms))
+        # Больше - релевантнее
+        score = func.ts_rank(_content_tsv, tsquery)
+        statement = (
+            select(*_hit_columns, score.label("score"))
+            .where(_content_tsv.op("@@")(tsquery), visible)
+            .order_by(score.desc())
+        )
+    else:
+        match = _fts_name.op("MATCH")(_fts5_query(terms, conversation_id))
+        # Меньше - релевантнее
+        score = func.bm25(_fts_name)
+        statement = (
+            select(*_hit_columns, (-score).label("score"))
+            .select_from(_fts.join(Message, _message_seq == _fts.c.rowid))
+            .where(match, visible)
+            .order_by(score)
+        )
+    rows = (await db.execute(
+        statement
+        .order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )).all()
+    return [
+        SearchHit(
+            row.id, row.conversation_id, row.user_id, row.timestamp,
+            _snippet(row.content, terms), row.score,
+        )
+        for row in rows
+    ]
+
+
+def _matches(word: str, term: Term) -> bool:
+    return word.startswith(term.text) if term.prefix else word == term.text
+
+
+def _snippet(content: str, terms: list[Term]) -> str:
+    """До SNIPPET_TOKENS слов вокруг первого совпадения, текст экранирован"""
+    words = [
+        (match, _fold(match.group())) for match in WORD_RE.finditer(content)
+    ]
+    found = [
+        i for i, (_, word) in enumerate(words)
+        if any(_matches(word, term) for term in terms)
+    ]
+    first = found[0] if found else 0
+    start = max(0, min(first - SNIPPET_TOKENS // 4, len(words) - SNIPPET_TOKENS))
+    window = words[start:start + SNIPPET_TOKENS]
+    if not window:
+        return html.escape(content)
+
+    begin, end = window[0][0].start(), window[-1][0].end()
+    parts = ["…" if start > 0 else html.escape(content[:begin])]
+    position = begin
+    for match, word in window:
+        if any(_matches(word, term) for term in terms):
+            parts.append(html.escape(content[position:match.start()]))
+            parts.append(
+                HIGHLIGHT_START + html.escape(match.group()) + HIGHLIGHT_END
+            )
+            position = match.end()
+    parts.append(html.escape(content[position:end]))
+    truncated = start + SNIPPET_TOKENS < len(words)
+    parts.append("…" if truncated else html.escape(content[end:]))
+    return "".join(parts)
+
+
+async def backfill(db, chunk_size: int = 50_000) -> int:
+    """Заполняет индекс сообщениями, записанными до его создания"""
+    if db.bind.dialect.name != "sqlite":
+        # Сохраняемая колонка Postgres вычисляется при добавлении
+        return 0
+
+    # Сообщения, записанные без триггера, получают seq после всех
+    # остальных. Запись блокирует базу до коммита, поэтому сообщения после
+    # last_seq добавят в индекс триггеры, а не этот цикл
+    await db.execute(text(f"""
+        UPDATE messages
+        SET {SEQ_COLUMN} = (
+            SELECT coalesce(max({SEQ_COLUMN}), 0) FROM messages
+        ) + rowid
+        WHERE {SEQ_COLUMN} IS NULL
+    """))
+    await db.execute(text(
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"
+    ))
+    last_seq = (await db.execute(text(
+        f"SELECT coalesce(max({SEQ_COLUMN}), 0) FROM messages"
+    ))).scalar()
+    count = 0
+    seq = 0
+    while seq < last_seq:
+        result = await db.execute(text(f"""
+            INSERT INTO {FTS_TABLE}(rowid, content, conversation_id)
+            SELECT {SEQ_COLUMN}, content, conversation_id FROM messages
+            WHERE {SEQ_COLUMN} > :start AND {SEQ_COLUMN} <= :end
+        """), {"start": seq, "end": min(seq + chunk_size, last_seq)})
+        count += result.rowcount
+        seq += chunk_size
+        await db.commit()
+        print(f"indexed {count} messages", file=sys.stderr)
+    return count
+
+
+async def _main(command: str) -> None:
+    from src.database.database import SessionFactory
+
+    if command != "backfill":
+        raise SystemExit("usage: python -m src.chats.search backfill")
+    async with SessionFactory() as db:
+        count = await backfill(db)
+    print(f"Indexed {count} messages")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else ""))
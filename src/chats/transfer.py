@@ -0,0 +1,272 @@
+"""Выгрузка и загрузка истории в NDJSON.
+
+Одна JSON-запись на строку. Перед сообщениями диалога идет сам диалог:
+
+    {"type": "conversation", "id": ..., "is_group": ..., "public_chat_id": ..., "private_chat_id": ...}
+    {"type": "message", "id": ..., "conversation_id": ..., "user_id": ..., "timestamp": ..., "content": ...}
+
+Выгрузка читает сообщения (архив, затем messages) с серверного курсора
+пачками по EXPORT_CHUNK_SIZE, память не зависит от размера истории.
+Загрузка вставляет сообщения многострочными INSERT по IMPORT_BATCH_SIZE
+и коммитит каждые IMPORT_TRANSACTION_ROWS строк. Пользователи и чаты не
+выгружаются: диалог создается, если есть его чат, сообщения диалогов и
+авторов, которых нет в базе, пропускаются. Сообщения с уже записанным id
+тоже пропускаются, загрузку можно повторять.
+
+    python -m src.chats.transfer export --conversation ID [-o FILE]
+    python -m src.chats.transfer export --chat ID [-o FILE]
+    python -m src.chats.transfer export --user ID [-o FILE]
+    python -m src.chats.transfer import FILE|-
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Iterable, NamedTuple
+from uuid import UUID
+
+import orjson
+
+from src.chats import crud
+from src.core import config
+from src.database.database import SessionFactory
+
+CONVERSATION = "conversation"
+MESSAGE = "message"
+MEDIA_TYPE = "application/x-ndjson"
+
+
+class ImportFormatError(ValueError):
+    """Строка выгрузки не разбирается, line - ее номер с единицы"""
+
+    def __init__(self, line: int, reason: str):
+        super().__init__(f"Line {line}: {reason}")
+        self.line = line
+
+
+class ImportStats(NamedTuple):
+    read: int
+    conversations: int
+    inserted: int
+    skipped: int
+    seconds: float
+
+
+def _dumps(record: dict) -> bytes:
+    return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+
+
+async def export_history(
+    session_factory, conversation_id: UUID | None = None,
+    chat_id: UUID | None = None, user_id: UUID | None = None,
+    chunk_size: int = config.EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """NDJSON частями: строка диалога, затем его сообщения пачками"""
+    async with session_factory() as db:
+        conversations = await crud.export_conversations(
+            db, conversation_id=conversation_id, chat_id=chat_id,
+            user_id=user_id,
+        )
+        for conversation in conversations:
+            yield _dumps({"type": CONVERSATION, **conversation._asdict()})
+            async for rows in crud.stream_export_messages(
+                db, conversation.id, chunk_size
+            ):
+                yield b"".join(
+                    _dumps({
+                        "type": MESSAGE, "id": id_,
+                        "conversation_id": conversation_id_,
+                        "user_id": user_id_, "timestamp": timestamp,
+                        "content": content,
+                    })
+                    for id_, conversation_id_, user_id_, timestamp, content
+                    in rows
+                )
+
+
+async def _records(lines: AsyncIterable[bytes] | Iterable[bytes]):
+    if isinstance(lines, AsyncIterable):
+        async for line in lines:
+            yield line
+    else:
+        for line in lines:
+            yield line
+
+
+async def split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Строки из потока байтов, например тела запроса"""
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    if tail:
+        yield tail
+
+
+def _uuid(value: str | None) -> UUID | None:
+    return UUID(value) if value else None
+
+
+def _parse_record(line: bytes) -> crud.ConversationExport | dict | None:
+    """Диалог, строка сообщения для вставки или None для другой записи"""
+    record = orjson.loads(line)
+    if record["type"] == CONVERSATION:
+        return crud.ConversationExport(
+            UUID(record["id"]), bool(record["is_group"]),
+            _uuid(record["public_chat_id"]),
+            _uuid(record["private_chat_id"]),
+        )
+    if record["type"] != MESSAGE:
+        return None
+    if not isinstance(record["content"], str):
+        raise ValueError("content is not a string")
+    return {
+        "id": UUID(record["id"]),
+        "conversation_id": UUID(record["conversation_id"]),
+        "user_id": UUID(record["user_id"]),
+        "timestamp": datetime.fromisoformat(record["timestamp"]),
+        "content": record["content"],
+    }
+
+
+async def import_history(
+    session_factory, lines: AsyncIterable[bytes] | Iterable[bytes],
+    batch_size: int = config.IMPORT_BATCH_SIZE,
+    transaction_rows: int = config.IMPORT_TRANSACTION_ROWS,
+) -> ImportStats:
+    """Загружает выгрузку export_history из строк NDJSON.
+
+    На строке, которая не разбирается, загрузка останавливается с
+    ImportFormatError. Уже закоммиченные пачки остаются в базе, повторная
+    загрузка исправленного файла их пропустит.
+    """
+    started = time.perf_counter()
+    read = inserted = skipped = 0
+    # Диалог -> можно ли в него писать, пользователь -> есть ли в базе
+    conversations: dict[UUID, bool] = {}
+    users: dict[UUID, bool] = {}
+    batch: list[dict] = []
+    uncommitted = 0
+
+    async with session_factory() as db:
+        async def flush() -> None:
+            nonlocal inserted, skipped, uncommitted
+            unknown = {row["user_id"] for row in batch} - users.keys()
+            if unknown:
+                existing = await crud.existing_user_ids(db, unknown)
+                users.update(
+                    (user_id, user_id in existing) for user_id in unknown
+                )
+            rows = [row for row in batch if users[row["user_id"]]]
+            skipped += len(batch) - len(rows)
+            if rows:
+                count = await crud.import_messages(db, rows)
+                inserted += count
+                skipped += len(rows) - count
+            batch.clear()
+            uncommitted += len(rows)
+            if uncommitted >= transaction_rows:
+                await db.commit()
+                uncommitted = 0
+
+        async def refresh_stats() -> list[UUID]:
+            # Список диалогов видит загруженные сообщения
+            accepted = [key for key, ok in conversations.items() if ok]
+            for conversation_id in accepted:
+                await crud.refresh_conversation_stats(db, conversation_id)
+            await db.commit()
+            return accepted
+
+        number = 0
+        async for line in _records(lines):
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                record = _parse_record(line)
+            except (
+                orjson.JSONDecodeError, KeyError, TypeError, ValueError,
+            ) as ex:
+                # Незакоммиченная часть откатывается, счетчики диалогов
+                # учитывают то, что уже записано
+                await db.rollback()
+                await refresh_stats()
+                reason = f"{type(ex).__name__}: {ex}"
+                raise ImportFormatError(number, reason) from ex
+            read += 1
+            if isinstance(record, crud.ConversationExport):
+                if record.id not in conversations:
+                    conversations[record.id] = (
+                        await crud.import_conversation(db, record)
+                    )
+            elif record is not None:
+                if not conversations.get(record["conversation_id"]):
+                    skipped += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    await flush()
+        if batch:
+            await flush()
+        accepted = await refresh_stats()
+
+    return ImportStats(
+        read, len(accepted), inserted, skipped, time.perf_counter() - started
+    )
+
+
+async def _export(args) -> None:
+    output = (
+        open(args.output, "wb") if args.output else sys.stdout.buffer
+    )
+    try:
+        async for chunk in export_history(
+            SessionFactory, conversation_id=args.conversation,
+            chat_id=args.chat, user_id=args.user,
+        ):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+
+
+async def _import(args) -> None:
+    source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    with source:
+        try:
+            stats = await import_history(SessionFactory, source)
+        except ImportFormatError as ex:
+            raise SystemExit(str(ex))
+    rate = stats.inserted / stats.seconds if stats.seconds else 0
+    print(f"Read {stats.read} records, {stats.conversations} conversations, "
+          f"inserted {stats.inserted} messages, skipped {stats.skipped}, "
+          f"{stats.seconds:.1f}s ({rate:,.0f} msg/s)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export")
+    scope = export.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--conversation", type=UUID)
+    scope.add_argument("--chat", type=UUID,
+                       help="Все комнаты публичного или приватного чата")
+    scope.add_argument("--user", type=UUID,
+                       help="Все диалоги пользователя")
+    export.add_argument("-o", "--output", help="Файл, по умолчанию stdout")
+
+    import_ = commands.add_parser("import")
+    import_.add_argument("file", help="Файл выгрузки или - для stdin")
+
+    args = parser.parse_args()
+    asyncio.run(_export(args) if args.command == "export" else _import(args))
+
+
+if __name__ == "__main__":
+    main()
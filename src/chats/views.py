@@ -1,6 +1,6 @@
 import uuid
-from fastapi import APIRouter, Depends
-from fastapi.responses import Response
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.chats import models
@@ -9,14 +9,50 @@ from src.chats.crud import (
     create_public_chat_crud,
     create_private_chat_crud,
     enjoy_user_to_public_chat,
-    get_public_chat_by_uuid,
+    get_public_chat_info,
+    is_public_chat_member,
+    list_conversations,
+    list_public_chat_members,
     public_chat_exists,
+    search_messages,
+    set_retention_policy,
     users_private_chat_exists,
 )
+from src.chats.transfer import (
+    ImportFormatError,
+    MEDIA_TYPE as NDJSON_MEDIA_TYPE,
+    export_history,
+    import_history,
+    split_lines,
+)
 from src.chats.utils import create_room_conversation
-from src.core.jwt import get_current_user
-from src.core.exceptions import BadRequestException, NotFoundException
+from src.core.config import (
+    CHAT_MEMBERS_MAX_PAGE_SIZE,
+    CHAT_MEMBERS_PAGE_SIZE,
+    CONVERSATION_LIST_MAX_PAGE_SIZE,
+    CONVERSATION_LIST_PAGE_SIZE,
+    MESSAGE_SEARCH_MAX_PAGE_SIZE,
+    MESSAGE_SEARCH_PAGE_SIZE,
+)
+from src.core.jwt import get_current_admin, get_current_user
+from src.core.exceptions import (
+    BadRequestException,
+    ForbiddenException,
+    NotFoundException,
+)
+from src.database.database import SessionFactory
 from src.database.dependencies import get_db
+from src.socket_server.crud import get_dialog_info, mark_conversation_read
+from src.socket_server.presence import presence
+from src.socket_server.exceptions import (
+    MessageCursorError,
+    SocketPermissionError,
+)
+from src.socket_server.utils import (
+    get_history_limit,
+    get_message_history,
+    have_enter_room_permission,
+)
 
 
 router = APIRouter()
@@ -93,16 +129,16 @@ async def enjoy_public_chat(
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    public_chat = await get_public_chat_by_uuid(db, uuid.UUID(chat_id))
+    public_chat = await get_public_chat_info(db, uuid.UUID(chat_id))
     if not public_chat:
         raise NotFoundException(detail="Chat not found")
 
-    if current_user.id in [user.id for user in public_chat.users]:
+    if not await enjoy_user_to_public_chat(
+        db, public_chat.id, current_user.id
+    ):
         raise BadRequestException(
             detail="You are already a member of this room"
         )
-
-    await enjoy_user_to_public_chat(db, public_chat, current_user)
     return Response()
 
 
@@ -118,10 +154,267 @@ async def create_public_chat_conversation(
     current_user: models.User = Depends(get_current_user),
 ):
     uuid_chat_id = uuid.UUID(chat_id)
-    public_chat = await get_public_chat_by_uuid(db, uuid_chat_id)
-    if current_user.id not in [user.id for user in public_chat.users]:
+    if not await is_public_chat_member(db, uuid_chat_id, current_user.id):
         # Чтобы создать комнату в чате надо к нему присоединиться
         raise BadRequestException(detail="You are not a member of this room")
 
     conversation = await create_room_conversation(db, uuid_chat_id)
     return {"chat_id": chat_id, "conversation_id": conversation.id}
+
+
+@router.get(
+    "/chat/{chat_id}/members",
+    tags=['chats'],
+    summary="Участники публичного чата",
+    response_model=schemas.ChatMembersResponse,
+)
+async def public_chat_members(
+    chat_id: uuid.UUID,
+    after: uuid.UUID | None = None,
+    limit: int = Query(
+        default=CHAT_MEMBERS_PAGE_SIZE, ge=1, le=CHAT_MEMBERS_MAX_PAGE_SIZE,
+    ),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Участники по возрастанию user_id. Следующая страница - after
+    с user_id последнего участника."""
+    if not await is_public_chat_member(db, chat_id, current_user.id):
+        raise ForbiddenException(detail="You are not a member of this chat")
+
+    members, has_more = await list_public_chat_members(
+        db, chat_id, after=after, limit=limit
+    )
+    return {
+        "members": [member._asdict() for member in members],
+        "has_more": has_more,
+    }
+
+
+@router.get(
+    "/conversation/{conversation_id}/messages",
+    tags=['chats'],
+    summary="История сообщений комнаты",
+    response_model=schemas.MessageHistoryResponse,
+)
+async def conversation_messages(
+    conversation_id: uuid.UUID,
+    before: uuid.UUID | None = None,
+    after: uuid.UUID | None = None,
+    limit: int | None = Query(default=None, ge=1),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    try:
+        page = await get_message_history(
+            db, current_user, conversation_id,
+            before=before, after=after, limit=get_history_limit(limit),
+        )
+    except MessageCursorError:
+        raise BadRequestException(detail="Unknown cursor")
+    if isinstance(page, SocketPermissionError):
+        raise ForbiddenException(detail="You are not a member of this room")
+
+    return {
+        "messages": await models.Message.bulk_to_dict(db, page.messages),
+        "has_more": page.has_more,
+    }
+
+
+@router.get(
+    "/conversations",
+    tags=['chats'],
+    summary="Диалоги пользователя",
+    response_model=schemas.ConversationListResponse,
+)
+async def user_conversations(
+    limit: int = Query(
+        default=CONVERSATION_LIST_PAGE_SIZE,
+        ge=1, le=CONVERSATION_LIST_MAX_PAGE_SIZE,
+    ),
+    offset: int = Query(default=0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Приватные чаты и комнаты публичных чатов пользователя, недавно
+    активные первыми, с последним сообщением и числом непрочитанных"""
+    summaries, has_more = await list_conversations(
+        db, current_user.id, limit=limit, offset=offset
+    )
+    return {
+        "conversations": [
+            {
+                "conversation_id": summary.conversation_id,
+                "chat_id": summary.public_chat_id or summary.private_chat_id,
+                "is_group": summary.public_chat_id is not None,
+                "title": summary.title,
+                "last_message": {
+                    "id": summary.last_message_id,
+                    "content": summary.last_message_content,
+                    "timestamp": summary.last_message_at,
+                    "user_id": summary.last_message_user_id,
+                } if summary.last_message_id else None,
+                "unread_count": summary.unread_count,
+            }
+            for summary in summaries
+        ],
+        "has_more": has_more,
+    }
+
+
+@router.post(
+    "/conversation/{conversation_id}/read",
+    tags=['chats'],
+    summary="Отметить сообщения комнаты прочитанными",
+)
+async def read_conversation(
+    conversation_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if not await have_enter_room_permission(db, current_user, conversation_id):
+        raise ForbiddenException(detail="You are not a member of this room")
+
+    await mark_conversation_read(db, current_user.id, conversation_id)
+    return Response()
+
+
+@router.get(
+    "/conversation/{conversation_id}/online",
+    tags=['chats'],
+    summary="Пользователи, которые сейчас в комнате",
+    response_model=schemas.OnlineMembersResponse,
+)
+async def conversation_online(
+    conversation_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if not await have_enter_room_permission(db, current_user, conversation_id):
+        raise ForbiddenException(detail="You are not a member of this room")
+
+    return {
+        "conversation_id": conversation_id,
+        "online": await presence.room_users(str(conversation_id)),
+    }
+
+
+@router.get(
+    "/messages/search",
+    tags=['chats'],
+    summary="Поиск по сообщениям",
+    response_model=schemas.MessageSearchResponse,
+)
+async def search_conversation_messages(
+    q: str = Query(min_length=1, max_length=256),
+    conversation_id: uuid.UUID | None = None,
+    limit: int = Query(
+        default=MESSAGE_SEARCH_PAGE_SIZE, ge=1, le=MESSAGE_SEARCH_MAX_PAGE_SIZE
+    ),
+    offset: int = Query(default=0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Совпадения в порядке релевантности, найденные слова в snippet
+    выделены тегом <mark>. Слово с * на конце ищется по префиксу.
+    Сообщения, перенесенные в архив политикой хранения, не ищутся."""
+    if conversation_id is not None and not await have_enter_room_permission(
+        db, current_user, conversation_id
+    ):
+        raise ForbiddenException(detail="You are not a member of this room")
+
+    hits, has_more = await search_messages(
+        db, current_user.id, q, conversation_id, limit=limit, offset=offset
+    )
+    emails = await models.Message.author_emails(db, hits)
+    return {
+        "results": [
+            {**hit._asdict(), "user_email": emails.get(hit.user_id)}
+            for hit in hits
+        ],
+        "has_more": has_more,
+    }
+
+
+@router.put(
+    "/conversation/{conversation_id}/retention",
+    tags=['chats'],
+    summary="Политика хранения сообщений комнаты",
+    response_model=schemas.RetentionPolicySchema,
+)
+async def conversation_retention(
+    conversation_id: uuid.UUID,
+    policy: schemas.RetentionPolicySchema,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Сообщения старше max_age_days дней или сверх max_count последних
+    переносятся в архив и остаются доступны в истории. Менять политику
+    может владелец публичного чата или участник приватного."""
+    dialog = await get_dialog_info(db, conversation_id)
+    if dialog is None:
+        raise NotFoundException(detail="Conversation not found")
+    if dialog.is_group:
+        chat = await get_public_chat_info(db, dialog.chat_id)
+        allowed = chat is not None and chat.owner_id == current_user.id
+    else:
+        allowed = await have_enter_room_permission(
+            db, current_user, conversation_id
+        )
+    if not allowed:
+        raise ForbiddenException(detail="You can't change retention here")
+
+    await set_retention_policy(
+        db, conversation_id, policy.max_age_days, policy.max_count
+    )
+    return policy
+
+
+@router.get(
+    "/admin/export",
+    tags=['admin'],
+    summary="Выгрузить историю в NDJSON",
+)
+async def export_conversations_history(
+    conversation_id: uuid.UUID | None = None,
+    chat_id: uuid.UUID | None = None,
+    user_id: uuid.UUID | None = None,
+    current_user: models.User = Depends(get_current_admin),
+):
+    """Диалог, все комнаты чата или все диалоги пользователя - ровно один
+    из параметров. Формат описан в src/chats/transfer.py"""
+    scope = (conversation_id, chat_id, user_id)
+    if sum(value is not None for value in scope) != 1:
+        raise BadRequestException(
+            detail="Pass one of conversation_id, chat_id, user_id"
+        )
+    # У потока своя сессия: он читает базу, пока отправляется ответ
+    return StreamingResponse(
+        export_history(
+            SessionFactory, conversation_id=conversation_id,
+            chat_id=chat_id, user_id=user_id,
+        ),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+@router.post(
+    "/admin/import",
+    tags=['admin'],
+    summary="Загрузить историю из NDJSON",
+    response_model=schemas.ImportStatsResponse,
+)
+async def import_conversations_history(
+    request: Request,
+    current_user: models.User = Depends(get_current_admin),
+):
+    """Тело запроса - выгрузка /admin/export. Сообщения с уже записанным
+    id пропускаются. На неразборчивой строке - 400 с ее номером, пачки
+    до нее уже записаны"""
+    try:
+        stats = await import_history(
+            SessionFactory, split_lines(request.stream())
+        )
+    except ImportFormatError as ex:
+        raise BadRequestException(detail=str(ex))
+    return stats._asdict()
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from src.core import metrics
+
+
+class AsyncTTLCache:
+    """Процессный LRU-кеш с TTL для асинхронных загрузчиков.
+
+    Одновременные промахи по одному ключу объединяются: загрузчик
+    вызывается один раз, остальные ждут его результат. Кеш с name
+    попадает в /metrics с меткой cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if name is not None:
+            if name in caches:
+                raise ValueError(f"Cache {name} already exists")
+            caches[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+        # Загрузка, начатая до инвалидации, не должна попасть в кеш
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._inflight.clear()
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        future = self._inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Отменили загрузку другого запроса, загружаем сами
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as ex:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if isinstance(ex, Exception):
+                future.set_exception(ex)
+                # Исключение уже получит вызывающий, ожидающим - через future
+                future.exception()
+            else:
+                future.cancel()
+            raise
+
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+            if value is not None:
+                self.set(key, value)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_MISSING = object()
+
+caches: dict[str, AsyncTTLCache] = {}
+
+
+def _stat(field: str) -> Callable[[], dict]:
+    return lambda: {
+        (name,): cache.stats()[field] for name, cache in caches.items()
+    }
+
+
+metrics.gauge(
+    "cache_entries", "Entries in process caches", ("cache",),
+    function=_stat("size"),
+)
+metrics.counter(
+    "cache_hits", "Process cache hits", ("cache",), function=_stat("hits"),
+)
+metrics.counter(
+    "cache_misses", "Process cache misses", ("cache",),
+    function=_stat("misses"),
+)
+metrics.counter(
+    "cache_evictions", "Entries evicted by maxsize", ("cache",),
+    function=_stat("evictions"),
+)
+metrics.counter(
+    "cache_expirations", "Entries dropped after ttl", ("cache",),
+    function=_stat("expirations"),
+)
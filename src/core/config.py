@@ -1,5 +1,10 @@
 import os
 
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+
 SECRET_KEY = os.getenv(
     "SECRET_KEY",
     "sraGbRmjYQXmYdnrgPk!OFE35UP6n/QqeoED=iu/bUXBFSSPwnsuprP6T45Qsbwywu2khUka!6IIleY",
@@ -7,6 +12,140 @@ SECRET_KEY = os.getenv(
 if not SECRET_KEY:
     SECRET_KEY = os.urandom(32)
 
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
+DB_ECHO = _env_bool("DB_ECHO", False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+# Кеш подготовленных запросов драйвера (sqlite3 cached_statements,
+# asyncpg prepared_statement_cache_size)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
 ALGORITHM = "HS256"
+# jose - python-jose, hs256 - собственный кодек, см. src/core/jwt_codec.py
+JWT_CODEC = os.getenv("JWT_CODEC", "hs256" if ALGORITHM == "HS256" else "jose")
+# Проверенные токены, каждый хранится до своего exp
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", 10_000))
 ACCESS_TOKEN_EXPIRES_MINUTES = 60
 REFRESH_TOKEN_EXPIRES_MINUTES = 15 * 24 * 60  # 15 days
+# Как часто процесс дочитывает отозванные токены других воркеров,
+# см. src/auth/denylist.py
+TOKEN_DENYLIST_SYNC_SECONDS = int(os.getenv("TOKEN_DENYLIST_SYNC_SECONDS", 5))
+
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", 10_000))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 5 * 60))
+
+MESSAGE_HISTORY_PAGE_SIZE = int(os.getenv("MESSAGE_HISTORY_PAGE_SIZE", 50))
+MESSAGE_HISTORY_MAX_PAGE_SIZE = int(os.getenv("MESSAGE_HISTORY_MAX_PAGE_SIZE", 500))
+MESSAGE_HISTORY_CHUNK_SIZE = int(os.getenv("MESSAGE_HISTORY_CHUNK_SIZE", 200))
+
+CONVERSATION_LIST_PAGE_SIZE = int(os.getenv("CONVERSATION_LIST_PAGE_SIZE", 50))
+CONVERSATION_LIST_MAX_PAGE_SIZE = int(
+    os.getenv("CONVERSATION_LIST_MAX_PAGE_SIZE", 200)
+)
+
+CHAT_MEMBERS_PAGE_SIZE = int(os.getenv("CHAT_MEMBERS_PAGE_SIZE", 100))
+CHAT_MEMBERS_MAX_PAGE_SIZE = int(os.getenv("CHAT_MEMBERS_MAX_PAGE_SIZE", 1000))
+
+MESSAGE_SEARCH_PAGE_SIZE = int(os.getenv("MESSAGE_SEARCH_PAGE_SIZE", 20))
+MESSAGE_SEARCH_MAX_PAGE_SIZE = int(os.getenv("MESSAGE_SEARCH_MAX_PAGE_SIZE", 100))
+
+# Перенос старых сообщений в архив, см. src/chats/retention.py.
+# 0 - без ограничения, политика диалога переопределяет глобальную
+MESSAGE_RETENTION_ENABLED = _env_bool("MESSAGE_RETENTION_ENABLED", True)
+MESSAGE_RETENTION_MAX_AGE_DAYS = int(os.getenv("MESSAGE_RETENTION_MAX_AGE_DAYS", 0))
+MESSAGE_RETENTION_MAX_COUNT = int(os.getenv("MESSAGE_RETENTION_MAX_COUNT", 0))
+MESSAGE_RETENTION_INTERVAL_SECONDS = int(
+    os.getenv("MESSAGE_RETENTION_INTERVAL_SECONDS", 60 * 60)
+)
+MESSAGE_RETENTION_BATCH_SIZE = int(os.getenv("MESSAGE_RETENTION_BATCH_SIZE", 1000))
+
+# Выгрузка и загрузка истории в NDJSON, см. src/chats/transfer.py.
+# Эндпоинты /admin/ доступны пользователям из ADMIN_EMAILS (через запятую)
+ADMIN_EMAILS = {
+    email.strip().lower()
+    for email in os.getenv("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+}
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+# Строк в одном INSERT: по 5 параметров, в SQLite не больше 32766 на запрос
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 5000))
+IMPORT_TRANSACTION_ROWS = int(os.getenv("IMPORT_TRANSACTION_ROWS", 100_000))
+
+# Пакетная запись сообщений из сокетов
+MESSAGE_WRITER_BATCH_SIZE = int(os.getenv("MESSAGE_WRITER_BATCH_SIZE", 500))
+MESSAGE_WRITER_LINGER_MS = int(os.getenv("MESSAGE_WRITER_LINGER_MS", 10))
+MESSAGE_WRITER_QUEUE_SIZE = int(os.getenv("MESSAGE_WRITER_QUEUE_SIZE", 10_000))
+# durable - рассылка после записи в БД,
+# optimistic - рассылка сразу, отправитель получает ack после записи
+MESSAGE_DELIVERY = os.getenv("MESSAGE_DELIVERY", "durable")
+# Символов в сообщении из сокета
+MESSAGE_MAX_LENGTH = int(os.getenv("MESSAGE_MAX_LENGTH", 4096))
+
+DIALOG_CACHE_MAXSIZE = int(os.getenv("DIALOG_CACHE_MAXSIZE", 100_000))
+DIALOG_CACHE_TTL_SECONDS = int(os.getenv("DIALOG_CACHE_TTL_SECONDS", 60 * 60))
+# Участники чатов для рассылки сообщений по комнатам пользователей.
+# Изменения состава в другом воркере видны через ttl
+CHAT_MEMBERS_CACHE_MAXSIZE = int(os.getenv("CHAT_MEMBERS_CACHE_MAXSIZE", 10_000))
+CHAT_MEMBERS_CACHE_TTL_SECONDS = int(
+    os.getenv("CHAT_MEMBERS_CACHE_TTL_SECONDS", 30)
+)
+
+# Очередь для обмена событиями socket.io между воркерами,
+# см. src/socket_server/pubsub.py
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 24 * 60 * 60))
+# Изменения состава комнаты рассылаются одним событием presence за окно
+PRESENCE_BROADCAST_MS = int(os.getenv("PRESENCE_BROADCAST_MS", 500))
+# typing от одного соединения рассылается не чаще раза в интервал
+TYPING_THROTTLE_MS = int(os.getenv("TYPING_THROTTLE_MS", 2000))
+
+# Ограничение частоты событий от клиентов, формат в src/socket_server/ratelimit.py:
+# событие=частота/запас на соединение:частота/запас на пользователя
+SOCKET_RATE_LIMITS_ENABLED = _env_bool("SOCKET_RATE_LIMITS_ENABLED", True)
+SOCKET_RATE_LIMITS = os.getenv(
+    "SOCKET_RATE_LIMITS",
+    "send_message=10/20:20/40,message_history=2/5:4/10,"
+    "enter_room=10/20:20/40,leave_room=10/20:20/40,"
+    "presence=5/10:10/20,typing=5/10:10/20",
+)
+# Исходящих пакетов в очереди соединения, 0 - без ограничения.
+# drop - лишние пакеты пропускаются, disconnect - клиент отключается
+SOCKET_OUTBOUND_QUEUE_SIZE = int(os.getenv("SOCKET_OUTBOUND_QUEUE_SIZE", 1000))
+SOCKET_SLOW_CONSUMER_POLICY = os.getenv("SOCKET_SLOW_CONSUMER_POLICY", "drop")
+
+# Пакетная рассылка receive_messages для клиентов, подключившихся с batch
+SOCKET_BATCHING_ENABLED = _env_bool("SOCKET_BATCHING_ENABLED", True)
+SOCKET_BATCH_WINDOW_MS = int(os.getenv("SOCKET_BATCH_WINDOW_MS", 20))
+SOCKET_BATCH_MAX_ITEMS = int(os.getenv("SOCKET_BATCH_MAX_ITEMS", 100))
+# Двоичная кодировка сообщений, см. src/socket_server/encoding.py
+SOCKET_COMPACT_ENABLED = _env_bool("SOCKET_COMPACT_ENABLED", True)
+SOCKET_COMPACT_DEFLATE_MIN_BYTES = int(
+    os.getenv("SOCKET_COMPACT_DEFLATE_MIN_BYTES", 2048)
+)
+
+# Очередь фоновых задач, см. src/jobs/worker.py. С JOB_WORKER_ENABLED=0
+# приложение только ставит задачи, выполняет их python -m src.jobs run
+JOB_WORKER_ENABLED = _env_bool("JOB_WORKER_ENABLED", True)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", 4))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+# Сколько задача считается взятой: после этого ее возьмет другой воркер
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 5 * 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", 10))
+JOB_RETRY_MAX_SECONDS = int(os.getenv("JOB_RETRY_MAX_SECONDS", 60 * 60))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 50))
+
+# Хеширование паролей, см. src/core/hash.py
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))
+)
+# Сверх этого числа ожидающих задач запросы отклоняются с 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+# /metrics и замеры времени обработчиков, см. src/core/metrics.py
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
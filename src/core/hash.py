@@ -1,6 +1,16 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from src.core import config, metrics
+from src.core.exceptions import ServiceUnavailableException
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=config.BCRYPT_ROUNDS
+)
 
 
 def get_password_hash(password: str) -> str:
@@ -9,3 +19,98 @@ def get_password_hash(password: str) -> str:
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """Пул потоков для bcrypt.
+
+    bcrypt отпускает GIL, поэтому хеширование в потоках не блокирует
+    цикл событий и сокеты. Очередь ограничена: при перегрузке запрос
+    сразу получает 503, а не ждет за сотнями других логинов.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        self.pending = 0
+        self.rejected = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="bcrypt"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ServiceUnavailableException(
+                detail="Too many authentication requests"
+            )
+
+        submitted = time.perf_counter()
+        # Поток только запоминает время, в гистограммы пишет цикл событий
+        timings = []
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timings.append((started, time.perf_counter()))
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, timed
+            )
+        finally:
+            self.pending -= 1
+            if timings:
+                started, finished = timings[0]
+                password_hash_wait.observe(started - submitted)
+                password_hash_duration.observe(finished - started)
+
+
+password_hasher = PasswordHasher(
+    max_workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+)
+
+
+async def async_get_password_hash(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
+
+async def async_verify_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """Проверяет пароль и возвращает новый хеш, если старый устарел
+    (другое число раундов BCRYPT_ROUNDS или схема)"""
+    return await password_hasher.run(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+password_hash_wait = metrics.histogram(
+    "password_hash_wait_seconds", "bcrypt call wait for a free thread",
+)
+password_hash_duration = metrics.histogram(
+    "password_hash_duration_seconds", "bcrypt call run time",
+)
+metrics.gauge(
+    "password_hash_pending", "bcrypt calls queued or running",
+    function=lambda: password_hasher.pending,
+)
+metrics.counter(
+    "password_hash_rejected", "bcrypt calls rejected with 503",
+    function=lambda: password_hasher.rejected,
+)
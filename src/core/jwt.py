@@ -1,16 +1,24 @@
+import time
 import uuid
 import sys
 from datetime import timedelta, datetime, timezone
 
-from jose import jwt, JWTError
+from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Response, Depends
 from fastapi.security import OAuth2PasswordBearer
 
+from src.auth.denylist import token_denylist
 from src.auth.schemas import User, TokenPair, JwtTokenSchema
 from src.auth.utils import cached_get_user_by_uuid
 from src.core import config
-from src.core.exceptions import AuthFailedException, AuthTokenExpiredException
+from src.core.cache import AsyncTTLCache
+from src.core.exceptions import (
+    AuthFailedException,
+    AuthTokenExpiredException,
+    ForbiddenException,
+)
+from src.core.jwt_codec import create_codec
 from src.database.dependencies import get_db
 
 
@@ -21,6 +29,18 @@ SUB = "sub"
 EXP = "exp"
 IAT = "iat"
 JTI = "jti"
+# Семейство токенов одного входа, см. src/auth/denylist.py
+FAM = "fam"
+TYPE = "typ"
+ACCESS = "access"
+REFRESH = "refresh"
+
+codec = create_codec(config.JWT_CODEC, config.ALGORITHM)
+# Ключ - токен целиком, значение - проверенный payload. ttl задается
+# для каждого токена по его exp, поэтому общий ttl здесь не используется
+verified_tokens = AsyncTTLCache(
+    maxsize=config.TOKEN_CACHE_MAXSIZE, ttl=0, name="verified_tokens"
+)
 
 
 def _get_utc_now():
@@ -43,9 +63,7 @@ def _create_access_token(
     payload[EXP] = expire
 
     token = JwtTokenSchema(
-        token=jwt.encode(
-            payload, config.SECRET_KEY, algorithm=config.ALGORITHM
-        ),
+        token=codec.encode(payload, config.SECRET_KEY),
         payload=payload,
         expire=expire,
     )
@@ -61,9 +79,7 @@ def _create_refresh_token(payload: dict) -> JwtTokenSchema:
     payload[EXP] = expire
 
     token = JwtTokenSchema(
-        token=jwt.encode(
-            payload, config.SECRET_KEY, algorithm=config.ALGORITHM
-        ),
+        token=codec.encode(payload, config.SECRET_KEY),
         expire=expire,
         payload=payload,
     )
@@ -71,20 +87,111 @@ def _create_refresh_token(payload: dict) -> JwtTokenSchema:
     return token
 
 
-def create_token_pair(user: User) -> TokenPair:
-    payload = {SUB: str(user.id), JTI: str(uuid.uuid4()), IAT: _get_utc_now()}
+def create_token_pair(user: User, family: str | None = None) -> TokenPair:
+    """Новая пара токенов; family передается при обновлении пары"""
+    payload = {
+        SUB: str(user.id), IAT: _get_utc_now(),
+        FAM: family or str(uuid.uuid4()),
+    }
 
     return TokenPair(
-        access=_create_access_token(payload={**payload}),
-        refresh=_create_refresh_token(payload={**payload}),
+        access=_create_access_token(
+            payload={**payload, JTI: str(uuid.uuid4()), TYPE: ACCESS}
+        ),
+        refresh=_create_refresh_token(
+            payload={**payload, JTI: str(uuid.uuid4()), TYPE: REFRESH}
+        ),
     )
 
 
-async def decode_access_token(token: str, db: AsyncSession):
+def decode_token(token: str) -> dict:
+    """Проверяет токен, повторные проверки берутся из verified_tokens.
+
+    Возвращаемый payload общий для всех запросов с этим токеном,
+    изменять его нельзя.
+    """
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        verified_tokens.hits += 1
+        return payload
+
+    verified_tokens.misses += 1
+    payload = codec.decode(token, config.SECRET_KEY)
+    exp = payload.get(EXP)
+    if isinstance(exp, int):
+        ttl = exp - time.time()
+        if ttl > 0:
+            verified_tokens.set(token, payload, ttl=ttl)
+    return payload
+
+
+def access_allowed(payload: dict) -> bool:
+    """Токен годится для запросов: не refresh и не отозван.
+
+    Токены, выданные до появления typ и fam, считаются access-токенами.
+    """
+    return payload.get(TYPE) != REFRESH and not token_denylist.is_revoked(
+        payload.get(JTI), payload.get(FAM)
+    )
+
+
+def _expires_at(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _family_expires_at() -> datetime:
+    # Последний токен семейства выдан не позже, чем сейчас
+    return _expires_at(
+        int(time.time()) + config.REFRESH_TOKEN_EXPIRES_MINUTES * 60
+    )
+
+
+def _decode_refresh_token(token: str) -> dict:
     try:
-        payload = jwt.decode(
-            token, config.SECRET_KEY, algorithms=[config.ALGORITHM]
+        payload = decode_token(token)
+    except JWTError:
+        raise AuthFailedException()
+    if payload.get(TYPE) != REFRESH or FAM not in payload:
+        raise AuthFailedException()
+    return payload
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> TokenPair:
+    """Новая пара токенов взамен refresh-токена.
+
+    Каждый refresh-токен обновляется один раз. Повторное предъявление
+    отзывает все семейство: токен скопирован, и неизвестно, у кого
+    из двоих сейчас настоящая пара.
+    """
+    payload = _decode_refresh_token(token)
+    if token_denylist.is_revoked(None, payload[FAM]):
+        raise AuthFailedException()
+
+    if not await token_denylist.revoke(
+        db, payload[JTI], _expires_at(payload[EXP]), "rotated"
+    ):
+        await token_denylist.revoke(
+            db, payload[FAM], _family_expires_at(), "reused"
         )
+        raise AuthFailedException()
+
+    user = await cached_get_user_by_uuid(db, uuid.UUID(payload[SUB]))
+    if user is None or not user.is_active:
+        raise AuthFailedException()
+    return create_token_pair(User.from_orm(user), family=payload[FAM])
+
+
+async def revoke_token_family(db: AsyncSession, token: str) -> None:
+    """Отзывает refresh-токен и все токены его семейства"""
+    payload = _decode_refresh_token(token)
+    await token_denylist.revoke(
+        db, payload[FAM], _family_expires_at(), "logout"
+    )
+
+
+async def decode_access_token(token: str, db: AsyncSession):
+    try:
+        payload = decode_token(token)
     except JWTError:
         raise AuthFailedException()
 
@@ -116,11 +223,9 @@ async def get_current_user(
 ):
     credentials_exception = AuthTokenExpiredException()
     try:
-        payload = jwt.decode(
-            token, config.SECRET_KEY, algorithms=[config.ALGORITHM]
-        )
+        payload = decode_token(token)
         user_id = payload.get("sub")
-        if user_id is None:
+        if user_id is None or not access_allowed(payload):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
@@ -128,3 +233,9 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
     return user
+
+
+async def get_current_admin(user: User = Depends(get_current_user)):
+    if user.email.lower() not in config.ADMIN_EMAILS:
+        raise ForbiddenException(detail="Admin access required")
+    return user
@@ -0,0 +1,128 @@
+"""Кодеки JWT.
+
+JoseCodec - python-jose, поддерживает все алгоритмы.
+HS256Codec - только HS256 на hmac и orjson: без разбора JWK и общего
+механизма проверки claims, в несколько раз быстрее. Токены обоих кодеков
+побайтно совпадают и взаимозаменяемы.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from datetime import datetime
+from typing import Any
+
+import orjson
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError
+
+
+class TokenCodec:
+    def encode(self, payload: dict, key: str) -> str:
+        raise NotImplementedError
+
+    def decode(self, token: str, key: str) -> dict:
+        """Проверяет подпись и claims, при ошибке выбрасывает JWTError"""
+        raise NotImplementedError
+
+
+class JoseCodec(TokenCodec):
+    def __init__(self, algorithm: str):
+        self.algorithm = algorithm
+
+    def encode(self, payload: dict, key: str) -> str:
+        return jwt.encode(payload, key, algorithm=self.algorithm)
+
+    def decode(self, token: str, key: str) -> dict:
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _timestamp(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return value
+
+
+class HS256Codec(TokenCodec):
+    # Заголовок такой же, как у python-jose
+    HEADER = _b64encode(b'{"alg":"HS256","typ":"JWT"}')
+    TIME_CLAIMS = ("exp", "iat", "nbf")
+
+    def encode(self, payload: dict, key: str) -> str:
+        claims = {
+            name: _timestamp(value) if name in self.TIME_CLAIMS else value
+            for name, value in payload.items()
+        }
+        signing_input = self.HEADER + b"." + _b64encode(orjson.dumps(claims))
+        return (signing_input + b"." + self._sign(signing_input, key)).decode()
+
+    def decode(self, token: str, key: str) -> dict:
+        try:
+            signing_input, signature = token.encode().rsplit(b".", 1)
+            header, payload = signing_input.split(b".")
+        except (ValueError, UnicodeEncodeError):
+            raise JWTError("Not enough segments")
+
+        if header != self.HEADER:
+            self._check_header(header)
+        if not hmac.compare_digest(self._sign(signing_input, key), signature):
+            raise JWTError("Signature verification failed.")
+
+        try:
+            claims = orjson.loads(_b64decode(payload))
+        except (binascii.Error, orjson.JSONDecodeError):
+            raise JWTError("Invalid payload string")
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload string: must be a json object")
+        self._check_claims(claims)
+        return claims
+
+    @staticmethod
+    def _sign(signing_input: bytes, key: str | bytes) -> bytes:
+        if isinstance(key, str):
+            key = key.encode()
+        digest = hmac.new(key, signing_input, hashlib.sha256).digest()
+        return _b64encode(digest)
+
+    @staticmethod
+    def _check_header(header: bytes) -> None:
+        # Другой порядок полей или лишние поля, но алгоритм тот же
+        try:
+            alg = orjson.loads(_b64decode(header)).get("alg")
+        except (binascii.Error, orjson.JSONDecodeError, AttributeError):
+            raise JWTError("Invalid header string")
+        if alg != "HS256":
+            raise JWTError("The specified alg value is not allowed")
+
+    @staticmethod
+    def _check_claims(claims: dict) -> None:
+        now = time.time()
+        for name in HS256Codec.TIME_CLAIMS:
+            if name in claims and not isinstance(claims[name], int):
+                raise JWTClaimsError(f"{name} claim must be an integer.")
+        if "exp" in claims and claims["exp"] < now:
+            raise ExpiredSignatureError("Signature has expired.")
+        if "nbf" in claims and claims["nbf"] > now:
+            raise JWTClaimsError("The token is not yet valid (nbf)")
+        for name in ("sub", "jti"):
+            if name in claims and not isinstance(claims[name], str):
+                raise JWTClaimsError(f"{name} claim must be a string.")
+        if "aud" in claims:
+            raise JWTClaimsError("Invalid audience")
+
+
+def create_codec(name: str, algorithm: str) -> TokenCodec:
+    if name == "jose":
+        return JoseCodec(algorithm)
+    if name == "hs256" and algorithm == "HS256":
+        return HS256Codec()
+    raise ValueError(f"Unsupported JWT codec {name} for {algorithm}")
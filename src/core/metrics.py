@@ -0,0 +1,366 @@
+"""Метрики в текстовом формате Prometheus.
+
+Свой минимальный реестр без зависимостей: счетчики, gauge и гистограммы
+с метками. Запись значения - поиск в словаре и bisect по границам
+бакетов, поэтому метрики можно не выключать в продакшене. Значения,
+которые дешевле посчитать при чтении (число подключений, размеры
+комнат), задаются функциями и вычисляются только при запросе /metrics.
+"""
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from src.core import config
+
+DEFAULT_BUCKETS = (
+    .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10,
+)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+# charset добавляет Response
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return (
+        str(value).replace("\\", r"\\").replace("\n", r"\n")
+        .replace('"', r'\"')
+    )
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = (
+            f"# HELP {self.name} {self.documentation}\n"
+            f"# TYPE {self.name} {self.type}\n"
+        )
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _ValueMetric(Metric):
+    """Значение задается вручную или функцией, вызываемой при чтении.
+
+    Функция метрики с метками возвращает словарь {значения меток: число},
+    без меток - одно число.
+    """
+
+    suffix = ""
+
+    def __init__(self, name, documentation, labelnames=(),
+                 function: Callable[[], float | dict] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _Value()
+
+    def _values(self) -> Iterable[tuple[tuple, float]]:
+        if self.function is None:
+            return (
+                (values, child.value)
+                for values, child in self._children.items()
+            )
+        if self.labelnames:
+            return self.function().items()
+        return [((), self.function())]
+
+    def samples(self):
+        for values, value in self._values():
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}{self.suffix}{labels} {_format_value(value)}"
+
+
+class Counter(_ValueMetric):
+    type = "counter"
+    suffix = "_total"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_ValueMetric):
+    type = "gauge"
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "buckets", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # Последний бакет - значения больше всех границ (+Inf)
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    """Гистограмма. Если задана function, она возвращает все наблюдения
+    заново при каждом чтении (например, размеры комнат)"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets: tuple = DEFAULT_BUCKETS,
+                 function: Callable[[], Iterable[float]] | None = None):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self.function = function
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self, *labels):
+        return _Timer(self.labels(*labels))
+
+    def samples(self):
+        children = self._children.items()
+        if self.function is not None:
+            child = self._new_child()
+            for value in self.function():
+                child.observe(value)
+            children = [((), child)]
+
+        for values, child in children:
+            cumulative = 0
+            bounds = self.bounds + (float("inf"),)
+            for bound, count in zip(bounds, child.buckets):
+                cumulative += count
+                labels = _labels(
+                    self.labelnames, values, f'le="{_format_value(bound)}"'
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramValue):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.metrics.values())
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=(), function=None) -> Counter:
+    return registry.register(
+        Counter(name, documentation, labelnames, function=function)
+    )
+
+
+def gauge(name, documentation, labelnames=(), function=None) -> Gauge:
+    return registry.register(
+        Gauge(name, documentation, labelnames, function=function)
+    )
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+              function=None) -> Histogram:
+    return registry.register(
+        Histogram(name, documentation, labelnames, buckets, function)
+    )
+
+
+http_request_duration = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route", "status"),
+)
+socket_event_duration = histogram(
+    "socketio_event_duration_seconds", "Socket.io event handler latency",
+    ("event",),
+)
+socket_emit_fanout = histogram(
+    "socketio_emit_fanout", "Local recipients of a room emit",
+    buckets=SIZE_BUCKETS,
+)
+socket_room_emits = counter(
+    "socketio_room_emits", "Events emitted to conversation rooms",
+    ("event",),
+)
+db_checkout_duration = histogram(
+    "db_pool_checkout_seconds", "Wait for a connection from the DB pool",
+)
+db_crud_duration = histogram(
+    "db_crud_duration_seconds", "CRUD function time including queries",
+    ("function",),
+)
+
+
+def timed(metric: Histogram, *labels):
+    """Декоратор: время выполнения корутины или асинхронного генератора.
+
+    Для генератора замеряется время от первого запроса до исчерпания,
+    включая время потребителя между чанками.
+    """
+
+    def decorator(func):
+        if not config.METRICS_ENABLED:
+            return func
+        child = metric.labels(*(labels or (func.__qualname__,)))
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def generator_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                finally:
+                    child.observe(time.perf_counter() - started)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware с гистограммой задержки по шаблону маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.labels(
+                scope["method"], self._route_label(scope), status_code,
+            ).observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _route_label(scope) -> str:
+        # Маршрут попадает в scope после роутинга FastAPI
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        if "endpoint" in scope:
+            # Подключенное через mount приложение, например socket.io
+            return scope["root_path"]
+        return "<unmatched>"
+
+
+def instrument_pool(engine) -> None:
+    """Замеряет ожидание соединения из пула engine"""
+    if not config.METRICS_ENABLED:
+        return
+    pool = engine.sync_engine.pool
+    connect = pool.connect
+
+    @functools.wraps(connect)
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            db_checkout_duration.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
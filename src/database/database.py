@@ -1,5 +1,5 @@
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import event, make_url, select
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
     async_sessionmaker,
@@ -8,11 +8,56 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
+from src.core import config
+from src.core.metrics import instrument_pool
 
-DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+DATABASE_URL = config.DATABASE_URL
+
+
+def _engine_options(url: str) -> dict:
+    url = make_url(url)
+    options = {
+        "echo": config.DB_ECHO,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+    }
+    pool_options = {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+    }
+
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {
+            "cached_statements": config.DB_STATEMENT_CACHE_SIZE,
+        }
+        if url.database and url.database != ":memory:":
+            # По умолчанию aiosqlite открывает соединение на каждую сессию
+            options.update(poolclass=AsyncAdaptedQueuePool, **pool_options)
+    else:
+        options.update(pool_options)
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                "prepared_statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+            }
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+instrument_pool(engine)
 
 SessionFactory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
@@ -28,11 +73,15 @@ class Base(AsyncAttrs, DeclarativeBase):
         """
         try:
             db.add(self)
-            return await db.commit()
+            await db.commit()
         except SQLAlchemyError as ex:
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=repr(ex)
             ) from ex
+        self.after_save()
+
+    def after_save(self) -> None:
+        """Вызывается после успешного коммита в save"""
 
     @classmethod
     async def find_by_id(cls, db: AsyncSession, id):
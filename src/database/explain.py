@@ -0,0 +1,291 @@
+"""Проверка планов запросов CRUD-функций.
+
+Запуск: python -m src.database.explain
+
+Вызывает каждую функцию из src/chats/crud.py, src/socket_server/crud.py
+и src/jobs/crud.py на пустой SQLite-базе в памяти, собирает выполненные запросы и прогоняет
+их через EXPLAIN QUERY PLAN. Завершается с ошибкой, если какой-либо
+запрос полностью сканирует таблицу или у функции нет сценария проверки.
+"""
+import asyncio
+import inspect
+import re
+import sys
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.auth.models import User
+from src.chats import crud as chats_crud
+from src.chats.models import ArchivedMessage, Message
+from src.database.database import Base
+from src.jobs import crud as jobs_crud
+from src.socket_server import crud as socket_crud
+
+
+CHECKED_MODULES = (chats_crud, socket_crud, jobs_crud)
+
+# SCAN без SEARCH означает проход по всей таблице или индексу.
+# Поиск FTS5 по MATCH план показывает как "SCAN ... VIRTUAL TABLE INDEX N:M",
+# с условием на rowid - "N:=M"
+FULL_SCAN_RE = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\S+ VIRTUAL TABLE INDEX \d+:=?M)")
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+async def _collect(db) -> dict[str, Callable[[], Awaitable]]:
+    """Готовит данные и возвращает сценарии вызова каждой CRUD-функции"""
+    user1 = User(email="user1@example.com", password="")
+    user2 = User(email="user2@example.com", password="")
+    user3 = User(email="user3@example.com", password="")
+    db.add_all([user1, user2, user3])
+    await db.commit()
+
+    private_chat, private_conversation = (
+        await chats_crud.create_private_chat_crud(db, [user1, user2])
+    )
+    public_chat, public_conversation = (
+        await chats_crud.create_public_chat_crud(db, "chat", user1.id)
+    )
+    message = Message(
+        user_id=user1.id, content="hello world",
+        conversation_id=public_conversation.id,
+    )
+    archived = ArchivedMessage(
+        id=uuid.uuid4(), user_id=user1.id, content="hello",
+        timestamp=datetime(2020, 1, 1),
+        conversation_id=public_conversation.id,
+    )
+    db.add_all([message, archived])
+    await db.commit()
+
+    job_id = await jobs_crud.enqueue_job(db, "mail", {})
+
+    async def stream_messages():
+        async for _ in socket_crud.stream_conversation_messages(
+            db, public_conversation.id, after=message.id
+        ):
+            pass
+
+    async def export_messages():
+        async for _ in chats_crud.stream_export_messages(
+            db, public_conversation.id
+        ):
+            pass
+
+    return {
+        # src/chats/crud.py
+        "create_private_chat_crud": lambda: chats_crud.create_private_chat_crud(
+            db, [user1, user3]
+        ),
+        "users_private_chat_exists": lambda: chats_crud.users_private_chat_exists(
+            db, [user1, user2]
+        ),
+        "public_chat_exists": lambda: chats_crud.public_chat_exists(db, "chat"),
+        "create_public_chat_crud": lambda: chats_crud.create_public_chat_crud(
+            db, "other", user2.id
+        ),
+        "is_public_chat_member": lambda: chats_crud.is_public_chat_member(
+            db, public_chat.id, user1.id
+        ),
+        "enjoy_user_to_public_chat": (
+            lambda: chats_crud.enjoy_user_to_public_chat(
+                db, public_chat.id, user3.id
+            )
+        ),
+        "list_public_chat_members": (
+            lambda: chats_crud.list_public_chat_members(
+                db, public_chat.id, after=user1.id, limit=10
+            )
+        ),
+        "search_messages": lambda: chats_crud.search_messages(
+            db, user1.id, "hello wor*"
+        ),
+        "search_messages:conversation": lambda: chats_crud.search_messages(
+            db, user1.id, "hello", public_conversation.id
+        ),
+        "list_conversations": lambda: chats_crud.list_conversations(
+            db, user1.id
+        ),
+        "list_retention_policies": lambda: chats_crud.list_retention_policies(
+            db
+        ),
+        "list_retention_policies:all": (
+            lambda: chats_crud.list_retention_policies(
+                db, public_conversation.id, all_conversations=True
+            )
+        ),
+        "set_retention_policy": lambda: chats_crud.set_retention_policy(
+            db, public_conversation.id, 30, None
+        ),
+        "retention_cutoff": lambda: chats_crud.retention_cutoff(
+            db, public_conversation.id, datetime(2021, 1, 1), 10
+        ),
+        "archive_messages": lambda: chats_crud.archive_messages(
+            db, public_conversation.id, (datetime(2021, 1, 1), uuid.UUID(int=0)),
+            100,
+        ),
+        "export_conversations": lambda: chats_crud.export_conversations(
+            db, conversation_id=public_conversation.id
+        ),
+        "export_conversations:chat": lambda: chats_crud.export_conversations(
+            db, chat_id=private_chat.id
+        ),
+        "export_conversations:user": lambda: chats_crud.export_conversations(
+            db, user_id=user1.id
+        ),
+        "stream_export_messages": export_messages,
+        "import_conversation": lambda: chats_crud.import_conversation(
+            db, chats_crud.ConversationExport(
+                uuid.uuid4(), True, public_chat.id, None
+            )
+        ),
+        "import_conversation:private": lambda: chats_crud.import_conversation(
+            db, chats_crud.ConversationExport(
+                uuid.uuid4(), False, None, private_chat.id
+            )
+        ),
+        "get_public_chat_info": lambda: chats_crud.get_public_chat_info(
+            db, public_chat.id
+        ),
+        "existing_user_ids": lambda: chats_crud.existing_user_ids(
+            db, [user1.id, user2.id]
+        ),
+        "import_messages": lambda: chats_crud.import_messages(db, [
+            {"id": message_id, "content": "", "user_id": user1.id,
+             "timestamp": datetime(2020, 1, 1),
+             "conversation_id": public_conversation.id}
+            for message_id in (archived.id, uuid.uuid4())
+        ]),
+        "refresh_conversation_stats": (
+            lambda: chats_crud.refresh_conversation_stats(
+                db, public_conversation.id
+            )
+        ),
+        # src/socket_server/crud.py
+        "get_conversation_by_id": lambda: socket_crud.get_conversation_by_id(
+            db, public_conversation.id
+        ),
+        "get_dialog_info": lambda: socket_crud.get_dialog_info(
+            db, private_conversation.id
+        ),
+        "get_conversation_messages": lambda: socket_crud.get_conversation_messages(
+            db, public_conversation.id, before=message.id, limit=10
+        ),
+        "get_conversation_messages:after": (
+            lambda: socket_crud.get_conversation_messages(
+                db, public_conversation.id, after=message.id, limit=10
+            )
+        ),
+        "get_conversation_messages:archive": (
+            lambda: socket_crud.get_conversation_messages(
+                db, public_conversation.id, after=archived.id, limit=10
+            )
+        ),
+        "stream_conversation_messages": stream_messages,
+        "create_message": lambda: socket_crud.create_message(
+            db, user2, "", public_conversation.id
+        ),
+        "create_messages": lambda: socket_crud.create_messages(db, [
+            {"content": "", "user_id": user2.id,
+             "conversation_id": public_conversation.id},
+        ]),
+        "mark_conversation_read": lambda: socket_crud.mark_conversation_read(
+            db, user1.id, public_conversation.id
+        ),
+        "has_private_chat_permission": (
+            lambda: socket_crud.has_private_chat_permission(
+                db, private_chat.id, user1.id
+            )
+        ),
+        "get_chat_member_ids": lambda: socket_crud.get_chat_member_ids(
+            db, socket_crud.DialogInfo(is_group=True, chat_id=public_chat.id)
+        ),
+        "get_chat_member_ids:private": (
+            lambda: socket_crud.get_chat_member_ids(
+                db,
+                socket_crud.DialogInfo(is_group=False, chat_id=private_chat.id),
+            )
+        ),
+        # src/jobs/crud.py
+        "enqueue_job": lambda: jobs_crud.enqueue_job(db, "mail", {}),
+        "claim_jobs": lambda: jobs_crud.claim_jobs(db, "mail", 10, 60),
+        "complete_jobs": lambda: jobs_crud.complete_jobs(db, [job_id]),
+        "fail_jobs": lambda: jobs_crud.fail_jobs(db, [
+            jobs_crud.JobFailure(job_id, "error", None),
+        ]),
+        "requeue_dead_jobs": lambda: jobs_crud.requeue_dead_jobs(db, "mail"),
+    }
+
+
+def _crud_functions() -> set[str]:
+    return {
+        name
+        for module in CHECKED_MODULES
+        for name, func in vars(module).items()
+        if not name.startswith("_")
+        and (
+            inspect.iscoroutinefunction(func)
+            or inspect.isasyncgenfunction(func)
+        )
+        and func.__module__ == module.__name__
+    }
+
+
+async def check_query_plans() -> list[str]:
+    engine = create_async_engine(
+        "sqlite+aiosqlite://", poolclass=StaticPool
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    statements: list[tuple[str, str, tuple]] = []
+    current = {"name": "setup"}
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            statements.append((current["name"], statement, parameters))
+
+    errors = []
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        cases = await _collect(db)
+        missing = _crud_functions() - {name.split(":")[0] for name in cases}
+        errors.extend(f"{name}: no query plan check" for name in sorted(missing))
+
+        for name, call in cases.items():
+            current["name"] = name
+            await call()
+
+    event.remove(engine.sync_engine, "before_cursor_execute", capture)
+    async with engine.connect() as conn:
+        for name, statement, parameters in statements:
+            if name == "setup":
+                continue
+            plan = await conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            details = [row[3] for row in plan]
+            if any(FULL_SCAN_RE.match(detail) for detail in details):
+                errors.append(
+                    f"{name}: full scan\n{statement}\n  " + "\n  ".join(details)
+                )
+
+    await engine.dispose()
+    return errors
+
+
+def main() -> int:
+    errors = asyncio.run(check_query_plans())
+    for error in errors:
+        print(error, end="\n\n")
+    print("OK" if not errors else f"{len(errors)} problem(s) found")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_insert(db, table):
+    """INSERT с on_conflict_do_nothing/do_update для диалекта сессии"""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
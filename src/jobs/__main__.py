@@ -0,0 +1,46 @@
+"""Воркер очереди задач отдельным процессом, см. src/jobs/worker.py"""
+import asyncio
+import importlib
+import sys
+
+from src.core.logging import logger
+from src.database.database import SessionFactory
+from src.jobs import crud
+from src.jobs.worker import job_worker, queue_stats, registered_queues
+
+# Модули, которые регистрируют обработчики очередей
+HANDLER_MODULES = ("src.auth.tasks",)
+
+
+async def _main(args: list[str]) -> None:
+    command = args[0] if args else ""
+    if command == "run":
+        for module in HANDLER_MODULES:
+            importlib.import_module(module)
+        job_worker.start()
+        logger.info(
+            "Job worker started: %s, concurrency %s",
+            ", ".join(registered_queues()), job_worker.concurrency,
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await job_worker.stop()
+    elif command == "stats":
+        async with SessionFactory() as db:
+            for (queue, status), count in (await queue_stats(db)).items():
+                print(queue, status, count)
+    elif command == "retry-dead" and len(args) == 2:
+        async with SessionFactory() as db:
+            print(f"Requeued {await crud.requeue_dead_jobs(db, args[1])} jobs")
+    else:
+        raise SystemExit(
+            "usage: python -m src.jobs run|stats|retry-dead QUEUE"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple
+from uuid import UUID
+
+import orjson
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from src.core.metrics import db_crud_duration, timed
+from src.jobs.models import DEAD, PENDING, Job
+
+jobs = Job.__table__
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@timed(db_crud_duration)
+async def enqueue_job(
+    db, queue: str, payload: dict, delay: float = 0, commit: bool = True
+) -> UUID:
+    """Ставит задачу в очередь. commit=False - задача уйдет вместе с
+    транзакцией вызывающего"""
+    result = await db.execute(
+        insert(jobs)
+        .values(
+            queue=queue,
+            payload=orjson.dumps(payload).decode(),
+            run_at=_utcnow() + timedelta(seconds=delay),
+        )
+        .returning(jobs.c.id)
+    )
+    if commit:
+        await db.commit()
+    return result.scalar_one()
+
+
+class ClaimedJob(NamedTuple):
+    id: UUID
+    payload: dict
+    # С учетом текущей
+    attempts: int
+
+
+@timed(db_crud_duration)
+async def claim_jobs(
+    db, queue: str, limit: int, lease_seconds: float
+) -> List[ClaimedJob]:
+    """Берет до limit готовых задач очереди на lease_seconds.
+
+    Пустая очередь - только чтение, без блокировки записи в SQLite.
+    UPDATE заново проверяет run_at, поэтому задачу, которую между
+    выборкой и UPDATE взял другой воркер, второй раз не возьмут; в
+    PostgreSQL строки, взятые другими, выборка пропускает (SKIP LOCKED).
+    """
+    now = _utcnow()
+    ready = (
+        jobs.c.queue == queue,
+        jobs.c.status == PENDING,
+        jobs.c.run_at <= now,
+    )
+    job_ids = (await db.execute(
+        select(jobs.c.id)
+        .where(*ready)
+        .order_by(jobs.c.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )).scalars().all()
+    if not job_ids:
+        await db.rollback()
+        return []
+
+    result = await db.execute(
+        update(jobs)
+        .where(jobs.c.id.in_(job_ids), *ready)
+        .values(
+            run_at=now + timedelta(seconds=lease_seconds),
+            attempts=jobs.c.attempts + 1,
+        )
+        .returning(jobs.c.id, jobs.c.payload, jobs.c.attempts)
+    )
+    claimed = [
+        ClaimedJob(job_id, orjson.loads(payload), attempts)
+        for job_id, payload, attempts in result.all()
+    ]
+    await db.commit()
+    return claimed
+
+
+@timed(db_crud_duration)
+async def complete_jobs(db, job_ids: List[UUID]) -> None:
+    await db.execute(delete(jobs).where(jobs.c.id.in_(job_ids)))
+    await db.commit()
+
+
+class JobFailure(NamedTuple):
+    id: UUID
+    error: str
+    # None - попытки кончились, задача помечается dead
+    retry_at: datetime | None
+
+
+@timed(db_crud_duration)
+async def fail_jobs(db, failures: List[JobFailure]) -> None:
+    """Откладывает задачи до retry_at или переводит в dead"""
+    await db.execute(
+        update(jobs)
+        .where(jobs.c.id == bindparam("job_id"))
+        .values(
+            status=bindparam("new_status"),
+            run_at=bindparam("new_run_at"),
+            last_error=bindparam("error"),
+        ),
+        [
+            {
+                "job_id": failure.id,
+                "new_status": PENDING if failure.retry_at else DEAD,
+                "new_run_at": failure.retry_at or _utcnow(),
+                "error": failure.error,
+            }
+            for failure in failures
+        ],
+    )
+    await db.commit()
+
+
+@timed(db_crud_duration)
+async def requeue_dead_jobs(db, queue: str) -> int:
+    """Возвращает задачи из dead в очередь с новым счетчиком попыток"""
+    result = await db.execute(
+        update(jobs)
+        .where(jobs.c.queue == queue, jobs.c.status == DEAD)
+        .values(status=PENDING, attempts=0, run_at=_utcnow())
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,39 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Index, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from src.database.database import Base
+
+PENDING = "pending"
+DEAD = "dead"
+
+
+class Job(Base):
+    """Задача очереди, см. src/jobs/worker.py.
+
+    Выполненные задачи удаляются. Взятая в работу остается pending,
+    run_at сдвигается на время аренды: если воркер упадет, задача
+    вернется в очередь.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Выборка: WHERE queue AND status AND run_at <= now ORDER BY run_at
+        Index("ix_jobs_queue_status_run_at", "queue", "status", "run_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
+    queue: Mapped[str]
+    # JSON
+    payload: Mapped[str] = mapped_column(Text)
+    # pending или dead - попытки кончились
+    status: Mapped[str] = mapped_column(default=PENDING, server_default=PENDING)
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+    run_at: Mapped[datetime]
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+    def __repr__(self):
+        return f"Job(id={self.id}, queue={self.queue}, status={self.status})"
@@ -0,0 +1,200 @@
+"""Очередь фоновых задач в таблице jobs.
+
+Задачи ставятся enqueue() в той же базе, что и остальные данные, и
+переживают перезапуск. Обработчик очереди регистрируется декоратором
+register() и получает пачку до batch_size задач. Он может вернуть
+список ошибок по задачам (None - задача выполнена) той же длины, что и
+пачка; исключение или список другой длины - ошибка всей пачки. Неудачная задача повторяется через JOB_RETRY_BASE_SECONDS,
+каждый раз вдвое позже, после JOB_MAX_ATTEMPTS попыток переходит в
+dead и ждет `retry-dead`.
+
+JOB_CONCURRENCY задач-воркеров выполняют пачки параллельно. Воркеры
+запускаются в процессе приложения или отдельно, тогда у приложения
+JOB_WORKER_ENABLED=0:
+
+    python -m src.jobs run
+    python -m src.jobs stats
+    python -m src.jobs retry-dead mail
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, NamedTuple
+
+from sqlalchemy import event, func, select
+
+from src.core import config, metrics
+from src.core.logging import logger
+from src.database.database import SessionFactory
+from src.jobs import crud
+from src.jobs.models import Job
+
+Handler = Callable[[List[dict]], Awaitable[List[str | None] | None]]
+
+processed_jobs = metrics.counter(
+    "jobs_processed", "Background jobs by outcome", ("queue", "result"),
+)
+
+
+class QueueHandler(NamedTuple):
+    handler: Handler
+    batch_size: int
+
+
+_handlers: dict[str, QueueHandler] = {}
+
+
+def register(queue: str, batch_size: int = 1):
+    def decorator(handler: Handler) -> Handler:
+        _handlers[queue] = QueueHandler(handler, batch_size)
+        return handler
+    return decorator
+
+
+def registered_queues() -> list[str]:
+    return list(_handlers)
+
+
+def retry_delay(attempts: int) -> float:
+    """Пауза перед следующей попыткой: экспонента с разбросом 10%,
+    чтобы задачи одной аварии не повторялись разом"""
+    delay = min(
+        config.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        config.JOB_RETRY_MAX_SECONDS,
+    )
+    return delay * random.uniform(0.9, 1.1)
+
+
+class JobWorker:
+    def __init__(
+        self, session_factory, concurrency: int, poll_interval: float,
+        lease_seconds: float, max_attempts: int,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._tasks: list[asyncio.Task] = []
+
+    def wake(self) -> None:
+        """Новая задача в этом процессе: не ждать poll_interval"""
+        self._wakeup.set()
+
+    async def run_once(self, queue: str) -> int:
+        """Выполняет одну пачку задач очереди, возвращает ее размер"""
+        handler, batch_size = _handlers[queue]
+        async with self.session_factory() as db:
+            jobs = await crud.claim_jobs(
+                db, queue, batch_size, self.lease_seconds
+            )
+        if not jobs:
+            return 0
+
+        try:
+            errors = await handler([job.payload for job in jobs])
+            if errors is not None and len(errors) != len(jobs):
+                raise ValueError(
+                    f"Handler returned {len(errors)} results"
+                    f" for {len(jobs)} jobs"
+                )
+        except Exception as exc:
+            logger.exception("Job batch of %s failed", queue)
+            errors = [repr(exc)] * len(jobs)
+        errors = errors or [None] * len(jobs)
+
+        done = [job.id for job, error in zip(jobs, errors) if error is None]
+        failures = [
+            self._failure(queue, job, error)
+            for job, error in zip(jobs, errors) if error is not None
+        ]
+        async with self.session_factory() as db:
+            if done:
+                await crud.complete_jobs(db, done)
+                processed_jobs.labels(queue, "done").inc(len(done))
+            if failures:
+                await crud.fail_jobs(db, failures)
+        return len(jobs)
+
+    def _failure(self, queue: str, job, error: str) -> crud.JobFailure:
+        if job.attempts >= self.max_attempts:
+            logger.error("Job %s of %s is dead: %s", job.id, queue, error)
+            processed_jobs.labels(queue, "dead").inc()
+            return crud.JobFailure(job.id, error, None)
+        processed_jobs.labels(queue, "retry").inc()
+        retry_at = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+            seconds=retry_delay(job.attempts)
+        )
+        return crud.JobFailure(job.id, error, retry_at)
+
+    def start(self) -> None:
+        if any(not task.done() for task in self._tasks):
+            return
+        self._closing = False
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Дает воркерам закончить текущие пачки, не дождавшихся
+        отменяет: их задачи вернутся в очередь после аренды"""
+        if not self._tasks:
+            return
+        self._closing = True
+        self._wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while not self._closing:
+            processed = 0
+            for queue in registered_queues():
+                try:
+                    processed += await self.run_once(queue)
+                except Exception:
+                    logger.exception("Job queue %s failed", queue)
+            if processed or self._closing:
+                continue
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self.poll_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+job_worker = JobWorker(
+    SessionFactory,
+    concurrency=config.JOB_CONCURRENCY,
+    poll_interval=config.JOB_POLL_SECONDS,
+    lease_seconds=config.JOB_LEASE_SECONDS,
+    max_attempts=config.JOB_MAX_ATTEMPTS,
+)
+
+
+async def enqueue(db, queue: str, payload: dict, commit: bool = True) -> None:
+    """Ставит задачу и будит воркеры этого процесса. С commit=False
+    задача коммитится вместе с данными вызывающего, воркеры будятся
+    после его коммита"""
+    await crud.enqueue_job(db, queue, payload, commit=commit)
+    if commit:
+        job_worker.wake()
+    else:
+        event.listen(
+            db.sync_session, "after_commit",
+            lambda session: job_worker.wake(), once=True,
+        )
+
+
+async def queue_stats(db) -> dict[tuple[str, str], int]:
+    result = await db.execute(
+        select(Job.queue, Job.status, func.count())
+        .group_by(Job.queue, Job.status)
+    )
+    return {(queue, status): count for queue, status, count in result}
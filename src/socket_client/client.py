@@ -1,11 +1,42 @@
+import json
+import sys
+
 import socketio
 import asyncio
 
 import socketio.exceptions
 
+from src.socket_server.encoding import decode_messages
+
 
 sio = socketio.AsyncClient()
 
+# --batch - получать сообщения комнаты пачками,
+# --compact - в двоичной кодировке (src/socket_server/encoding.py)
+BATCH = "--batch" in sys.argv
+COMPACT = "--compact" in sys.argv
+# Принятые события и байты полезной нагрузки (JSON без пробелов,
+# как его кодирует socket.io), печатаются при выходе
+traffic = {"events": 0, "bytes": 0}
+
+
+def count_traffic(data) -> None:
+    traffic["events"] += 1
+    if isinstance(data, bytes):
+        traffic["bytes"] += len(data)
+    else:
+        traffic["bytes"] += len(json.dumps(data, separators=(',', ':')))
+
+
+def decode(data) -> list[dict]:
+    return decode_messages(data) if isinstance(data, bytes) else data
+
+
+def print_message(data) -> None:
+    # В двоичной кодировке ключи как в истории сообщений
+    user = data.get("user") or data.get("user_email")
+    print(f'{user}: {data.get("message") or data.get("content")}')
+
 
 @sio.event
 async def connect():
@@ -19,12 +50,25 @@ async def disconnect():
 
 @sio.event
 async def receive_message(data):
-    print(f'{data.get("user")}: {data.get("message")}')
+    count_traffic(data)
+    if isinstance(data, bytes):
+        for message in decode_messages(data):
+            print_message(message)
+    else:
+        print_message(data)
+
+
+@sio.event
+async def receive_messages(data):
+    count_traffic(data)
+    for message in decode(data):
+        print_message(message)
 
 
 @sio.event
 async def message_history(data):
-    for message in data:
+    count_traffic(data)
+    for message in decode(data):
         print(f'{message.get("user_email")} ({message.get("timestamp")}): {message.get("content")}')
 
 
@@ -59,7 +103,11 @@ async def start_client():
     try:
         await sio.connect(
             'http://localhost:8081/',
-            auth={"token": token},
+            auth={
+                "token": token,
+                "batch": BATCH,
+                "encoding": "compact" if COMPACT else "json",
+            },
             socketio_path='/ws/socket.io/',
         )
     except socketio.exceptions.ConnectionError:
@@ -74,6 +122,8 @@ async def start_client():
         await send_messages(room)
         await sio.emit("leave_room", room)
     await sio.disconnect()
+    print(f"System: received {traffic['events']} events, "
+          f"{traffic['bytes']} bytes")
 
 
 if __name__ == '__main__':
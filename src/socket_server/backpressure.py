@@ -0,0 +1,113 @@
+"""Ограниченная очередь отправки для каждого соединения.
+
+engine.io складывает исходящие пакеты соединения в неограниченную очередь,
+которую разбирает задача записи в сокет. Если клиент не читает, очередь
+растет с каждой рассылкой в его комнаты. BoundedAsyncServer не ставит
+пакет в очередь, где уже SOCKET_OUTBOUND_QUEUE_SIZE пакетов, и по
+SOCKET_SLOW_CONSUMER_POLICY:
+
+- drop - пропускает пакет (у двоичного события - вместе с вложениями);
+- disconnect - отключает клиента, не дожидаясь отправки очереди.
+
+Ограничение касается рассылок и emit(to=sid); ack-ответы не ограничиваются,
+их число ограничивают лимиты входящих событий.
+"""
+import asyncio
+import re
+
+import socketio
+
+from src.core import metrics
+from src.core.logging import logger
+
+DROP = "drop"
+DISCONNECT = "disconnect"
+
+# Заголовок события с двоичными вложениями: 5<число вложений>-...
+BINARY_HEADER_RE = re.compile(r"5(\d+)-")
+
+outbound_dropped = metrics.counter(
+    "socketio_outbound_dropped", "Packets dropped for slow consumers",
+)
+slow_consumer_disconnects = metrics.counter(
+    "socketio_slow_consumer_disconnects",
+    "Clients disconnected for not reading their outbound queue",
+)
+
+
+class BoundedAsyncServer(socketio.AsyncServer):
+    def __init__(self, *args, outbound_queue_size: int = 0,
+                 slow_consumer_policy: str = DROP, **kwargs):
+        if slow_consumer_policy not in (DROP, DISCONNECT):
+            raise ValueError(
+                f"Unknown slow consumer policy: {slow_consumer_policy}"
+            )
+        super().__init__(*args, **kwargs)
+        self.outbound_queue_size = outbound_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        # eio sid -> сколько вложений пропущенного события еще впереди
+        self._skip_attachments: dict[str, int] = {}
+        self._disconnecting: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    def max_outbound_queue(self) -> int:
+        return max(
+            (socket.queue.qsize() for socket in self.eio.sockets.values()),
+            default=0,
+        )
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        # Пакеты одной рассылки ставятся в задачи по порядку, проверка
+        # выполняется до первого await, поэтому вложения идут сразу
+        # за своим заголовком
+        if self.outbound_queue_size and not self._admit(eio_sid, eio_pkt):
+            return
+        await super()._send_eio_packet(eio_sid, eio_pkt)
+
+    def _admit(self, eio_sid: str, eio_pkt) -> bool:
+        skip = self._skip_attachments.get(eio_sid)
+        if skip and isinstance(eio_pkt.data, bytes):
+            if skip == 1:
+                del self._skip_attachments[eio_sid]
+            else:
+                self._skip_attachments[eio_sid] = skip - 1
+            return False
+
+        socket = self.eio.sockets.get(eio_sid)
+        if socket is None or socket.queue.qsize() < self.outbound_queue_size:
+            return True
+
+        if self.slow_consumer_policy == DISCONNECT:
+            if eio_sid not in self._disconnecting:
+                self._disconnecting.add(eio_sid)
+                slow_consumer_disconnects.inc()
+                task = asyncio.create_task(
+                    self._disconnect_slow(eio_sid, socket)
+                )
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return False
+
+        outbound_dropped.inc()
+        if isinstance(eio_pkt.data, str):
+            header = BINARY_HEADER_RE.match(eio_pkt.data)
+            if header and int(header.group(1)):
+                self._skip_attachments[eio_sid] = int(header.group(1))
+        return False
+
+    async def _disconnect_slow(self, eio_sid: str, socket) -> None:
+        logger.warning("Disconnecting slow consumer %s", eio_sid)
+        # Накопленное клиент уже не получит, память освобождается сразу
+        while not socket.queue.empty():
+            socket.queue.get_nowait()
+            socket.queue.task_done()
+        try:
+            # Без ожидания очереди: задача записи может стоять на send
+            # клиенту, который не читает
+            await socket.close(wait=False, abort=True)
+        finally:
+            self.eio.sockets.pop(eio_sid, None)
+            self._skip_attachments.pop(eio_sid, None)
+            self._disconnecting.discard(eio_sid)
+            # Задача записи завершится после текущей отправки
+            socket.queue.put_nowait(None)
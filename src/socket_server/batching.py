@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+# Клиенты с пакетной доставкой входят в комнату "<room>#batch"
+BATCH_ROOM_SUFFIX = "#batch"
+
+
+def batch_room(room: str) -> str:
+    return room + BATCH_ROOM_SUFFIX
+
+
+class RoomBatcher:
+    """Копит сообщения комнаты и отправляет их одним событием.
+
+    Пачка уходит через window секунд после первого сообщения или сразу,
+    когда набралось max_items сообщений. Порядок сообщений в комнате
+    сохраняется.
+    """
+
+    def __init__(
+        self, emit: Callable[[str, list], Awaitable[Any]],
+        window: float, max_items: int,
+    ):
+        self.emit = emit
+        self.window = window
+        self.max_items = max_items
+        self._pending: dict[str, list] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, room: str, item: Any) -> None:
+        items = self._pending.setdefault(room, [])
+        items.append(item)
+        if len(items) >= self.max_items:
+            self._flush_later(room)
+        elif len(items) == 1:
+            self._timers[room] = asyncio.get_running_loop().call_later(
+                self.window, self._flush_later, room
+            )
+
+    def _flush_later(self, room: str) -> None:
+        timer = self._timers.pop(room, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(room, None)
+        if not items:
+            return
+        task = asyncio.create_task(self.emit(room, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Отправляет все накопленные пачки и ждет отправки"""
+        for room in list(self._pending):
+            self._flush_later(room)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,80 @@
+"""Брокер сообщений socket.io на unix-сокете.
+
+Запуск: python -m src.socket_server.broker /tmp/socketio.sock
+
+Пересылает каждый кадр от воркера всем остальным подключенным воркерам
+и хранит общее для них присутствие (BrokerPresenceRegistry).
+Воркеры подключаются через SOCKETIO_MESSAGE_QUEUE=unix:///tmp/socketio.sock
+"""
+import asyncio
+import os
+import pickle
+import sys
+
+from src.core.logging import logger
+from src.socket_server.presence import PresenceOwner, PresenceRegistry
+from src.socket_server.pubsub import (
+    PRESENCE_HELLO,
+    PUBSUB_HELLO,
+    encode_frame,
+    read_frame,
+)
+
+
+class Broker:
+    def __init__(self, path: str):
+        self.path = path
+        self.writers: set[asyncio.StreamWriter] = set()
+        self.presence = PresenceRegistry()
+
+    async def _handle(self, reader, writer):
+        try:
+            hello = await read_frame(reader)
+            if hello == PUBSUB_HELLO:
+                await self._forward(reader, writer)
+            elif hello == PRESENCE_HELLO:
+                await self._serve_presence(reader, writer)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_presence(self, reader, writer):
+        owner = PresenceOwner(self.presence)
+        try:
+            while True:
+                method, args = pickle.loads(await read_frame(reader))
+                result = await owner.call(method, args)
+                writer.write(encode_frame(pickle.dumps(result)))
+                await writer.drain()
+        finally:
+            await owner.release()
+
+    async def _forward(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                frame = encode_frame(await read_frame(reader))
+                for other in list(self.writers):
+                    if other is not writer:
+                        other.write(frame)
+                await asyncio.gather(
+                    *(other.drain() for other in self.writers
+                      if other is not writer),
+                    return_exceptions=True,
+                )
+        finally:
+            self.writers.discard(writer)
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, self.path)
+        logger.info(f"Socket.io broker listening on {self.path}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "socketio.sock"
+    asyncio.run(Broker(path).serve())
@@ -1,69 +1,330 @@
+import uuid
+from datetime import datetime, timezone
 from uuid import UUID
 
-from typing import TypeAlias, List
+from typing import AsyncIterator, NamedTuple, List
 
-from sqlalchemy import select, exists
-from sqlalchemy.orm import joinedload
+from sqlalchemy import case, insert, select, exists, tuple_, update
 
-from src.auth.models import User, user_private_chats
-from src.chats.models import Message, PrivateChat, PublicChat, Conversation
+from src.auth.models import User, user_private_chats, user_public_chats
+from src.chats.models import (
+    ArchivedMessage,
+    Conversation,
+    ConversationRead,
+    Message,
+    MessageRow,
+)
+from src.core.metrics import db_crud_duration, timed
+from src.database.upsert import dialect_insert
+from src.socket_server.exceptions import MessageCursorError
 
 
-Dialog: TypeAlias = PrivateChat | PublicChat
+class ConversationRow(NamedTuple):
+    id: UUID
+    is_group: bool
+    public_chat_id: UUID | None
+    private_chat_id: UUID | None
+    last_message_id: UUID | None
+    last_message_at: datetime | None
+    message_count: int
 
 
+CONVERSATION_COLUMNS = [
+    Conversation.__table__.c[field] for field in ConversationRow._fields
+]
+
+
+@timed(db_crud_duration)
 async def get_conversation_by_id(
     db, conversation_id: UUID
-) -> Conversation:
+) -> ConversationRow | None:
     result = await db.execute(
-        select(Conversation)
-        .where(Conversation.id == conversation_id)
+        select(*CONVERSATION_COLUMNS)
+        .where(Conversation.__table__.c.id == conversation_id)
     )
-    return result.scalars().first()
+    row = result.first()
+    return None if row is None else ConversationRow._make(row)
 
 
-async def get_dialog_by_conversation_id(
-    db, conversation_id: UUID
-) -> Dialog | None:
-
-    conversation = await db.execute(
-        select(Conversation)
-        .options(
-            joinedload(Conversation.public_chat).joinedload(PublicChat.users),
-            joinedload(Conversation.private_chats).joinedload(
-                PrivateChat.users
-            ),
-        ).where(Conversation.id == conversation_id)
+class Cursor(NamedTuple):
+    key: object
+    archived: bool
+
+
+async def _get_cursor(db, conversation_id: UUID, message_id: UUID) -> Cursor:
+    """Ключ (timestamp, id) сообщения-курсора; сообщение может быть
+    уже перенесено в архив"""
+    for model in (Message, ArchivedMessage):
+        result = await db.execute(
+            select(model.timestamp, model.id)
+            .where(
+                model.id == message_id,
+                model.conversation_id == conversation_id,
+            )
+        )
+        key = result.first()
+        if key is not None:
+            return Cursor(tuple_(*key), model is ArchivedMessage)
+    raise MessageCursorError(f"Message {message_id} not found")
+
+
+async def _history_sources(
+    db, conversation_id: UUID,
+    before: UUID | None = None, after: UUID | None = None,
+):
+    """Запросы сообщений диалога для keyset-пагинации по (timestamp, id):
+    сначала архив, потом messages.
+
+    В архив переносятся самые старые сообщения диалога, поэтому история
+    - это архив, за которым идет messages. Курсоры before/after - id
+    сообщений этого диалога в любой из таблиц.
+    """
+    sources = []
+    before_cursor = after_cursor = None
+    if before is not None:
+        before_cursor = await _get_cursor(db, conversation_id, before)
+    if after is not None:
+        after_cursor = await _get_cursor(db, conversation_id, after)
+
+    for model in (ArchivedMessage, Message):
+        if model is Message and before_cursor and before_cursor.archived:
+            continue
+        if (
+            model is ArchivedMessage
+            and after_cursor and not after_cursor.archived
+        ):
+            continue
+        # Core-запрос по таблице: строки MessageRow вместо ORM-объектов
+        table = model.__table__
+        query = select(*MessageRow.columns(table)).where(
+            table.c.conversation_id == conversation_id
+        )
+        message_key = tuple_(table.c.timestamp, table.c.id)
+        if before_cursor is not None:
+            query = query.where(message_key < before_cursor.key)
+        if after_cursor is not None:
+            query = query.where(message_key > after_cursor.key)
+        sources.append((table, query))
+    return sources
+
+
+class DialogInfo(NamedTuple):
+    is_group: bool
+    chat_id: UUID
+
+
+@timed(db_crud_duration)
+async def get_dialog_info(db, conversation_id: UUID) -> DialogInfo | None:
+    """Тип чата диалога без загрузки самого чата и его участников"""
+    result = await db.execute(
+        select(Conversation.public_chat_id, Conversation.private_chat_id)
+        .where(Conversation.id == conversation_id)
     )
-    data = conversation.scalars().first()
-    if not data:
+    row = result.first()
+    if row is None:
         return None
-    return data.public_chat or data.private_chats
-
+    public_chat_id, private_chat_id = row
+    if public_chat_id is not None:
+        return DialogInfo(is_group=True, chat_id=public_chat_id)
+    return DialogInfo(is_group=False, chat_id=private_chat_id)
 
-async def get_conversation_messages(
-    db, conversation_id: UUID
-) -> List[Message]:
 
+@timed(db_crud_duration)
+async def get_chat_member_ids(db, dialog: DialogInfo) -> List[UUID]:
+    """Участники чата диалога: получатели его сообщений"""
+    if dialog.is_group:
+        members, chat_id = user_public_chats, user_public_chats.c.public_chat_id
+    else:
+        members, chat_id = (
+            user_private_chats, user_private_chats.c.private_chat_id
+        )
     result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.timestamp)
+        select(members.c.user_id).where(chat_id == dialog.chat_id)
     )
     return result.scalars().all()
 
 
+class MessagePage(NamedTuple):
+    messages: List[MessageRow]
+    has_more: bool
+
+
+@timed(db_crud_duration)
+async def get_conversation_messages(
+    db, conversation_id: UUID,
+    before: UUID | None = None, after: UUID | None = None,
+    limit: int | None = None,
+) -> MessagePage:
+    """Страница истории в хронологическом порядке.
+
+    Без after возвращаются последние limit сообщений перед before,
+    с after - первые limit сообщений после него.
+    """
+    sources = await _history_sources(db, conversation_id, before, after)
+    if after is None:
+        # С конца истории: сначала messages, затем архив
+        sources.reverse()
+
+    messages = []
+    for table, query in sources:
+        if after is None:
+            query = query.order_by(table.c.timestamp.desc(), table.c.id.desc())
+        else:
+            query = query.order_by(table.c.timestamp, table.c.id)
+        if limit is not None:
+            # Лишняя строка показывает, есть ли следующая страница
+            query = query.limit(limit + 1 - len(messages))
+
+        result = await db.execute(query)
+        messages.extend(map(MessageRow._make, result.all()))
+        if limit is not None and len(messages) > limit:
+            break
+
+    has_more = limit is not None and len(messages) > limit
+    if has_more:
+        messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+    return MessagePage(messages, has_more)
+
+
+@timed(db_crud_duration)
+async def stream_conversation_messages(
+    db, conversation_id: UUID, after: UUID | None = None,
+    chunk_size: int = 200,
+) -> AsyncIterator[List[MessageRow]]:
+    """Отдает всю историю после after пачками по мере чтения с
+    серверного курсора. before и limit у потока нет"""
+    for table, query in await _history_sources(
+        db, conversation_id, after=after
+    ):
+        result = await db.stream(
+            query.order_by(table.c.timestamp, table.c.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions(chunk_size):
+            yield list(map(MessageRow._make, partition))
+
+
+@timed(db_crud_duration)
 async def create_message(
     db, user: User, message: str, conversation_id: UUID
 ) -> None:
+    await _insert_messages(db, [{
+        "content": message,
+        "user_id": user.id,
+        "conversation_id": conversation_id,
+    }])
+    await db.commit()
 
-    db_message = Message(
-        user_id=user.id, content=message, conversation_id=conversation_id
-    )
-    db.add(db_message)
+
+@timed(db_crud_duration)
+async def create_messages(db, rows: List[dict]) -> None:
+    """Сохраняет пачку сообщений одним многострочным INSERT"""
+    if not rows:
+        return
+    await _insert_messages(db, rows)
     await db.commit()
 
 
+async def _insert_messages(db, rows: List[dict]) -> None:
+    """Вставляет сообщения и в той же транзакции обновляет последнее
+    сообщение и счетчик диалогов, а курсор чтения автора переносит на
+    его сообщение"""
+    # id и время нужны до вставки, чтобы записать их в диалог
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [{"id": uuid.uuid4(), "timestamp": now, **row} for row in rows]
+    await db.execute(insert(Message).values(rows))
+
+    by_conversation: dict[UUID, List[dict]] = {}
+    for row in rows:
+        by_conversation.setdefault(row["conversation_id"], []).append(row)
+
+    cursors: dict[tuple[UUID, UUID], tuple[int, UUID]] = {}
+    for conversation_id, conversation_rows in by_conversation.items():
+        last = max(
+            conversation_rows, key=lambda row: (row["timestamp"], row["id"])
+        )
+        # Сообщение с другого воркера могло записаться позже, но с
+        # большим временем - последнее сообщение назад не переносим
+        newer = (
+            Conversation.last_message_at.is_(None)
+            | (Conversation.last_message_at <= last["timestamp"])
+        )
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                message_count=Conversation.message_count
+                + len(conversation_rows),
+                last_message_id=case(
+                    (newer, last["id"]), else_=Conversation.last_message_id
+                ),
+                last_message_at=case(
+                    (newer, last["timestamp"]),
+                    else_=Conversation.last_message_at,
+                ),
+            )
+            .returning(Conversation.message_count)
+        )
+        first_number = result.scalar_one() - len(conversation_rows) + 1
+        for number, row in enumerate(conversation_rows, first_number):
+            cursors[row["user_id"], conversation_id] = (number, row["id"])
+
+    await _advance_read_cursors(db, [
+        {
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "read_count": number,
+            "last_read_message_id": message_id,
+        }
+        for (user_id, conversation_id), (number, message_id) in cursors.items()
+    ])
+
+
+async def _advance_read_cursors(db, rows: List[dict]) -> None:
+    """Переносит курсоры чтения вперед, но не назад"""
+    statement = dialect_insert(db, ConversationRead).values(rows)
+    ahead = ConversationRead.read_count < statement.excluded.read_count
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[
+            ConversationRead.user_id, ConversationRead.conversation_id,
+        ],
+        set_={
+            "read_count": case(
+                (ahead, statement.excluded.read_count),
+                else_=ConversationRead.read_count,
+            ),
+            "last_read_message_id": case(
+                (ahead, statement.excluded.last_read_message_id),
+                else_=ConversationRead.last_read_message_id,
+            ),
+        },
+    ))
+
+
+@timed(db_crud_duration)
+async def mark_conversation_read(
+    db, user_id: UUID, conversation_id: UUID
+) -> int:
+    """Отмечает прочитанными все сообщения диалога, возвращает их число"""
+    result = await db.execute(
+        select(Conversation.message_count, Conversation.last_message_id)
+        .where(Conversation.id == conversation_id)
+    )
+    read_count, last_message_id = result.one()
+    if read_count:
+        await _advance_read_cursors(db, [{
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "read_count": read_count,
+            "last_read_message_id": last_message_id,
+        }])
+        await db.commit()
+    return read_count
+
+
+@timed(db_crud_duration)
 async def has_private_chat_permission(
     db, chat_id: UUID, user_id: UUID
 ) -> bool:
@@ -0,0 +1,122 @@
+"""Компактная двоичная кодировка сообщений для сокетов.
+
+Клиент включает ее при подключении: auth={"token": ..., "encoding": "compact"}.
+Тогда receive_message, receive_messages и message_history приходят
+не списком JSON-объектов, а байтами (бинарное вложение socket.io):
+
+    flags: uint8              бит 0 - тело сжато zlib
+    тело:
+        count: uint32
+        count записей:
+            id, conversation_id, user_id: 16 байт UUID
+            timestamp: int64, миллисекунды от эпохи UTC
+            email_length: uint16, content_length: uint32
+            email, content: UTF-8
+
+Все числа в сетевом порядке байт. Тело сжимается, если оно не меньше
+SOCKET_COMPACT_DEFLATE_MIN_BYTES (обычно это пачки истории).
+"""
+import struct
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Iterable, NamedTuple
+
+# Клиенты с компактной кодировкой входят в комнату "<room>#compact"
+COMPACT_ROOM_SUFFIX = "#compact"
+
+FLAG_DEFLATE = 1
+FLAGS = struct.Struct("!B")
+COUNT = struct.Struct("!I")
+RECORD = struct.Struct("!16s16s16sqHI")
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+class MessageRecord(NamedTuple):
+    id: uuid.UUID
+    conversation_id: uuid.UUID
+    user_id: uuid.UUID
+    user_email: str | None
+    content: str
+    timestamp: datetime
+
+
+def compact_room(room: str) -> str:
+    return room + COMPACT_ROOM_SUFFIX
+
+
+def encode_messages(
+    records: Iterable[MessageRecord], deflate_min_bytes: int = 0
+) -> bytes:
+    """Кодирует сообщения, deflate_min_bytes=0 отключает сжатие"""
+    parts = [b""]
+    count = 0
+    for record in records:
+        email = (record.user_email or "").encode()
+        content = record.content.encode()
+        parts.append(RECORD.pack(
+            record.id.bytes,
+            record.conversation_id.bytes,
+            record.user_id.bytes,
+            (record.timestamp - EPOCH) // MILLISECOND,
+            len(email),
+            len(content),
+        ))
+        parts.append(email)
+        parts.append(content)
+        count += 1
+    parts[0] = COUNT.pack(count)
+    body = b"".join(parts)
+
+    if deflate_min_bytes and len(body) >= deflate_min_bytes:
+        return FLAGS.pack(FLAG_DEFLATE) + zlib.compress(body)
+    return FLAGS.pack(0) + body
+
+
+def decode_messages(payload: bytes) -> list[dict]:
+    """Раскодирует сообщения в словари с теми же ключами, что
+    Message.serialize, timestamp - datetime в UTC без tzinfo"""
+    (flags,) = FLAGS.unpack_from(payload)
+    body = memoryview(payload)[FLAGS.size:]
+    if flags & FLAG_DEFLATE:
+        body = memoryview(zlib.decompress(body))
+
+    (count,) = COUNT.unpack_from(body)
+    offset = COUNT.size
+    messages = []
+    # Диалог и авторы в пачке повторяются
+    known_ids: dict[bytes, str] = {}
+    for _ in range(count):
+        (
+            message_id, conversation_id, user_id,
+            timestamp, email_length, content_length,
+        ) = RECORD.unpack_from(body, offset)
+        offset += RECORD.size
+        email = bytes(body[offset:offset + email_length]).decode()
+        offset += email_length
+        content = bytes(body[offset:offset + content_length]).decode()
+        offset += content_length
+        user = known_ids.get(user_id)
+        if user is None:
+            user = known_ids[user_id] = _uuid_str(user_id)
+        conversation = known_ids.get(conversation_id)
+        if conversation is None:
+            conversation = known_ids[conversation_id] = _uuid_str(
+                conversation_id
+            )
+        messages.append({
+            "id": _uuid_str(message_id),
+            "content": content,
+            "timestamp": EPOCH + timestamp * MILLISECOND,
+            "user_id": user,
+            "user_email": email or None,
+            "conversation_id": conversation,
+        })
+    return messages
+
+
+def _uuid_str(raw: bytes) -> str:
+    # То же, что str(uuid.UUID(bytes=raw)), без создания объекта UUID
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
@@ -9,3 +9,7 @@ class SocketPermissionError(SocketException):
 
 class SocketUserNotFoundError(SocketException):
     ...
+
+
+class MessageCursorError(SocketException):
+    ...
@@ -0,0 +1,88 @@
+from collections import defaultdict
+from typing import List
+from uuid import UUID
+
+from src.chats.events import on_membership_changed
+from src.core import config
+from src.core.cache import AsyncTTLCache
+from src.socket_server import crud
+
+# Тип чата диалога не меняется, поэтому общий для всех соединений
+dialog_cache = AsyncTTLCache(
+    maxsize=config.DIALOG_CACHE_MAXSIZE, ttl=config.DIALOG_CACHE_TTL_SECONDS,
+    name="dialog",
+)
+
+
+async def get_cached_dialog_info(
+    db, conversation_id: UUID
+) -> crud.DialogInfo | None:
+    return await dialog_cache.get_or_load(
+        conversation_id, lambda: crud.get_dialog_info(db, conversation_id)
+    )
+
+
+# Участники меняются, поэтому кеш сбрасывается при изменении состава
+chat_members_cache = AsyncTTLCache(
+    maxsize=config.CHAT_MEMBERS_CACHE_MAXSIZE,
+    ttl=config.CHAT_MEMBERS_CACHE_TTL_SECONDS,
+    name="chat_members",
+)
+
+
+async def get_cached_chat_members(
+    db, dialog: crud.DialogInfo
+) -> frozenset[UUID]:
+    async def load():
+        return frozenset(await crud.get_chat_member_ids(db, dialog))
+
+    return await chat_members_cache.get_or_load(dialog.chat_id, load)
+
+
+class RoomPermissions:
+    """Диалоги, к которым у соединения уже проверен доступ"""
+
+    def __init__(self):
+        self._conversations: dict[str, set[UUID]] = {}
+        self._sids: defaultdict[UUID, set[str]] = defaultdict(set)
+        self._users: dict[str, UUID] = {}
+
+    def connect(self, sid: str, user_id: UUID) -> None:
+        self._conversations[sid] = set()
+        self._users[sid] = user_id
+        self._sids[user_id].add(sid)
+
+    def disconnect(self, sid: str) -> None:
+        self._conversations.pop(sid, None)
+        user_id = self._users.pop(sid, None)
+        if user_id is None:
+            return
+        sids = self._sids[user_id]
+        sids.discard(sid)
+        if not sids:
+            del self._sids[user_id]
+
+    def allowed(self, sid: str, conversation_id: UUID) -> bool:
+        return conversation_id in self._conversations.get(sid, ())
+
+    def grant(self, sid: str, conversation_id: UUID) -> None:
+        if sid in self._conversations:
+            self._conversations[sid].add(conversation_id)
+
+    def users(self):
+        """Пользователи, подключенные к этому процессу"""
+        return self._sids.keys()
+
+    def invalidate_user(self, user_id: UUID) -> None:
+        for sid in self._sids.get(user_id, ()):
+            self._conversations[sid].clear()
+
+
+room_permissions = RoomPermissions()
+
+
+@on_membership_changed
+async def _invalidate_members(user_ids: List[UUID], chat_id: UUID) -> None:
+    chat_members_cache.invalidate(chat_id)
+    for user_id in user_ids:
+        room_permissions.invalidate_user(user_id)
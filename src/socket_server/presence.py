@@ -0,0 +1,322 @@
+import asyncio
+import pickle
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+from uuid import UUID
+
+from src.core import config
+from src.socket_server.pubsub import PRESENCE_HELLO, encode_frame, read_frame
+
+
+class PresentUser:
+    """Пользователь соединения: только то, что нужно сокетам"""
+
+    __slots__ = ("id", "email")
+
+    def __init__(self, id: UUID, email: str):
+        self.id = id
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user) -> "PresentUser":
+        return cls(user.id, user.email)
+
+    def __repr__(self):
+        return f"PresentUser(id={self.id}, email={self.email})"
+
+
+class Connection:
+    """Состояние одного sid: пользователь, комнаты и время последнего
+    события typing по комнатам"""
+
+    __slots__ = ("user", "rooms", "typing")
+
+    def __init__(self, user: PresentUser):
+        self.user = user
+        self.rooms: set[str] = set()
+        self.typing: dict[str, float] = {}
+
+
+class PresenceRegistry:
+    """Подключенные пользователи.
+
+    Соединения (sid -> Connection) всегда локальны для воркера, а sid
+    пользователя и пользователи комнаты хранятся там, где их видят все
+    воркеры. Базовый класс держит все в памяти процесса и подходит для
+    одного воркера.
+    """
+
+    def __init__(self):
+        self.connections: dict[str, Connection] = {}
+        self._user_sids: defaultdict[UUID, set[str]] = defaultdict(set)
+        # Комната -> пользователь -> число его sid в комнате
+        self._room_users: defaultdict[str, dict[UUID, int]] = defaultdict(dict)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self.connections
+
+    def __getitem__(self, sid: str) -> PresentUser:
+        return self.connections[sid].user
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def get(self, sid: str) -> PresentUser | None:
+        connection = self.connections.get(sid)
+        return connection.user if connection is not None else None
+
+    def rooms(self, sid: str) -> set[str]:
+        connection = self.connections.get(sid)
+        return set(connection.rooms) if connection is not None else set()
+
+    async def connect(self, sid: str, user) -> PresentUser:
+        present = PresentUser.from_user(user)
+        self.connections[sid] = Connection(present)
+        await self._add_sid(present.id, sid)
+        return present
+
+    async def disconnect(self, sid: str) -> PresentUser | None:
+        """Убирает sid; комнаты надо покинуть заранее через leave_room"""
+        connection = self.connections.pop(sid, None)
+        if connection is None:
+            return None
+        await self._remove_sid(connection.user.id, sid)
+        return connection.user
+
+    async def enter_room(self, sid: str, room: str) -> bool:
+        """Добавляет sid в комнату. True, если пользователь появился
+        в комнате впервые"""
+        connection = self.connections.get(sid)
+        if connection is None or room in connection.rooms:
+            return False
+        connection.rooms.add(room)
+        return await self._add_room_user(room, connection.user.id) == 1
+
+    async def leave_room(self, sid: str, room: str) -> bool:
+        """Убирает sid из комнаты. True, если у пользователя не осталось
+        в ней других sid"""
+        connection = self.connections.get(sid)
+        if connection is None or room not in connection.rooms:
+            return False
+        connection.rooms.discard(room)
+        connection.typing.pop(room, None)
+        return await self._remove_room_user(room, connection.user.id) == 0
+
+    def in_room(self, sid: str, room: str) -> bool:
+        connection = self.connections.get(sid)
+        return connection is not None and room in connection.rooms
+
+    def typing(self, sid: str, room: str, active: bool, interval: float) -> bool:
+        """Нужно ли разослать событие typing.
+
+        Начало набора рассылается не чаще раза в interval секунд,
+        окончание - только если перед ним было разослано начало.
+        """
+        connection = self.connections.get(sid)
+        if connection is None or room not in connection.rooms:
+            return False
+        if not active:
+            return connection.typing.pop(room, None) is not None
+        now = time.monotonic()
+        last = connection.typing.get(room)
+        if last is not None and now - last < interval:
+            return False
+        connection.typing[room] = now
+        return True
+
+    async def is_online(self, user_id: UUID) -> bool:
+        return bool(await self.user_sids(user_id))
+
+    async def user_sids(self, user_id: UUID) -> set[str]:
+        return set(self._user_sids.get(user_id, ()))
+
+    async def room_users(self, room: str) -> set[UUID]:
+        return set(self._room_users.get(room, ()))
+
+    async def _add_sid(self, user_id: UUID, sid: str) -> None:
+        self._user_sids[user_id].add(sid)
+
+    async def _remove_sid(self, user_id: UUID, sid: str) -> None:
+        sids = self._user_sids.get(user_id)
+        if sids is None:
+            return
+        sids.discard(sid)
+        if not sids:
+            del self._user_sids[user_id]
+
+    async def _add_room_user(self, room: str, user_id: UUID) -> int:
+        users = self._room_users[room]
+        users[user_id] = users.get(user_id, 0) + 1
+        return users[user_id]
+
+    async def _remove_room_user(self, room: str, user_id: UUID) -> int:
+        users = self._room_users.get(room)
+        if users is None or user_id not in users:
+            return 0
+        users[user_id] -= 1
+        if users[user_id] > 0:
+            return users[user_id]
+        del users[user_id]
+        if not users:
+            del self._room_users[room]
+        return 0
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """Множества sid пользователей и пользователи комнат в Redis,
+    общие для всех воркеров"""
+
+    def __init__(self, url: str, prefix: str = "presence"):
+        super().__init__()
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError(
+                'Redis package is not installed (Run "pip install redis").'
+            )
+        self.redis = aioredis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, user_id: UUID) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def _room_key(self, room: str) -> str:
+        return f"{self.prefix}:room:{room}"
+
+    async def user_sids(self, user_id: UUID) -> set[str]:
+        return {
+            sid.decode() for sid in await self.redis.smembers(self._key(user_id))
+        }
+
+    async def room_users(self, room: str) -> set[UUID]:
+        return {
+            UUID(user_id.decode())
+            for user_id in await self.redis.hkeys(self._room_key(room))
+        }
+
+    async def _add_sid(self, user_id: UUID, sid: str) -> None:
+        key = self._key(user_id)
+        # TTL убирает sid воркеров, завершившихся без disconnect
+        await self.redis.pipeline().sadd(key, sid).expire(
+            key, config.PRESENCE_TTL_SECONDS
+        ).execute()
+
+    async def _remove_sid(self, user_id: UUID, sid: str) -> None:
+        await self.redis.srem(self._key(user_id), sid)
+
+    async def _add_room_user(self, room: str, user_id: UUID) -> int:
+        key = self._room_key(room)
+        count, _ = await self.redis.pipeline().hincrby(
+            key, str(user_id), 1
+        ).expire(key, config.PRESENCE_TTL_SECONDS).execute()
+        return count
+
+    async def _remove_room_user(self, room: str, user_id: UUID) -> int:
+        key = self._room_key(room)
+        count = await self.redis.hincrby(key, str(user_id), -1)
+        if count <= 0:
+            await self.redis.hdel(key, str(user_id))
+            return 0
+        return count
+
+
+class BrokerPresenceRegistry(PresenceRegistry):
+    """Множества sid пользователей и пользователи комнат в брокере
+    src.socket_server.broker, общие для всех воркеров на нем.
+
+    Запросы идут по отдельному соединению с брокером по одному; записи
+    воркера брокер удаляет, когда соединение закрывается.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _call(self, method: str, *args):
+        async with self._lock:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    self._reader, self._writer = (
+                        await asyncio.open_unix_connection(self.path)
+                    )
+                    self._writer.write(encode_frame(PRESENCE_HELLO))
+                self._writer.write(encode_frame(pickle.dumps((method, args))))
+                await self._writer.drain()
+                return pickle.loads(await read_frame(self._reader))
+            except (OSError, asyncio.IncompleteReadError):
+                self._writer = None
+                raise
+
+    async def user_sids(self, user_id: UUID) -> set[str]:
+        return await self._call("user_sids", user_id)
+
+    async def room_users(self, room: str) -> set[UUID]:
+        return await self._call("room_users", room)
+
+    async def _add_sid(self, user_id: UUID, sid: str) -> None:
+        await self._call("_add_sid", user_id, sid)
+
+    async def _remove_sid(self, user_id: UUID, sid: str) -> None:
+        await self._call("_remove_sid", user_id, sid)
+
+    async def _add_room_user(self, room: str, user_id: UUID) -> int:
+        return await self._call("_add_room_user", room, user_id)
+
+    async def _remove_room_user(self, room: str, user_id: UUID) -> int:
+        return await self._call("_remove_room_user", room, user_id)
+
+
+class PresenceOwner:
+    """Записи одного воркера в общем PresenceRegistry брокера: их
+    убирает release(), когда воркер отключается"""
+
+    METHODS = frozenset({
+        "user_sids", "room_users",
+        "_add_sid", "_remove_sid", "_add_room_user", "_remove_room_user",
+    })
+
+    def __init__(self, registry: PresenceRegistry):
+        self.registry = registry
+        self.sids: set[tuple[UUID, str]] = set()
+        self.rooms: Counter[tuple[str, UUID]] = Counter()
+
+    async def call(self, method: str, args: tuple):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown presence method: {method}")
+        if method == "_add_sid":
+            self.sids.add(args)
+        elif method == "_remove_sid":
+            self.sids.discard(args)
+        elif method == "_add_room_user":
+            self.rooms[args] += 1
+        elif method == "_remove_room_user":
+            if not self.rooms[args]:
+                return 0
+            self.rooms[args] -= 1
+        return await getattr(self.registry, method)(*args)
+
+    async def release(self) -> None:
+        for user_id, sid in self.sids:
+            await self.registry._remove_sid(user_id, sid)
+        for (room, user_id), count in self.rooms.items():
+            for _ in range(count):
+                await self.registry._remove_room_user(room, user_id)
+        self.sids.clear()
+        self.rooms.clear()
+
+
+def create_presence_registry(url: str) -> PresenceRegistry:
+    # local:// связывает серверы одного процесса, им хватает общей памяти
+    parsed = urlparse(url)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisPresenceRegistry(url)
+    if parsed.scheme == "unix":
+        return BrokerPresenceRegistry(parsed.path)
+    return PresenceRegistry()
+
+
+presence = create_presence_registry(config.SOCKETIO_MESSAGE_QUEUE)
@@ -0,0 +1,122 @@
+"""Менеджеры клиентов socket.io для нескольких воркеров.
+
+Адрес очереди задается SOCKETIO_MESSAGE_QUEUE:
+
+- пусто - комнаты только в памяти процесса (один воркер);
+- redis://host:port/0 - AsyncRedisManager из python-socketio;
+- unix:///path/to.sock - брокер src.socket_server.broker на unix-сокете,
+  для нескольких воркеров на одной машине без Redis;
+- local://channel - очередь в памяти процесса, позволяет поднять несколько
+  серверов socket.io в одном процессе (для проверок без Redis).
+"""
+import asyncio
+import pickle
+import struct
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from src.core.logging import logger
+
+FRAME_HEADER = struct.Struct("!I")
+# Первый кадр соединения с брокером выбирает режим: пересылка событий
+# socket.io или общие множества присутствия (src/socket_server/presence.py)
+PUBSUB_HELLO = b"pubsub"
+PRESENCE_HELLO = b"presence"
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (size,) = FRAME_HEADER.unpack(header)
+    return await reader.readexactly(size)
+
+
+def encode_frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """Очередь в памяти: все менеджеры процесса с одним каналом связаны"""
+
+    name = 'local'
+    _subscribers: defaultdict[str, set[asyncio.Queue]] = defaultdict(set)
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        if not write_only:
+            self._subscribers[channel].add(self._queue)
+
+    async def _publish(self, data):
+        # Копия через pickle, как при передаче между процессами
+        message = pickle.dumps(data)
+        for queue in self._subscribers[self.channel]:
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+class UnixSocketPubSubManager(AsyncPubSubManager):
+    """Клиент брокера src.socket_server.broker"""
+
+    name = 'unix'
+
+    def __init__(self, path: str, channel='socketio', write_only=False,
+                 logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader: asyncio.StreamReader | None = None
+        self._connecting = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._connecting:
+            if self._writer is None or self._writer.is_closing():
+                self._reader, self._writer = (
+                    await asyncio.open_unix_connection(self.path)
+                )
+                self._writer.write(encode_frame(PUBSUB_HELLO))
+
+    async def _publish(self, data):
+        try:
+            await self._connect()
+            self._writer.write(encode_frame(pickle.dumps(data)))
+            await self._writer.drain()
+        except OSError:
+            logger.error(f"Cannot publish to broker {self.path}")
+            self._writer = None
+
+    async def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                await self._connect()
+                retry_sleep = 1
+                while True:
+                    yield await read_frame(self._reader)
+            except (OSError, asyncio.IncompleteReadError) as ex:
+                logger.error(
+                    f"Broker {self.path} unavailable ({ex!r}), "
+                    f"retry in {retry_sleep}s"
+                )
+                self._writer = None
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+def create_client_manager(url: str) -> socketio.AsyncManager | None:
+    if not url:
+        return None
+
+    parsed = urlparse(url)
+    if parsed.scheme in ("redis", "rediss"):
+        return socketio.AsyncRedisManager(url)
+    if parsed.scheme == "unix":
+        return UnixSocketPubSubManager(parsed.path)
+    if parsed.scheme == "local":
+        return LocalPubSubManager(channel=parsed.netloc or "socketio")
+    raise ValueError(f"Unsupported socket.io message queue: {url}")
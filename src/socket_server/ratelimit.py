@@ -0,0 +1,135 @@
+"""Ограничение частоты событий сокетов.
+
+Лимиты задаются строкой SOCKET_RATE_LIMITS, через запятую по событию:
+
+    send_message=10/20:20/40,message_history=2/5:4/10
+
+10/20 - на соединение (sid): 10 событий в секунду, запас 20 подряд,
+20/40 - так же на пользователя по всем его соединениям этого воркера.
+Нулевая частота снимает ограничение. События без лимита не ограничиваются.
+"""
+import time
+from typing import NamedTuple
+from uuid import UUID
+
+# Полные корзины удаляются, когда их становится больше порога
+SWEEP_MIN_BUCKETS = 1024
+
+
+class Limit(NamedTuple):
+    rate: float
+    burst: float
+
+
+class EventLimit(NamedTuple):
+    sid: Limit
+    user: Limit
+
+
+def parse_limits(spec: str) -> dict[str, EventLimit]:
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            event, value = item.split("=")
+            sid, user = (
+                Limit(*(float(number) for number in part.split("/")))
+                for part in value.split(":")
+            )
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid socket rate limit: {item!r}")
+        limits[event.strip()] = EventLimit(sid, user)
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token bucket на каждый ключ: limit.rate токенов в секунду,
+    не больше limit.burst"""
+
+    def __init__(self, limit: Limit):
+        self.rate = limit.rate
+        self.burst = max(limit.burst, 1)
+        self._buckets: dict = {}
+        self._sweep_at = SWEEP_MIN_BUCKETS
+
+    def acquire(self, key) -> float:
+        """0, если событие разрешено, иначе через сколько секунд
+        появится токен"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._sweep_at:
+                self._sweep(now)
+            bucket = self._buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(
+                self.burst, bucket.tokens + (now - bucket.updated) * self.rate
+            )
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / self.rate
+
+    def forget(self, key) -> None:
+        self._buckets.pop(key, None)
+
+    def _sweep(self, now: float) -> None:
+        # Корзина, успевшая наполниться, не отличается от новой
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * self.rate < self.burst
+        }
+        self._sweep_at = max(SWEEP_MIN_BUCKETS, 2 * len(self._buckets))
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SocketRateLimits:
+    """Лимиты событий по sid и пользователю"""
+
+    def __init__(self, limits: dict[str, EventLimit]):
+        self._limiters = {
+            event: (RateLimiter(limit.sid), RateLimiter(limit.user))
+            for event, limit in limits.items()
+        }
+
+    def __contains__(self, event: str) -> bool:
+        return event in self._limiters
+
+    def check(
+        self, event: str, sid: str, user_id: UUID | None
+    ) -> tuple[str, float] | None:
+        """None, если событие разрешено, иначе (sid или user, секунды
+        до следующей попытки)"""
+        limiters = self._limiters.get(event)
+        if limiters is None:
+            return None
+        by_sid, by_user = limiters
+        retry_after = by_sid.acquire(sid)
+        if retry_after:
+            return "sid", retry_after
+        if user_id is not None:
+            retry_after = by_user.acquire(user_id)
+            if retry_after:
+                return "user", retry_after
+        return None
+
+    def disconnect(self, sid: str) -> None:
+        # Корзины пользователя нужны его остальным соединениям,
+        # их уберет очистка полных корзин
+        for by_sid, _ in self._limiters.values():
+            by_sid.forget(sid)
@@ -1,26 +1,149 @@
-import socketio
+import functools
 import uuid
 
+from src.chats.events import on_membership_changed
+from src.chats.models import Message, MessageRow
+from src.core import config, metrics
 from src.core.jwt import get_current_user
 from src.core.logging import logger
 from src.database.database import SessionFactory
+from src.socket_server.backpressure import BoundedAsyncServer
+from src.socket_server.batching import RoomBatcher, batch_room
+from src.socket_server.encoding import (
+    MessageRecord,
+    compact_room,
+    encode_messages,
+)
 from src.socket_server.exceptions import (
-    SocketPermissionError,
+    MessageCursorError,
     SocketUserNotFoundError,
 )
+from src.socket_server.permissions import (
+    get_cached_chat_members,
+    get_cached_dialog_info,
+    room_permissions,
+)
+from src.socket_server.presence import presence
+from src.socket_server.pubsub import create_client_manager
+from src.socket_server.ratelimit import SocketRateLimits, parse_limits
 from src.socket_server.utils import (
-    get_message_history,
-    have_enter_room_permission,
-    save_user_message,
+    authorize_room,
+    get_history_limit,
+    get_messages_page,
+    stream_message_history,
+)
+from src.socket_server.writer import message_writer
+
+
+sio = BoundedAsyncServer(
+    async_mode='asgi',
+    client_manager=create_client_manager(config.SOCKETIO_MESSAGE_QUEUE),
+    outbound_queue_size=config.SOCKET_OUTBOUND_QUEUE_SIZE,
+    slow_consumer_policy=config.SOCKET_SLOW_CONSUMER_POLICY,
+)
+rate_limits = SocketRateLimits(
+    parse_limits(config.SOCKET_RATE_LIMITS)
+    if config.SOCKET_RATE_LIMITS_ENABLED else {}
+)
+socket_rate_limited = metrics.counter(
+    "socketio_rate_limited", "Socket events rejected by rate limits",
+    ("event", "scope"),
+)
+
+
+# Каждое соединение пользователя при подключении входит в его комнату
+USER_ROOM_PREFIX = "user:"
+
+
+def user_room(user_id) -> str:
+    return f"{USER_ROOM_PREFIX}{user_id}"
+
+
+def _local_rooms() -> dict:
+    # Кроме комнат диалогов есть комната None со всеми sid,
+    # комната каждого sid с ним одним и комнаты пользователей
+    return {
+        room: members
+        for room, members in sio.manager.rooms.get('/', {}).items()
+        if room is not None and room not in presence
+        and not room.startswith(USER_ROOM_PREFIX)
+    }
+
+
+def _has_audience(room: str) -> bool:
+    # С общей очередью получатели могут быть на других воркерах
+    if config.SOCKETIO_MESSAGE_QUEUE:
+        return True
+    return bool(sio.manager.rooms.get('/', {}).get(room))
+
+
+def _member_rooms(room: str) -> tuple[str, ...]:
+    """Все комнаты доставки диалога или пользователя, вместе они
+    покрывают все соединения"""
+    return (
+        room, batch_room(room),
+        compact_room(room), compact_room(batch_room(room)),
+    )
+
+
+def _delivery_room(room: str, session: dict) -> str:
+    """Комната, через которую сокет получает сообщения диалога"""
+    if session["batch"]:
+        room = batch_room(room)
+    if session["compact"]:
+        room = compact_room(room)
+    return room
+
+
+metrics.gauge(
+    "socketio_connected_sids", "Sockets connected to this worker",
+    function=lambda: len(presence),
+)
+metrics.histogram(
+    "socketio_room_members", "Local members per conversation room",
+    buckets=metrics.SIZE_BUCKETS,
+    function=lambda: (len(members) for members in _local_rooms().values()),
 )
+metrics.gauge(
+    "socketio_outbound_queue_max",
+    "Longest outbound packet queue among local connections",
+    function=sio.max_outbound_queue,
+)
+
+
+def rate_limited(event: str):
+    """Отклоняет событие сверх лимита SOCKET_RATE_LIMITS.
+
+    Клиент получает в ack {"error": "rate_limited", "retry_after": секунды};
+    событие error не отправляется, чтобы поток запросов не превращался
+    в такой же поток ответов.
+    """
 
+    def decorator(handler):
+        if event not in rate_limits:
+            return handler
 
-sio = socketio.AsyncServer(async_mode='asgi')
+        @functools.wraps(handler)
+        async def wrapper(sid, *args):
+            user = presence.get(sid)
+            rejected = rate_limits.check(
+                event, sid, user.id if user is not None else None
+            )
+            if rejected is not None:
+                scope, retry_after = rejected
+                socket_rate_limited.labels(event, scope).inc()
+                return {
+                    "error": "rate_limited",
+                    "retry_after": round(retry_after, 3),
+                }
+            return await handler(sid, *args)
+        return wrapper
 
-connected_users = {}
+    return decorator
 
 
 @sio.event
+@metrics.timed(metrics.socket_event_duration)
 async def connect(sid, environ, auth):
     token = auth.get("token")
 
@@ -42,10 +165,25 @@ async def connect(sid, environ, auth):
             return False
 
     # Сохраняем ID сессии и пользователя
-    connected_users[sid] = user
+    await presence.connect(sid, user)
+    room_permissions.connect(sid, user.id)
+    # Клиент может попросить сообщения пачками receive_messages
+    # и в двоичной кодировке
+    session = {
+        "batch": config.SOCKET_BATCHING_ENABLED and bool(auth.get("batch")),
+        "compact": (
+            config.SOCKET_COMPACT_ENABLED
+            and auth.get("encoding") == "compact"
+        ),
+    }
+    await sio.save_session(sid, session)
+    # Сообщения диалогов пользователя приходят без enter_room
+    await sio.enter_room(sid, _delivery_room(user_room(user.id), session))
 
 
 @sio.event
+@rate_limited('enter_room')
+@metrics.timed(metrics.socket_event_duration)
 async def enter_room(sid, room_id: str):
     try:
         room_uid = uuid.UUID(room_id)
@@ -53,29 +191,114 @@ async def enter_room(sid, room_id: str):
         await sio.emit('error', to=sid,
                        data={"message": "Invalid room id format"})
         return False
-    async with SessionFactory() as db:
-        # Проверяем что пользователю можно присоединиться к комнате
-        if not await have_enter_room_permission(
-            db, connected_users[sid], room_uid
-        ):
-            await sio.emit(
-                'error', to=sid,
-                data={"room_id": room_id, "message": "Access denied"},
-            )
-            return False
+    # Проверяем что пользователю можно присоединиться к комнате
+    if not await authorize_room(sid, presence[sid], room_uid):
+        await sio.emit(
+            'error', to=sid,
+            data={"room_id": room_id, "message": "Access denied"},
+        )
+        return False
 
-    await sio.enter_room(sid, str(room_uid))
+    session = await sio.get_session(sid)
+    await sio.enter_room(sid, _delivery_room(str(room_uid), session))
+    if await presence.enter_room(sid, str(room_uid)):
+        presence_batcher.add(str(room_uid), (presence[sid].id, True))
     logger.info("User %(sid)s joined room %(room_uid)s" % {
         "sid": sid, "room_uid": room_uid})
 
 
 @sio.event
+@rate_limited('leave_room')
+@metrics.timed(metrics.socket_event_duration)
 async def leave_room(sid, room_id):
-    await sio.leave_room(sid, str(room_id))
+    session = await sio.get_session(sid)
+    await sio.leave_room(sid, _delivery_room(str(room_id), session))
+    await _leave_presence(sid, str(room_id))
+
+
+async def _leave_presence(sid, room: str) -> None:
+    if await presence.leave_room(sid, room):
+        presence_batcher.add(room, (presence[sid].id, False))
+
+
+async def _emit_presence(room: str, changes: list[tuple]) -> None:
+    # За окно пользователь мог войти и выйти, важно последнее состояние
+    latest = dict(changes)
+    data = {
+        "room": room,
+        "online": [str(user_id) for user_id, online in latest.items() if online],
+        "offline": [
+            str(user_id) for user_id, online in latest.items() if not online
+        ],
+    }
+    for member_room in _member_rooms(room):
+        if _has_audience(member_room):
+            await _room_emit('presence', data, member_room)
+
+
+presence_batcher = RoomBatcher(
+    _emit_presence,
+    window=config.PRESENCE_BROADCAST_MS / 1000,
+    max_items=config.SOCKET_BATCH_MAX_ITEMS,
+)
+
+
+@sio.on('presence')
+@rate_limited('presence')
+@metrics.timed(metrics.socket_event_duration, 'presence')
+async def room_presence(sid, room_id):
+    """Пользователи, которые сейчас в комнате"""
+    try:
+        room_uid = uuid.UUID(room_id)
+    except (TypeError, ValueError):
+        await sio.emit('error', to=sid,
+                       data={"message": "Invalid room id format"})
+        return False
+    if not await authorize_room(sid, presence[sid], room_uid):
+        await sio.emit(
+            'error', to=sid,
+            data={"room_id": room_id, "message": "Access denied"},
+        )
+        return False
+    users = await presence.room_users(str(room_uid))
+    return {"room": str(room_uid), "online": [str(user) for user in users]}
+
+
+@sio.event
+@rate_limited('typing')
+@metrics.timed(metrics.socket_event_duration)
+async def typing(sid, data):
+    """Начало и конец набора сообщения: {"room": ..., "typing": bool}.
+
+    Клиент может слать событие на каждое нажатие клавиши, рассылка
+    ограничена TYPING_THROTTLE_MS. Разослать можно только в комнату,
+    в которую соединение вошло через enter_room.
+    """
+    room = str(data.get("room")) if isinstance(data, dict) else None
+    active = bool(data.get("typing", True)) if room else False
+    if not room or not presence.typing(
+        sid, room, active, config.TYPING_THROTTLE_MS / 1000
+    ):
+        return False
+
+    user = presence[sid]
+    event = {
+        "room": room, "user_id": str(user.id), "user": user.email,
+        "typing": active,
+    }
+    for member_room in _member_rooms(room):
+        if _has_audience(member_room):
+            metrics.socket_room_emits.labels('typing').inc()
+            await sio.emit('typing', event, room=member_room, skip_sid=sid)
+    return True
 
 
 @sio.event
+@rate_limited('send_message')
+@metrics.timed(metrics.socket_event_duration)
 async def send_message(sid, data):
+    if not isinstance(data, dict):
+        data = {}
     room = data.get('room')
     message = data.get('message')
 
@@ -85,41 +308,277 @@ async def send_message(sid, data):
             'error', data={"message": "Room or message missing"}, to=sid
         )
         return
+    # Не строка сломала бы запись и рассылку всей пачки комнаты
+    if not isinstance(message, str) or len(message) > config.MESSAGE_MAX_LENGTH:
+        await sio.emit('error', to=sid, data={
+            "message": "Message must be a string of at most "
+                       f"{config.MESSAGE_MAX_LENGTH} characters",
+        })
+        return
+    try:
+        conversation_id = uuid.UUID(room)
+    except (TypeError, ValueError, AttributeError):
+        await sio.emit('error', to=sid,
+                       data={"message": "Invalid room id format"})
+        return
+
+    user = presence[sid]
+    if not await authorize_room(sid, user, conversation_id):
+        await sio.emit(
+            'error', to=sid,
+            data={"room_id": room, "message": "Access denied"},
+        )
+        return
 
-    # Сохраняем сообщение пользователя в БД
-    async with SessionFactory() as db:
-        await save_user_message(
-            db, connected_users[sid], message, uuid.UUID(room)
+    # Ставим сообщение пользователя в очередь на запись в БД
+    row, saved = await message_writer.enqueue(user.id, message, conversation_id)
+    optimistic = config.MESSAGE_DELIVERY == "optimistic"
+    if optimistic:
+        await _broadcast_message(user, row)
+
+    try:
+        await saved
+    except Exception:
+        await sio.emit(
+            'error', to=sid,
+            data={"id": str(row["id"]), "message": "Message not saved"},
         )
+        return {"id": str(row["id"]), "saved": False}
+
+    if not optimistic:
+        await _broadcast_message(user, row)
+    return {"id": str(row["id"]), "saved": True}
+
 
-    # Отправляем сообщение всем участникам комнаты
-    await sio.emit(
-        'receive_message',
-        data={"user": connected_users[sid].email, "message": message},
-        room=room
+def _message_data(record: MessageRecord) -> dict:
+    return {
+        "id": str(record.id),
+        "room": str(record.conversation_id),
+        "user": record.user_email,
+        "message": record.content,
+        "timestamp": str(record.timestamp),
+    }
+
+
+async def _room_emit(event: str, data, room: str) -> None:
+    if not _has_audience(room):
+        return
+    metrics.socket_emit_fanout.observe(
+        len(sio.manager.rooms.get('/', {}).get(room, ()))
     )
+    metrics.socket_room_emits.labels(event).inc()
+    await sio.emit(event, data=data, room=room)
 
 
-@sio.event
-async def message_history(sid, room_id):
+async def _rooms_emit(event: str, data, rooms: list[str]) -> None:
+    """Одно событие в несколько комнат: соединение в нескольких из них
+    получает его один раз, в общую очередь уходит одна публикация"""
+    rooms = [room for room in rooms if _has_audience(room)]
+    if not rooms:
+        return
+    local = sio.manager.rooms.get('/', {})
+    metrics.socket_emit_fanout.observe(
+        sum(len(local.get(room, ())) for room in rooms)
+    )
+    metrics.socket_room_emits.labels(event).inc()
+    await sio.emit(event, data=data, room=rooms)
+
+
+async def _recipient_rooms(conversation_id: uuid.UUID) -> list[str]:
+    """Комната диалога и комнаты его участников, в том числе группового
+    чата.
+
+    Участники чата - один запрос на диалог, дальше из кеша. Все комнаты
+    уходят в один emit (_rooms_emit), то есть с общей очередью это одна
+    публикация на формат доставки, а не по одной на участника. Без общей
+    очереди берутся только пользователи, подключенные к этому процессу.
+    В комнату диалога входят через enter_room читатели публичного чата,
+    которые к нему не присоединились.
+    """
     async with SessionFactory() as db:
-        # Получаем историю сообщений
-        messages = await get_message_history(
-            db, connected_users[sid], uuid.UUID(room_id)
+        dialog = await get_cached_dialog_info(db, conversation_id)
+        if dialog is None:
+            members = frozenset()
+        else:
+            members = await get_cached_chat_members(db, dialog)
+    if config.SOCKETIO_MESSAGE_QUEUE:
+        users = members
+    else:
+        connected = room_permissions.users()
+        if len(connected) < len(members):
+            users = [user for user in connected if user in members]
+        else:
+            users = [user for user in members if user in connected]
+    return [str(conversation_id), *map(user_room, users)]
+
+
+async def _broadcast_message(user, row: dict) -> None:
+    # Отправляем сообщение всем участникам диалога на все их соединения
+    rooms = await _recipient_rooms(row["conversation_id"])
+    record = MessageRecord(
+        row["id"], row["conversation_id"], user.id, user.email,
+        row["content"], row["timestamp"],
+    )
+    await _rooms_emit('receive_message', _message_data(record), rooms)
+    compact = [compact_room(room) for room in rooms]
+    if any(_has_audience(room) for room in compact):
+        await _rooms_emit(
+            'receive_message', encode_messages([record]), compact
+        )
+    if config.SOCKET_BATCHING_ENABLED:
+        room_batcher.add(str(row["conversation_id"]), record)
+
+
+async def _emit_batch(room: str, records: list[MessageRecord]) -> None:
+    rooms = [
+        batch_room(recipient)
+        for recipient in await _recipient_rooms(uuid.UUID(room))
+    ]
+    if any(_has_audience(room) for room in rooms):
+        await _rooms_emit(
+            'receive_messages', [_message_data(r) for r in records], rooms
+        )
+    compact = [compact_room(room) for room in rooms]
+    if any(_has_audience(room) for room in compact):
+        await _rooms_emit('receive_messages', encode_messages(
+            records, config.SOCKET_COMPACT_DEFLATE_MIN_BYTES
+        ), compact)
+
+
+@on_membership_changed
+async def _notify_members(user_ids: list[uuid.UUID], chat_id: uuid.UUID) -> None:
+    """Новый приватный чат или вступление в публичный: все соединения
+    пользователя узнают об этом и начинают получать его сообщения"""
+    await _rooms_emit('membership_changed', {"chat_id": str(chat_id)}, [
+        room for user_id in user_ids
+        for room in _member_rooms(user_room(user_id))
+    ])
+
+
+room_batcher = RoomBatcher(
+    _emit_batch,
+    window=config.SOCKET_BATCH_WINDOW_MS / 1000,
+    max_items=config.SOCKET_BATCH_MAX_ITEMS,
+)
+
+
+def _parse_history_request(data) -> dict:
+    # Старые клиенты присылают только id комнаты
+    if isinstance(data, str):
+        data = {"room": data}
+    if not isinstance(data, dict):
+        raise TypeError("History request must be an object")
+    cursors = {
+        key: uuid.UUID(str(data[key])) if data.get(key) else None
+        for key in ("before", "after")
+    }
+    return {
+        "room": uuid.UUID(str(data["room"])),
+        "limit": int(data.get("limit") or 0),
+        "stream": bool(data.get("stream")),
+        **cursors,
+    }
+
+
+@sio.event
+@rate_limited('message_history')
+@metrics.timed(metrics.socket_event_duration)
+async def message_history(sid, data):
+    try:
+        request = _parse_history_request(data)
+    except (KeyError, TypeError, ValueError):
+        await sio.emit(
+            'error', to=sid, data={"message": "Invalid history request"}
         )
-        if isinstance(messages, SocketPermissionError):
-            # Ошибка если пользователю нельзя читать этот диалог
+        return False
+    room_id = str(request["room"])
+    if request["stream"] and (request["before"] or request["limit"]):
+        # Поток отдает всю историю после after, страница ему не нужна
+        await sio.emit('error', to=sid, data={
+            "room_id": room_id,
+            "message": "Streamed history accepts only after",
+        })
+        return False
+
+    if not await authorize_room(sid, presence[sid], request["room"]):
+        # Ошибка если пользователю нельзя читать этот диалог
+        await sio.emit(
+            'error', to=sid,
+            data={"room_id": room_id, "message": "Access denied"},
+        )
+        return False
+
+    async with SessionFactory() as db:
+        if request["stream"]:
+            return await _stream_message_history(sid, db, request)
+
+        # Получаем страницу истории сообщений
+        try:
+            page = await get_messages_page(
+                db, request["room"],
+                before=request["before"], after=request["after"],
+                limit=get_history_limit(request["limit"]),
+            )
+        except MessageCursorError:
             await sio.emit(
                 'error', to=sid,
-                data={"room_id": room_id, "message": "Access denied"},
+                data={"room_id": room_id, "message": "Unknown cursor"},
             )
-            return
-        serialized_mgs = [await message.to_dict(db) for message in messages]
+            return False
+        serialized_mgs = await _serialize_history(sid, db, page.messages)
     await sio.emit('message_history', data=serialized_mgs, to=sid)
+    return {
+        "room_id": room_id,
+        "count": len(page.messages),
+        "has_more": page.has_more,
+    }
+
+
+async def _serialize_history(sid, db, messages: list[MessageRow]):
+    session = await sio.get_session(sid)
+    if not session["compact"]:
+        return await Message.bulk_to_dict(db, messages)
+
+    emails = await Message.author_emails(db, messages)
+    return encode_messages(
+        (
+            MessageRecord(
+                message.id, message.conversation_id, message.user_id,
+                emails.get(message.user_id), message.content,
+                message.timestamp,
+            )
+            for message in messages
+        ),
+        config.SOCKET_COMPACT_DEFLATE_MIN_BYTES,
+    )
+
+
+async def _stream_message_history(sid, db, request):
+    """Отправляет историю пачками message_history, не собирая ее целиком"""
+    room_id = str(request["room"])
+    count = 0
+    try:
+        async for chunk in stream_message_history(
+            db, request["room"], after=request["after"]
+        ):
+            serialized_mgs = await _serialize_history(sid, db, chunk)
+            await sio.emit('message_history', data=serialized_mgs, to=sid)
+            count += len(chunk)
+    except MessageCursorError:
+        await sio.emit(
+            'error', to=sid,
+            data={"room_id": room_id, "message": "Unknown cursor"},
+        )
+        return False
+    return {"room_id": room_id, "count": count, "has_more": False}
 
 
 @sio.event
+@metrics.timed(metrics.socket_event_duration)
 async def disconnect(sid):
-    if sid in connected_users:
-        del connected_users[sid]
+    for room in presence.rooms(sid):
+        await _leave_presence(sid, room)
+    await presence.disconnect(sid)
+    room_permissions.disconnect(sid)
+    rate_limits.disconnect(sid)
     logger.info("User disconnected: %(sid)s" % {"sid": sid})
@@ -1,42 +1,78 @@
-from typing import List
 from uuid import UUID
 
 from src.chats import models
+from src.core import config
+from src.database.database import SessionFactory
 from src.socket_server import crud
 from src.socket_server.exceptions import SocketPermissionError
+from src.socket_server.permissions import (
+    get_cached_dialog_info,
+    room_permissions,
+)
 
 
 async def check_dialog_permission(
-    db, dialog: crud.Dialog | None, user: models.User
+    db, dialog: crud.DialogInfo | None, user: models.User
 ) -> bool:
     if dialog is None:
         return False
 
-    if isinstance(dialog, models.PublicChat):
+    if dialog.is_group:
         return True
 
-    return await crud.has_private_chat_permission(db, dialog.id, user.id)
+    return await crud.has_private_chat_permission(db, dialog.chat_id, user.id)
 
 
 async def get_message_history(
-    db, user: models.User, conversation_id: UUID
-) -> List[models.Message] | SocketPermissionError:
-
-    data = await crud.get_dialog_by_conversation_id(db, conversation_id)
+    db, user: models.User, conversation_id: UUID,
+    before: UUID | None = None, after: UUID | None = None,
+    limit: int | None = None,
+) -> crud.MessagePage | SocketPermissionError:
 
-    if not await check_dialog_permission(db, data, user):
+    if not await have_enter_room_permission(db, user, conversation_id):
         return SocketPermissionError("You are not a member of this chat room")
-    return await crud.get_conversation_messages(db, conversation_id)
+    return await get_messages_page(
+        db, conversation_id, before=before, after=after, limit=limit
+    )
+
+
+async def get_messages_page(
+    db, conversation_id: UUID,
+    before: UUID | None = None, after: UUID | None = None,
+    limit: int | None = None,
+) -> crud.MessagePage:
+    return await crud.get_conversation_messages(
+        db, conversation_id, before=before, after=after, limit=limit
+    )
+
+
+def stream_message_history(db, conversation_id: UUID, after: UUID | None = None):
+    return crud.stream_conversation_messages(
+        db, conversation_id, after=after,
+        chunk_size=config.MESSAGE_HISTORY_CHUNK_SIZE,
+    )
+
+
+def get_history_limit(limit: int | None) -> int:
+    if not limit or limit < 1:
+        return config.MESSAGE_HISTORY_PAGE_SIZE
+    return min(limit, config.MESSAGE_HISTORY_MAX_PAGE_SIZE)
 
 
 async def have_enter_room_permission(
     db, user: models.User, conversation_id: UUID
 ) -> bool:
-    dialog = await crud.get_dialog_by_conversation_id(db, conversation_id)
+    dialog = await get_cached_dialog_info(db, conversation_id)
     return await check_dialog_permission(db, dialog, user)
 
 
-async def save_user_message(
-    db, user: models.User, message: str, conversation_id: UUID
-) -> None:
-    await crud.create_message(db, user, message, conversation_id)
+async def authorize_room(sid: str, user: models.User, conversation_id: UUID) -> bool:
+    """Проверяет доступ соединения к диалогу, запоминая успешные проверки"""
+    if room_permissions.allowed(sid, conversation_id):
+        return True
+
+    async with SessionFactory() as db:
+        if not await have_enter_room_permission(db, user, conversation_id):
+            return False
+    room_permissions.grant(sid, conversation_id)
+    return True
@@ -0,0 +1,122 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+from src.core import config
+from src.core.logging import logger
+from src.database.database import SessionFactory
+from src.socket_server import crud
+
+
+class MessageWriter:
+    """Пишет сообщения в БД пачками в фоновой задаче.
+
+    Сообщения копятся в очереди, пока не наберется max_batch_size штук
+    или не пройдет max_linger секунд с первого сообщения пачки. Каждая
+    пачка сохраняется одним INSERT в одной транзакции.
+    """
+
+    def __init__(
+        self, session_factory,
+        max_batch_size: int, max_linger: float, max_queue_size: int = 0,
+    ):
+        self.session_factory = session_factory
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue_size)
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все принятые сообщения и останавливает задачу"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def enqueue(
+        self, user_id: uuid.UUID, content: str, conversation_id: uuid.UUID
+    ) -> tuple[dict, asyncio.Future]:
+        """Ставит сообщение в очередь.
+
+        Возвращает строку сообщения и future, которая завершится после
+        коммита пачки с этим сообщением.
+        """
+        self.start()
+        row = {
+            "id": uuid.uuid4(),
+            "content": content,
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+        }
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return row, future
+
+    async def write(
+        self, user_id: uuid.UUID, content: str, conversation_id: uuid.UUID
+    ) -> dict:
+        """Ставит сообщение в очередь и ждет его записи в БД"""
+        row, future = await self.enqueue(user_id, content, conversation_id)
+        await future
+        return row
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_linger
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(
+                            self._queue.get(), timeout
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write_batch(batch)
+
+    async def _write_batch(self, batch: list) -> None:
+        try:
+            async with self.session_factory() as db:
+                await crud.create_messages(db, [row for row, _ in batch])
+        except Exception as ex:
+            logger.exception(f"Failed to save {len(batch)} messages")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ex)
+            return
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+message_writer = MessageWriter(
+    SessionFactory,
+    max_batch_size=config.MESSAGE_WRITER_BATCH_SIZE,
+    max_linger=config.MESSAGE_WRITER_LINGER_MS / 1000,
+    max_queue_size=config.MESSAGE_WRITER_QUEUE_SIZE,
+)